@@ -0,0 +1,77 @@
+"""
+Time the MergeOptimizer on large synthetic graphs.
+
+Two kinds of graphs are built:
+
+* wide: many elemwise nodes using the same input, half of them duplicates.
+  Before merge candidates were indexed, each node was compared to all the
+  other clients of its first input, which is quadratic in the width.
+* deep: many independent chains, each one duplicated.
+
+For each graph, the first merge pass and a second pass on the already
+merged graph are timed. The second pass should take almost no time, as
+only the nodes changed since the last pass are considered.
+
+Usage: python merge_large_graph.py [size ...]
+"""
+from __future__ import print_function
+import sys
+import time
+
+import theano
+from theano import tensor as T
+from theano.gof import FunctionGraph
+from theano.gof.opt import MergeOptimizer
+
+
+def wide_graph(n):
+    x = T.vector('x')
+    outputs = []
+    for i in range(n // 2):
+        c = T.constant(float(i))
+        outputs.append(x + c)
+        outputs.append(x + c)
+    return [x], outputs
+
+
+def deep_graph(n, depth=10):
+    x = T.vector('x')
+    outputs = []
+    for i in range(n // (2 * depth)):
+        for _ in range(2):
+            y = x
+            for j in range(depth):
+                y = T.exp(y * (i + j))
+            outputs.append(y)
+    return [x], outputs
+
+
+def time_merge(inputs, outputs):
+    fgraph = FunctionGraph(inputs, outputs, clone=False)
+    nb_nodes = len(fgraph.apply_nodes)
+    opt = MergeOptimizer()
+    t0 = time.time()
+    opt.optimize(fgraph)
+    t1 = time.time()
+    opt.optimize(fgraph)
+    t2 = time.time()
+    return nb_nodes, len(fgraph.apply_nodes), t1 - t0, t2 - t1
+
+
+def main(sizes):
+    print("%-6s %8s %8s %10s %10s" % ("graph", "nodes", "merged",
+                                      "pass 1 (s)", "pass 2 (s)"))
+    for n in sizes:
+        for name, build in [('wide', wide_graph), ('deep', deep_graph)]:
+            before, after, t_first, t_second = time_merge(*build(n))
+            print("%-6s %8d %8d %10.3f %10.3f" % (
+                name, before, before - after, t_first, t_second))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sizes = [int(a) for a in sys.argv[1:]]
+    else:
+        sizes = [1000, 10000, 40000]
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    main(sizes)
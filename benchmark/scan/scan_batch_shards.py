@@ -0,0 +1,77 @@
+"""
+Time a recurrent scan with and without splitting its batch into shards.
+
+Each step multiplies the input and the previous hidden state by large
+weight matrices, so most of the time is spent in the BLAS calls of Gemm
+and Dot22, which release the GIL. With n shards, the loops over the shards
+run in n threads, and the time should go down until the number of cores,
+as long as BLAS itself is configured to use one thread (e.g. with
+OMP_NUM_THREADS=1 or OPENBLAS_NUM_THREADS=1).
+
+Usage: python scan_batch_shards.py [n_steps [batch_size [n_hidden]]]
+"""
+from __future__ import print_function
+import sys
+import time
+
+import numpy
+
+import theano
+from theano import tensor as T
+
+
+def rnn(n_hidden, batch_shards):
+    x = T.tensor3('x')
+    h0 = T.matrix('h0')
+    rng = numpy.random.RandomState(1234)
+    W = theano.shared(
+        rng.uniform(-0.1, 0.1, (n_hidden, n_hidden)).astype(
+            theano.config.floatX), name='W')
+    U = theano.shared(
+        rng.uniform(-0.1, 0.1, (n_hidden, n_hidden)).astype(
+            theano.config.floatX), name='U')
+
+    def step(x_t, h_tm1, W, U):
+        return T.tanh(T.dot(x_t, W) + T.dot(h_tm1, U))
+
+    h, _ = theano.scan(step, sequences=x, outputs_info=h0,
+                       non_sequences=[W, U], batch_shards=batch_shards)
+    return theano.function([x, h0], h)
+
+
+def time_function(f, args, repeat=5):
+    f(*args)
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.time()
+        f(*args)
+        best = min(best, time.time() - t0)
+    return best
+
+
+def main(n_steps, batch_size, n_hidden):
+    floatX = theano.config.floatX
+    rng = numpy.random.RandomState(42)
+    args = [rng.uniform(size=(n_steps, batch_size, n_hidden)).astype(floatX),
+            numpy.zeros((batch_size, n_hidden), dtype=floatX)]
+
+    print("n_steps=%d batch_size=%d n_hidden=%d" % (n_steps, batch_size,
+                                                    n_hidden))
+    print("%-7s %10s %8s" % ("shards", "time (s)", "speedup"))
+    reference = None
+    expected = None
+    for batch_shards in [1, 2, 4, 8]:
+        f = rnn(n_hidden, batch_shards)
+        t = time_function(f, args)
+        if reference is None:
+            reference = t
+            expected = f(*args)
+        else:
+            assert numpy.allclose(f(*args), expected, atol=1e-5)
+        print("%-7d %10.4f %8.2f" % (batch_shards, t, reference / t))
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    defaults = [100, 256, 1024]
+    main(*(args + defaults[len(args):]))
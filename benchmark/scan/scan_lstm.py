@@ -0,0 +1,92 @@
+"""
+Time LSTM-like scans.
+
+Each step computes the four gates of an LSTM from the input and the
+previous hidden state, and updates the cell and hidden states. The scans
+are timed:
+
+* all: the states of all the steps are returned.
+* last: only the last states are returned, so the scan_save_mem
+  optimization keeps a buffer of one state per output.
+* grad: the gradient of the last hidden state with respect to the
+  weights, computed by a second scan going backward.
+
+The inner function computes the new states directly in the output buffers
+of scan when it can. Otherwise, each state is copied there after every
+step, which shows up here for large hidden sizes.
+
+Usage: python scan_lstm.py [n_steps [batch_size [n_hidden]]]
+"""
+from __future__ import print_function
+import sys
+import time
+
+import numpy
+
+import theano
+from theano import tensor as T
+
+
+def lstm(n_hidden):
+    x = T.tensor3('x')
+    h0 = T.matrix('h0')
+    c0 = T.matrix('c0')
+    rng = numpy.random.RandomState(1234)
+    W = theano.shared(
+        rng.uniform(-0.1, 0.1, (n_hidden, 4 * n_hidden)).astype(
+            theano.config.floatX), name='W')
+    U = theano.shared(
+        rng.uniform(-0.1, 0.1, (n_hidden, 4 * n_hidden)).astype(
+            theano.config.floatX), name='U')
+
+    def step(x_t, h_tm1, c_tm1, W, U):
+        gates = T.dot(x_t, W) + T.dot(h_tm1, U)
+        i = T.nnet.sigmoid(gates[:, :n_hidden])
+        f = T.nnet.sigmoid(gates[:, n_hidden:2 * n_hidden])
+        o = T.nnet.sigmoid(gates[:, 2 * n_hidden:3 * n_hidden])
+        g = T.tanh(gates[:, 3 * n_hidden:])
+        c_t = f * c_tm1 + i * g
+        h_t = o * T.tanh(c_t)
+        return h_t, c_t
+
+    (h, c), _ = theano.scan(step, sequences=x, outputs_info=[h0, c0],
+                            non_sequences=[W, U])
+    return [x, h0, c0], h, c, [W, U]
+
+
+def time_function(f, args, repeat=5):
+    f(*args)
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.time()
+        f(*args)
+        best = min(best, time.time() - t0)
+    return best
+
+
+def main(n_steps, batch_size, n_hidden):
+    inputs, h, c, params = lstm(n_hidden)
+    functions = [
+        ('all', theano.function(inputs, [h, c])),
+        ('last', theano.function(inputs, [h[-1], c[-1]])),
+        ('grad', theano.function(inputs, T.grad(h[-1].sum(), params))),
+    ]
+
+    floatX = theano.config.floatX
+    rng = numpy.random.RandomState(42)
+    args = [rng.uniform(size=(n_steps, batch_size, n_hidden)).astype(floatX),
+            numpy.zeros((batch_size, n_hidden), dtype=floatX),
+            numpy.zeros((batch_size, n_hidden), dtype=floatX)]
+
+    print("n_steps=%d batch_size=%d n_hidden=%d" % (n_steps, batch_size,
+                                                    n_hidden))
+    print("%-6s %10s %12s" % ("scan", "total (s)", "per step (us)"))
+    for name, f in functions:
+        t = time_function(f, args)
+        print("%-6s %10.4f %12.1f" % (name, t, t / n_steps * 1e6))
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    defaults = [200, 32, 256]
+    main(*(args + defaults[len(args):]))
@@ -20,6 +20,8 @@ from theano.compile.profiling import ProfileStats, ScanProfileStats
 
 from theano.compile.profilemode import ProfileMode
 
+from theano.compile.timeline import Timeline
+
 from theano.compile.sharedvalue import (shared, shared_constructor,
                                         SharedVariable)
 from theano.compile.pfunc import pfunc, Param, rebuild_collect_shared
@@ -5,6 +5,9 @@ Driver of graph construction, optimization, and linking.
 from __future__ import print_function
 
 import copy
+import gc
+import os
+import tempfile
 from six import string_types, iteritems, iterkeys
 from six.moves import xrange
 import six.moves.copyreg as copyreg
@@ -23,7 +26,6 @@ import theano.compile.mode
 from theano.compile.io import (
     In, SymbolicInput, SymbolicInputKit, SymbolicOutput)
 from theano.compile.ops import deep_copy_op, view_op
-from theano.gof.graph import is_same_graph
 from theano.gof.op import ops_with_inner_function
 
 import logging
@@ -206,6 +208,20 @@ class AliasedMemoryError(Exception):
 DUPLICATE = ['DUPLICATE']
 
 
+def _stack_outputs(values):
+    """
+    Stack the values of an output over several calls along a new first
+    dimension, if they are ndarrays of the same shape.
+
+    Otherwise return them as a list.
+
+    """
+    if (values and all(isinstance(v, numpy.ndarray) for v in values) and
+            len(set(v.shape for v in values)) == 1):
+        return numpy.asarray(values)
+    return list(values)
+
+
 class Function(object):
     """
     Type of the functions returned by theano.function or
@@ -239,6 +255,12 @@ class Function(object):
     numpy tensor.  C code should raise an error if you pass an object
     of the wrong type.
 
+    A Function instance also has a ``fast_call`` attribute, a callable
+    taking the same positional arguments and returning the same outputs,
+    with less overhead for small functions called many times (see
+    `Function._make_fast_call`), and a ``call_many`` method to call the
+    function on many tuples of arguments at once.
+
     Attributes
     ----------
     finder
@@ -526,6 +548,300 @@ class Function(object):
             if node.op in ops_with_inner_function:
                 self.nodes_with_inner_function.append(node.op)
 
+        # Storage of the required inputs, cleared after each call. When the
+        # VM supports it (CVM), it clears them and the outputs itself.
+        self._required_storage = [c.storage for c in self.input_storage
+                                  if c.required]
+        self._fn_clears_storage = getattr(self.fn, 'clears_storage', False)
+
+        self.fast_call = self._make_fast_call()
+
+    def _make_fast_call(self):
+        """
+        Return a callable doing the same as `__call__` with less overhead.
+
+        The work that does not depend on the arguments is done here: which
+        storage gets each argument, which inputs get an update or a default
+        value back after the call, and how the outputs are returned. When
+        called, a TensorType argument that is already an aligned ndarray of
+        the right dtype, number of dimensions and broadcastable pattern is
+        put directly in the storage, instead of calling the type's filter.
+
+        The returned callable only takes positional arguments, one for each
+        input that is not implicit. Otherwise, or if an argument needs to be
+        filtered, or if the function is profiled, it calls `__call__`.
+        It does not check for aliased inputs, so it calls `__call__` if the
+        function has mutable inputs that are not implicit, or if an
+        argument may share memory with an implicit mutable input (e.g. a
+        shared variable with an update). It does not update the time
+        counters of the mode.
+
+        """
+        TensorType = theano.tensor.TensorType
+        ndarray = numpy.ndarray
+        call = self.__call__
+        fn = self.fn
+        input_storage = self.input_storage
+        output_storage = self.output_storage
+
+        arg_containers = self._positional_containers()
+        if arg_containers is None:
+            return call
+        n_args = len(arg_containers)
+
+        # For each argument, its storage and what the value must match to
+        # skip the filter: (dtype number, ndim, broadcastable dimensions), or
+        # None to always filter. Like the C code, we compare the dtype
+        # numbers, as some different numbers have equal dtypes (e.g. int64
+        # and longlong).
+        arg_info = []
+        for c in arg_containers:
+            t = c.type
+            if isinstance(t, TensorType):
+                bcast = tuple(i for i, b in enumerate(t.broadcastable) if b)
+                arg_info.append((c.storage, c,
+                                 (numpy.dtype(t.dtype).num, t.ndim, bcast)))
+            else:
+                arg_info.append((c.storage, c, None))
+        # The storage of the implicit mutable inputs, that arguments must
+        # not alias.
+        mutable_storage = self._mutable_storage()
+        may_share_memory = numpy.may_share_memory
+
+        required_storage = self._required_storage
+        clears_storage = self._fn_clears_storage
+        gc_storage = [c.storage for c, v in zip(output_storage,
+                                                self.maker.fgraph.outputs)
+                      if v.owner is not None]
+        need_update_inputs = getattr(fn, 'need_update_inputs', True)
+        update_storage = [c for i, c in zip(self.maker.expanded_inputs,
+                                            input_storage)
+                          if i.update is not None]
+        n_returned = self.n_returned_outputs
+        refeed = [(input_storage[i].storage, value)
+                  for i, (required, refeed, value) in enumerate(self.defaults)
+                  if refeed]
+        return_none = self.return_none
+        unpack_single = self.unpack_single
+        output_keys = self.output_keys
+
+        def fast_call(*args):
+            if len(args) != n_args or self.profile or self.trust_input:
+                return call(*args)
+            for arg, (storage, c, info) in zip(args, arg_info):
+                if (info is None or type(arg) is not ndarray or
+                        arg.dtype.num != info[0] or
+                        not arg.dtype.isnative or arg.ndim != info[1] or
+                        not arg.flags.aligned or
+                        any(arg.shape[i] != 1 for i in info[2])):
+                    return call(*args)
+                for mutable in mutable_storage:
+                    if (type(mutable[0]) is ndarray and
+                            may_share_memory(arg, mutable[0])):
+                        return call(*args)
+                storage[0] = arg
+
+            try:
+                if clears_storage:
+                    outputs = fn(post_call_clear=required_storage,
+                                 clear_outputs=1)
+                else:
+                    outputs = fn()
+            except Exception:
+                self._raise_fn_error()
+            if outputs is None:
+                outputs = [c.storage[0] for c in output_storage]
+
+            if not clears_storage:
+                for storage in required_storage:
+                    storage[0] = None
+                if getattr(fn, 'allow_gc', False):
+                    for storage in gc_storage:
+                        storage[0] = None
+            if need_update_inputs:
+                for c, value in zip(update_storage, outputs[n_returned:]):
+                    c.data = value
+            outputs = outputs[:n_returned]
+            for storage, value in refeed:
+                if isinstance(value, gof.Container):
+                    value = value.storage[0]
+                storage[0] = value
+
+            if return_none:
+                return None
+            elif unpack_single and len(outputs) == 1:
+                return outputs[0]
+            elif output_keys is not None:
+                return dict(izip(output_keys, outputs))
+            return outputs
+
+        return fast_call
+
+    def _positional_containers(self):
+        """
+        Return the containers of the inputs given positionally.
+
+        Return None if the checks done by `__call__` can not be skipped:
+        if some inputs that are not implicit can only be given by keyword,
+        if some of them are mutable (they need the alias check) or if some
+        inputs are SymbolicInputKits.
+
+        """
+        input_storage = self.input_storage
+        n_args = 0
+        for c in input_storage:
+            if c.implicit:
+                break
+            n_args += 1
+        if (any(not c.implicit for c in input_storage[n_args:]) or
+                any(i.mutable for i in self.maker.inputs[:n_args]) or
+                self.maker.inputs != self.maker.expanded_inputs):
+            return None
+        return input_storage[:n_args]
+
+    def _mutable_storage(self):
+        """
+        Return the storage of the implicit inputs that are mutable.
+
+        """
+        return [c.storage for c, i in zip(self.input_storage,
+                                          self.maker.inputs)
+                if c.implicit and i.mutable]
+
+    def call_many(self, args_list):
+        """
+        Call the function on each tuple of arguments in `args_list`.
+
+        When the function uses the C implementation of the VM (the default
+        'cvm' linker), all the arguments are filtered first, then all the
+        calls are done in one C loop, without going back to Python between
+        calls. Otherwise, or if the arguments can not all be given
+        positionally, or if some outputs are borrowed, or if an argument
+        may share memory with an implicit mutable input, the calls are done
+        one after the other with `fast_call`.
+
+        Parameters
+        ----------
+        args_list
+            An iterable of tuples of positional arguments, as they would be
+            given to `__call__`.
+
+        Returns
+        -------
+        The outputs, as `__call__` returns them, but where each output is
+        the stack of its values for all the calls along a new first
+        dimension. An output that is not an ndarray of the same shape in all
+        the calls is returned as the list of its values.
+
+        """
+        args_list = [tuple(args) for args in args_list]
+        fn = self.fn
+        n_returned = self.n_returned_outputs
+        containers = self._positional_containers()
+
+        use_c_loop = (
+            args_list and containers is not None and
+            hasattr(fn, 'call_batch') and not self.profile and
+            not any(o.borrow for o in self.maker.outputs) and
+            all(len(args) == len(containers) and
+                all(arg is not None for arg in args)
+                for args in args_list))
+        if use_c_loop:
+            batch = []
+            for call_i, args in enumerate(args_list):
+                values = []
+                for i, (c, arg) in enumerate(zip(containers, args)):
+                    try:
+                        values.append(c.type.filter(
+                            arg, strict=c.strict,
+                            allow_downcast=c.allow_downcast))
+                    except Exception as e:
+                        function_name = "theano function"
+                        if self.name:
+                            function_name += ' with name "' + self.name + '" '
+                        e.args = ("Bad input argument to " + function_name +
+                                  " at index %d(0-based) of call %d" %
+                                  (i, call_i),) + e.args
+                        raise
+                batch.append(tuple(values))
+            # Arguments aliasing an implicit mutable input need the checks
+            # done by __call__.
+            mutable = [m[0] for m in self._mutable_storage()
+                       if isinstance(m[0], numpy.ndarray)]
+            use_c_loop = not any(
+                isinstance(value, numpy.ndarray) and
+                numpy.may_share_memory(value, m)
+                for values in batch for value in values for m in mutable)
+        if use_c_loop:
+            try:
+                rvals = fn.call_batch(batch, [c.storage for c in containers])
+            except Exception:
+                self._raise_fn_error()
+            finally:
+                for c in self.input_storage:
+                    if c.required:
+                        c.storage[0] = None
+            if getattr(fn, 'allow_gc', False):
+                for o_container, o_variable in zip(self.output_storage,
+                                                   self.maker.fgraph.outputs):
+                    if o_variable.owner is not None:
+                        o_container.storage[0] = None
+            for i, (required, refeed, value) in enumerate(self.defaults):
+                if refeed:
+                    if isinstance(value, gof.Container):
+                        value = value.storage[0]
+                    self[i] = value
+            rvals = [outputs[:n_returned] for outputs in rvals]
+        else:
+            rvals = []
+            for args in args_list:
+                outputs = self.fast_call(*args)
+                if self.return_none:
+                    outputs = []
+                elif self.unpack_single and n_returned == 1:
+                    outputs = [outputs]
+                elif self.output_keys is not None:
+                    outputs = [outputs[k] for k in self.output_keys]
+                rvals.append([copy.copy(o) if out.borrow else o
+                              for o, out in zip(outputs, self.maker.outputs)])
+
+        outputs = [_stack_outputs([r[i] for r in rvals])
+                   for i in xrange(n_returned)]
+        if self.return_none:
+            return None
+        elif self.unpack_single and len(outputs) == 1:
+            return outputs[0]
+        elif self.output_keys is not None:
+            return dict(izip(self.output_keys, outputs))
+        return outputs
+
+    def _raise_fn_error(self):
+        """
+        Re-raise the exception raised by self.fn with information about
+        the node that failed.
+
+        """
+        if hasattr(self.fn, 'position_of_error'):
+            # this is a new vm-provided function or c linker
+            # they need this because the exception manipulation
+            # done by raise_with_op is not implemented in C.
+            if hasattr(self.fn, 'thunks'):
+                # For the CVM
+                gof.link.raise_with_op(
+                    self.fn.nodes[self.fn.position_of_error],
+                    self.fn.thunks[self.fn.position_of_error],
+                    storage_map=self.fn.storage_map)
+            else:
+                # For the c linker We don't have access from
+                # python to all the temps values So for now, we
+                # just don't print the extra shapes/strides info
+                gof.link.raise_with_op(
+                    self.fn.nodes[self.fn.position_of_error],
+                    storage_map=self.fn.storage_map)
+        else:
+            # old-style linkers raise their own exceptions
+            raise
+
     def __contains__(self, item):
         return self.value.__contains__(item)
 
@@ -834,31 +1150,26 @@ class Function(object):
                         % getattr(self.inv_finder[c], 'variable',
                                   self.inv_finder[c]))
 
+        # When sampling, only time the thunks of some calls.
+        sampled = True
+        if profile and profile.sample_every > 1:
+            sampled = profile.sample_call()
+            if sampled and hasattr(self.fn, 'clear_profile'):
+                # Drop what VMs timing every call recorded since the
+                # last sampled call.
+                self.fn.clear_profile()
+            self.fn.time_thunks = sampled and profile.flag_time_thunks
+
         # Do the actual work
         t0_fn = time.time()
         try:
-            outputs = self.fn()
-        except Exception:
-            if hasattr(self.fn, 'position_of_error'):
-                # this is a new vm-provided function or c linker
-                # they need this because the exception manipulation
-                # done by raise_with_op is not implemented in C.
-                if hasattr(self.fn, 'thunks'):
-                    # For the CVM
-                    gof.link.raise_with_op(
-                        self.fn.nodes[self.fn.position_of_error],
-                        self.fn.thunks[self.fn.position_of_error],
-                        storage_map=self.fn.storage_map)
-                else:
-                    # For the c linker We don't have access from
-                    # python to all the temps values So for now, we
-                    # just don't print the extra shapes/strides info
-                    gof.link.raise_with_op(
-                        self.fn.nodes[self.fn.position_of_error],
-                        storage_map=self.fn.storage_map)
+            if self._fn_clears_storage:
+                outputs = self.fn(post_call_clear=self._required_storage,
+                                  clear_outputs=1)
             else:
-                # old-style linkers raise their own exceptions
-                raise
+                outputs = self.fn()
+        except Exception:
+            self._raise_fn_error()
 
         dt_fn = time.time() - t0_fn
         self.maker.mode.fn_time += dt_fn
@@ -872,13 +1183,14 @@ class Function(object):
 
         # Remove internal references to required inputs.
         # These cannot be re-used anyway.
-        for c in self.input_storage:
-            if c.required:
-                c.storage[0] = None
+        if not self._fn_clears_storage:
+            for storage in self._required_storage:
+                storage[0] = None
 
         # if we are allowing garbage collection, remove the
         # output reference from the internal storage cells
-        if getattr(self.fn, 'allow_gc', False):
+        if (not self._fn_clears_storage and
+                getattr(self.fn, 'allow_gc', False)):
             assert len(self.output_storage) == len(self.maker.fgraph.outputs)
             for o_container, o_variable in zip(self.output_storage,
                                                self.maker.fgraph.outputs):
@@ -913,8 +1225,11 @@ class Function(object):
         if profile:
             profile.fct_callcount += 1
             profile.fct_call_time += dt_call
-            if hasattr(self.fn, 'update_profile'):
-                self.fn.update_profile(profile)
+            if sampled:
+                profile.sampled_callcount += 1
+                if hasattr(self.fn, 'update_profile'):
+                    self.fn.update_profile(profile,
+                                           scale=profile.sample_every)
 
         if self.return_none:
             return None
@@ -955,6 +1270,30 @@ class Function(object):
                 ops_with_inner_function[node.op].free()
 
 
+def freeze_for_fork():
+    """
+    Prepare this process to be forked once its functions are compiled.
+
+    The module cache is frozen (see `ModuleCache.freeze`), so the forked
+    processes run the functions compiled before the fork without reading
+    the cache directory or taking the compilation lock, even at exit.
+
+    The objects alive are also moved out of the reach of the garbage
+    collector with `gc.freeze` (Python >= 3.7). The collections in the
+    forked processes then do not write to, and copy, the memory pages they
+    share with this process.
+
+    Call it right before forking the workers.
+
+    """
+    cache = gof.cmodule._module_cache
+    if cache is not None:
+        cache.freeze()
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
 # pickling/deepcopy support for Function
 
 def _pickle_Function(f):
@@ -1106,6 +1445,90 @@ def insert_deepcopy(fgraph, wrapped_inputs, wrapped_outputs):
 
 NODEFAULT = ['NODEFAULT']
 
+# Increase this when the format of the optimized graph cache entries, or the
+# way their key is computed, changes.
+OPTIMIZED_GRAPH_CACHE_VERSION = 2
+
+
+def _optimizer_description(optimizer):
+    """
+    Return a description of `optimizer` that does not depend on the process.
+
+    Only optimizers given by name or by Query are described: the others
+    could be parametrized in ways their class does not show, so they raise
+    a TypeError and the graphs they optimize are not cached.
+
+    """
+    if optimizer is None or isinstance(optimizer, string_types):
+        return optimizer
+    if isinstance(optimizer, gof.Query):
+        return ('Query',
+                sorted(optimizer.include),
+                sorted(optimizer.require),
+                sorted(optimizer.exclude),
+                sorted((name, _optimizer_description(query))
+                       for name, query in iteritems(optimizer.subquery)),
+                optimizer.position_cutoff)
+    raise TypeError('No deterministic description of the optimizer',
+                    optimizer)
+
+
+def optimized_graph_key(fgraph, input_specs, mode):
+    """
+    Return a key identifying the optimization of `fgraph` by `mode`.
+
+    The key is a hash of a canonical description of the graph: the type and
+    mutability of its inputs, the op of each node (in topological order),
+    the way variables are connected, the constants' values and the outputs.
+    Variable names are not part of it, so two graphs that only differ by
+    their names share the same key. The optimizer of `mode`, the Theano
+    version and all config options are also part of the key.
+
+    Parameters
+    ----------
+    fgraph : FunctionGraph
+        The graph, before optimization.
+    input_specs : list of SymbolicInput
+        The inputs of `fgraph`, in the same order as `fgraph.inputs`.
+    mode : Mode
+        The mode whose optimizer will be used.
+
+    Notes
+    -----
+    This raises an exception if some part of the graph can not be pickled.
+
+    """
+    assert len(input_specs) == len(fgraph.inputs)
+    position = {}
+    signature = []
+    for i, (spec, var) in enumerate(zip(input_specs, fgraph.inputs)):
+        position[var] = ('i', i)
+        signature.append((var.type, bool(spec.mutable)))
+
+    def ref(var):
+        if var in position:
+            return position[var]
+        assert isinstance(var, gof.Constant), var
+        return ('c', var.type, var.data)
+
+    nodes = gof.graph.io_toposort(fgraph.inputs, fgraph.outputs)
+    for node_idx, node in enumerate(nodes):
+        if hasattr(node.op, '__props__'):
+            op_sig = (type(node.op), node.op._props())
+        else:
+            op_sig = node.op
+        signature.append((op_sig,
+                          [ref(var) for var in node.inputs],
+                          [var.type for var in node.outputs]))
+        for out_idx, var in enumerate(node.outputs):
+            position[var] = ('n', node_idx, out_idx)
+    signature.append([ref(var) for var in fgraph.outputs])
+    signature.append((OPTIMIZED_GRAPH_CACHE_VERSION,
+                      theano.__version__,
+                      _optimizer_description(mode.provided_optimizer),
+                      theano.configparser.get_config_md5(in_c_key_only=False)))
+    return gof.utils.hash_from_code(pickle.dumps(signature, 2))
+
 
 class FunctionMaker(object):
     """
@@ -1180,176 +1603,102 @@ class FunctionMaker(object):
             raise TypeError("Unknown output type: %s (%s)", type(output),
                             output)
 
-    def optimize_graph_with_cache(self, optimizer, inputs, outputs):
-        # This function is not finished
-        from theano.gof.compilelock import get_lock, release_lock
-        import os.path
-
-        graph_db_file = os.path.join(theano.config.compiledir,
-                                     'optimized_graphs.pkl')
-
-        # the inputs, outputs, and size of the graph to be optimized
-        inputs_new = [inp.variable for inp in inputs]
-        outputs_new = [out.variable for out in outputs]
-        size_new = len(self.fgraph.apply_nodes)
-        get_lock()
-        # Beginning of cache optimizations.
-        # Could be refactored in different functions.
-
-        def load_graph_db():
-            if os.path.isfile(graph_db_file):
-                print('graph_db already exists')
+    def optimize_graph_with_cache(self, optimizer, inputs, mode):
+        """
+        Optimize `self.fgraph`, reusing a previously optimized graph if one
+        is found in the on-disk cache of optimized graphs.
+
+        The cache lives in the 'optimized_graphs' sub-directory of the
+        compiledir. Each entry is a pickled FunctionGraph stored in a file
+        named after `optimized_graph_key`, so looking up a graph does not
+        require loading any other entry, and entries are published with an
+        atomic rename so no lock is needed.
+
+        The inputs of the graph are pickled as their position, so the values
+        of the shared variables are not stored in the entries. On load, they
+        are replaced by clones of the inputs of `self.fgraph`.
+
+        On a cache hit, `self.fgraph` is replaced by the cached graph and
+        None is returned. Otherwise, the graph is optimized in place, stored
+        in the cache and the optimizer profile is returned.
+
+        """
+        try:
+            key = optimized_graph_key(self.fgraph, inputs, mode)
+        except Exception:
+            _logger.debug('Unable to compute the optimization cache key, '
+                          'optimizing without the cache', exc_info=True)
+            return optimizer(self.fgraph)
+
+        cache_dir = os.path.join(theano.config.compiledir, 'optimized_graphs')
+        entry = os.path.join(cache_dir, key + '.pkl')
+
+        if os.path.isfile(entry):
+            try:
+                inputs = [var.clone() for var in self.fgraph.inputs]
+                with open(entry, 'rb') as f:
+                    unpickler = pickle.Unpickler(f)
+                    unpickler.persistent_load = \
+                        lambda pid: inputs[int(pid)]
+                    version, entry_key, fgraph, clients = unpickler.load()
+                if (version != OPTIMIZED_GRAPH_CACHE_VERSION or
+                        entry_key != key or
+                        len(fgraph.inputs) != len(self.fgraph.inputs) or
+                        len(fgraph.outputs) != len(self.fgraph.outputs)):
+                    raise ValueError('Mismatching cache entry', entry)
+            except Exception:
+                _logger.warning('Removing invalid optimized graph cache '
+                                'entry %s', entry, exc_info=True)
+                try:
+                    os.remove(entry)
+                except OSError:
+                    pass
             else:
-                # create graph_db
-                f = open(graph_db_file, 'wb')
-                print('create new graph_db in %s' % graph_db_file)
-                # file needs to be open and closed for every pickle
-                f.close()
-            # load the graph_db dictionary
+                _logger.debug('Optimized graph loaded from %s', entry)
+                # The attributes FunctionGraph sets on its variables were not
+                # pickled with the inputs.
+                for var, var_clients in zip(inputs, clients):
+                    var.fgraph = fgraph
+                    var.clients = var_clients
+                fgraph.profile = self.fgraph.profile
+                self.fgraph = fgraph
+                return None
+
+        optimizer_profile = optimizer(self.fgraph)
+
+        # Write to a temporary file in the same directory and then rename it,
+        # so that other processes never see a partially written entry.
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmp_entry = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            # The profile is specific to this process, do not store it.
+            profile = self.fgraph.profile
+            self.fgraph.profile = None
+            input_idx = dict((id(var), str(i))
+                             for i, var in enumerate(self.fgraph.inputs))
             try:
-                f = open(graph_db_file, 'rb')
-                # Temporary hack to allow
-                # theano.scan_module.tests.test_scan.T_Scan to
-                # finish. Should be changed in definitive version.
-                tmp = theano.config.unpickle_function
-                theano.config.unpickle_function = False
-                graph_db = pickle.load(f)
-
-                # hack end
-                f.close()
-                print('graph_db loaded and it is not empty')
-            except EOFError as e:
-                # the file has nothing in it
-                print(e)
-                print('graph_db loaded and it is empty')
-                graph_db = {}
+                with os.fdopen(fd, 'wb') as f:
+                    pickler = pickle.Pickler(f, -1)
+                    pickler.persistent_id = \
+                        lambda obj: input_idx.get(id(obj))
+                    pickler.dump((OPTIMIZED_GRAPH_CACHE_VERSION, key,
+                                  self.fgraph,
+                                  [var.clients
+                                   for var in self.fgraph.inputs]))
+                os.rename(tmp_entry, entry)
+            except Exception:
+                os.remove(tmp_entry)
+                raise
             finally:
-                theano.config.unpickle_function = tmp
-
-            return graph_db
-
-        def find_same_graph_in_db(graph_db):
-            # If found_graph_in_db is None, then need to optimize.
-            # Otherwise, return the graph found.
-            found_graph_in_db = None
-            # The sole purpose of this loop is to set 'need_optimize' by
-            # going through graph_db, looking for graph that has the same
-            # computation performed.
-            for graph_old, graph_optimized in iteritems(graph_db):
-                inputs_old = graph_old.inputs
-                outputs_old = graph_old.outputs
-                size_old = len(graph_old.apply_nodes)
-                # Some heuristics to check is the same graphs have
-                # already been optimized before.
-                if len(inputs_new) != len(inputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because input size is different')
-                    continue
-                elif len(outputs_new) != len(outputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because output size is different')
-                    continue
-                elif not all(input_new.type == input_old.type
-                             for input_new, input_old in
-                             zip(inputs_new, inputs_old)):
-                    print('need to optimize, because inputs are of different '
-                          'types')
-                    continue
-                elif not all(output_new.type == output_old.type
-                             for output_new, output_old in
-                             zip(outputs_new, outputs_old)):
-                    print('need to optimize, because outputs are of different '
-                          'types')
-                    continue
-                elif not size_old == size_new:
-                    print('need to optimize, because numbers of nodes in graph'
-                          ' are different')
-                    continue
-                else:
-                    flags = []
-                    for i, (output_new, output_old) in enumerate(
-                            zip(outputs_new, outputs_old)):
-                        print('loop through outputs node for both graphs')
-                        graph_old.variables = set(gof.graph.variables(
-                            graph_old.inputs, graph_old.outputs))
-
-                        # using clone allowed to avoid a lot of errors
-                        # deep copy seemed to had.
-                        f2 = graph_old.clone(check_integrity=False)
-                        t1 = output_new
-                        t2 = f2.outputs[i]
-
-                        # Used to remove "already used by another graph error
-                        def removeAllFgraph(remove):
-                            if hasattr(remove, 'fgraph'):
-                                del remove.fgraph
-                            if hasattr(remove, 'owner'):
-                                if remove.owner is None:
-                                    pass
-                                else:
-                                    if hasattr(remove.owner, 'fgraph'):
-                                        del remove.owner.fgraph
-                                    if hasattr(remove.owner, 'inputs'):
-                                        remove.owner.inputs = [removeAllFgraph(
-                                            i) for i in remove.owner.inputs]
-                                        for o in remove.owner.outputs:
-                                            if hasattr(o, 'fgraph'):
-                                                del o.fgraph
-                            return remove
-
-                        t2 = removeAllFgraph(t2)
-
-                        givens = dict(izip(gof.graph.inputs([t1]),
-                                           gof.graph.inputs([t2])))
-
-                        temp = dict(izip(gof.graph.inputs([t1]),
-                                         gof.graph.inputs([t2])))
-
-                        # hack to remove inconstent entry in givens
-                        # seems to work that but source of inconsistency
-                        # could be worth investigating.
-                        for key, value in iteritems(temp):
-                            if key.type != value.type:
-                                del givens[key]
-
-                        flag = is_same_graph(t1, t2, givens=givens)
-
-                        flags.append(flag)
-
-                    is_same = all(flags)
-                    if is_same:
-                        # found the match
-                        print('found a match, no need to optimize')
-                        found_graph_in_db = graph_optimized
-                        break
-            return found_graph_in_db
-
-        graph_db = load_graph_db()
-        print('loaded graph_db from %s, size=%d' % (graph_db_file,
-                                                    len(graph_db)))
-        found_graph = find_same_graph_in_db(graph_db)
-        if found_graph:
-            self.fgraph = found_graph
-            optimizer_profile = None
+                self.fgraph.profile = profile
+        except Exception:
+            # Not all graphs can be pickled. This only means they can not be
+            # cached.
+            _logger.debug('Unable to store the optimized graph in %s',
+                          cache_dir, exc_info=True)
         else:
-            # this is a brand new graph, optimize it, save it to graph_db
-            print('graph not found in graph_db, optimizing the graph')
-            self.fgraph.variables = set(gof.graph.variables(
-                self.fgraph.inputs, self.fgraph.outputs))
-            # check_integrity parameters was added to ignore
-            # "excess cached variables" errors. Works that way
-            # but once again the error couldbe worth
-            # investigating.
-            before_opt = self.fgraph.clone(check_integrity=False)
-            optimizer_profile = optimizer(self.fgraph)
-            graph_db.update({before_opt: self.fgraph})
-            f = open(graph_db_file, 'wb')
-            pickle.dump(graph_db, f, -1)
-            f.close()
-            print('new graph saved into graph_db')
-        release_lock()
+            _logger.debug('Optimized graph saved to %s', entry)
         return optimizer_profile
 
     def __init__(self, inputs, outputs,
@@ -1439,7 +1788,8 @@ class FunctionMaker(object):
                 # now optimize the graph
                 if theano.config.cache_optimizations:
                     optimizer_profile = self.optimize_graph_with_cache(
-                        optimizer, inputs, outputs)
+                        optimizer, inputs, mode)
+                    fgraph = self.fgraph
                 else:
                     optimizer_profile = optimizer(fgraph)
 
@@ -1447,7 +1797,8 @@ class FunctionMaker(object):
                 opt_time = end_optimizer - start_optimizer
                 if profile:
                     profile.optimizer_time += opt_time
-                    if theano.config.profile_optimizer:
+                    if (theano.config.profile_optimizer and
+                            optimizer_profile is not None):
                         profile.optimizer_profile = (optimizer,
                                                      optimizer_profile)
                 _logger.debug('Optimizing took %f seconds', opt_time)
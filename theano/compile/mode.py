@@ -74,7 +74,9 @@ predefined_linkers = {
     'vm': gof.vm.VM_Linker(use_cloop=False),  # Use allow_gc Theano flag
     'cvm': gof.vm.VM_Linker(use_cloop=True),  # Use allow_gc Theano flag
     'vm_nogc': gof.vm.VM_Linker(allow_gc=False, use_cloop=False),
-    'cvm_nogc': gof.vm.VM_Linker(allow_gc=False, use_cloop=True)}
+    'cvm_nogc': gof.vm.VM_Linker(allow_gc=False, use_cloop=True),
+    'vm_background': gof.vm.VM_Linker(use_cloop=False,
+                                      background_c_thunks=True)}
 
 
 def register_linker(name, linker):
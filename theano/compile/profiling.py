@@ -20,6 +20,7 @@ __docformat__ = "restructuredtext en"
 import atexit
 import copy
 import os
+import random
 import sys
 import time
 from collections import defaultdict
@@ -43,6 +44,14 @@ AddConfigVar('profiling.time_thunks',
              BoolParam(True),
              in_c_key=False)
 
+AddConfigVar('profiling.sample_every',
+             "Record the timings of the individual thunks for only one "
+             "call out of that many, chosen at random, and scale them to "
+             "estimate the timings of all calls. This makes the profiler "
+             "cheap enough to be left enabled.",
+             IntParam(1, lambda i: i > 0),
+             in_c_key=False)
+
 AddConfigVar('profiling.n_apply',
              "Number of Apply instances to print by default",
              IntParam(20, lambda i: i > 0),
@@ -110,7 +119,8 @@ def _atexit_print_fn():
         for ps in to_sum[1:]:
             for attr in ["compile_time", "fct_call_time", "fct_callcount",
                          "vm_call_time", "optimizer_time", "linker_time",
-                         "validate_time", "import_time"]:
+                         "validate_time", "import_time",
+                         "sampled_callcount"]:
                 setattr(cum, attr, getattr(cum, attr) + getattr(ps, attr))
 
             # merge dictonary
@@ -121,6 +131,10 @@ def _atexit_print_fn():
                     assert key not in cum_attr
                     cum_attr[key] = val
 
+            if ps.measured_peak_memory > cum.measured_peak_memory:
+                cum.measured_peak_memory = ps.measured_peak_memory
+                cum.measured_peak_node = ps.measured_peak_node
+
             if cum.optimizer_profile and ps.optimizer_profile:
                 merge = cum.optimizer_profile[0].merge_profile(
                     cum.optimizer_profile[1],
@@ -175,6 +189,24 @@ class ProfileStats(object):
     # Total time spent in Function.fn.__call__
     #
 
+    sample_every = 1
+    # The thunks are timed for one call out of sample_every on average,
+    # and their timings are multiplied by sample_every.
+    #
+
+    sampled_callcount = 0
+    # Number of calls to Function.__call__ in which the thunks were timed
+    #
+
+    measured_peak_memory = 0
+    # Largest number of bytes held by the storage of a call, measured by
+    # the VM with profile_memory
+    #
+
+    measured_peak_node = None
+    # The node after which measured_peak_memory was reached
+    #
+
     apply_time = None
     # dict from node -> float runtime
     #
@@ -225,7 +257,8 @@ class ProfileStats(object):
 
     # param is called flag_time_thunks because most other attributes with time
     # in the name are times *of* something, rather than configuration flags.
-    def __init__(self, atexit_print=True, flag_time_thunks=None, **kwargs):
+    def __init__(self, atexit_print=True, flag_time_thunks=None,
+                 sample_every=None, **kwargs):
         if (hasattr(theano, 'sandbox') and
                 hasattr(theano.sandbox, 'cuda') and
                 theano.sandbox.cuda.cuda_enabled):
@@ -248,6 +281,10 @@ class ProfileStats(object):
             self.flag_time_thunks = config.profiling.time_thunks
         else:
             self.flag_time_thunks = flag_time_thunks
+        if sample_every is None:
+            self.sample_every = config.profiling.sample_every
+        else:
+            self.sample_every = sample_every
         self.__dict__.update(kwargs)
         if atexit_print:
             global _atexit_print_list
@@ -257,6 +294,18 @@ class ProfileStats(object):
                 atexit.register(_atexit_print_fn)
                 _atexit_registered = True
 
+    def sample_call(self):
+        """
+        Return True if the thunks should be timed in the next call.
+
+        Each call is chosen with probability 1 / sample_every, so that
+        functions sharing this profile are sampled evenly.
+
+        """
+        if self.sample_every <= 1:
+            return True
+        return random.random() * self.sample_every < 1
+
     def class_time(self):
         """
         dict op -> total time on thunks
@@ -669,6 +718,10 @@ class ProfileStats(object):
         print('  Message: %s' % self.message, file=file)
         print('  Time in %i calls to Function.__call__: %es' % (
             self.fct_callcount, self.fct_call_time), file=file)
+        if self.sample_every > 1:
+            print('  Thunk timings and call counts estimated from %i calls '
+                  '(1 in %i)' % (self.sampled_callcount, self.sample_every),
+                  file=file)
         if self.fct_call_time > 0:
             print('  Time in Function.fn.__call__: %es (%.3f%%)' % (
                 self.vm_call_time,
@@ -1190,6 +1243,22 @@ class ProfileStats(object):
 
         print("---", file=file)
 
+        if self.measured_peak_memory:
+            # What the VM saw, to compare with the estimate above for the
+            # executed order and with the minimum peak below.
+            print("    Measured peak: %dKB (estimated for the executed "
+                  "order: %dKB)" % (
+                      int(round(self.measured_peak_memory / 1024.)),
+                      int(round(new_max_running_max_memory_size[0] / 1024.))),
+                  file=file)
+            if self.measured_peak_node is None:
+                peak_node = "(the inputs)"
+            else:
+                peak_node = self.measured_peak_node
+            print("    Measured peak reached after node: %s" % peak_node,
+                  file=file)
+            print("---", file=file)
+
         if min_max_peak:
             print("    Minimum peak from all valid apply node order is "
                   "%dKB(took %.3fs to compute)" %
@@ -1,4 +1,6 @@
 import copy
+import gc
+import os
 import six.moves.cPickle as pickle
 import numpy
 import unittest
@@ -8,7 +10,7 @@ from theano import config, gof
 from six import iteritems
 from theano.compile.io import In, Out
 from theano.compile import function
-from theano.compile import UnusedInputError
+from theano.compile import UnusedInputError, freeze_for_fork
 from theano.gof import MissingInputError
 from theano.compat import exc_message
 from theano.tests.unittest_tools import SkipTest
@@ -36,6 +38,23 @@ def checkfor(testcase, fn, E):
     testcase.fail()
 
 
+def count_slow_calls(f):
+    """
+    Make the fast_call of f record in the returned list the calls it
+    forwards to __call__.
+
+    """
+    slow_calls = []
+
+    def call(*args, **kwargs):
+        slow_calls.append(args)
+        return theano.compile.function_module.Function.__call__(
+            f, *args, **kwargs)
+    f.__call__ = call
+    f.fast_call = f._make_fast_call()
+    return slow_calls
+
+
 class T_function(unittest.TestCase):
     def test_none(self):
         fn = function([], None)  # ok
@@ -558,6 +577,102 @@ class T_function(unittest.TestCase):
             if not isinstance(key, theano.gof.Constant):
                 assert (val[0] == None)
 
+    def test_fast_call(self):
+        x = T.vector('x')
+        y = T.scalar('y')
+        s = theano.shared(numpy.asarray(0, dtype=config.floatX))
+        f = function([x, y], x * y + s, updates=[(s, s + 1)])
+        slow_calls = count_slow_calls(f)
+        xv = numpy.arange(3, dtype=config.floatX)
+        yv = numpy.asarray(3, dtype=config.floatX)
+
+        # Fast path
+        assert numpy.allclose(f.fast_call(xv, yv), xv * 3)
+        assert not slow_calls
+        assert s.get_value() == 1
+        assert numpy.allclose(f(xv, yv), xv * 3 + 1)
+        assert s.get_value() == 2
+        # Fallbacks: list needing a filter, bad type, alias of a shared
+        # variable with an update
+        assert numpy.allclose(f.fast_call([0, 1, 2], yv), xv * 3 + 2)
+        assert len(slow_calls) == 1
+        self.assertRaises(TypeError, f.fast_call,
+                          numpy.arange(3, dtype='complex128'), yv)
+        assert len(slow_calls) == 2
+        assert s.get_value() == 3
+        z = T.scalar('z')
+        h = function([z], z + s, updates=[(s, s + 1)])
+        slow_calls = count_slow_calls(h)
+        assert numpy.allclose(h.fast_call(s.get_value(borrow=True)), 6)
+        assert len(slow_calls) == 1
+        # Equal dtypes with different numbers, or another byte order
+        i = T.lvector('i')
+        k = function([i], i * 2)
+        slow_calls = count_slow_calls(k)
+        iv = numpy.arange(3, dtype=numpy.longlong)
+        assert numpy.all(k.fast_call(iv) == [0, 2, 4])
+        assert len(slow_calls) == int(iv.dtype.num !=
+                                      numpy.dtype('int64').num)
+        d = T.dvector('d')
+        k = function([d], d * 2)
+        slow_calls = count_slow_calls(k)
+        dv = numpy.arange(3, dtype='>f8')
+        assert numpy.allclose(k.fast_call(dv), [0, 2, 4])
+        assert len(slow_calls) == int(not dv.dtype.isnative)
+
+        # Copies get their own fast_call
+        g = f.copy()
+        assert g.fast_call is not f.fast_call
+        # (they return a list, as copy does not keep unpack_single)
+        assert numpy.allclose(g.fast_call(xv, yv),
+                              numpy.asarray(g(xv, yv)) - 1)
+
+        # Errors raised in the graph are reported as by __call__
+        h = function([x], T.dot(x, x[:2]))
+        self.assertRaises(ValueError, h.fast_call, xv)
+
+    def test_call_many(self):
+        x = T.vector('x')
+        y = T.scalar('y')
+        xvs = [numpy.arange(3, dtype=config.floatX) * i for i in range(4)]
+        for linker in ['cvm', 'py', 'c|py']:
+            mode = theano.compile.Mode(linker=linker,
+                                       optimizer='fast_compile')
+            s = theano.shared(numpy.asarray(0, dtype=config.floatX))
+            f = function([x, y], [x * y + s, x.sum()],
+                         updates=[(s, s + 1)], mode=mode)
+            # Reference function, called once per tuple of arguments.
+            r = theano.shared(numpy.asarray(0, dtype=config.floatX))
+            g = function([x, y], [x * y + r, x.sum()],
+                         updates=[(r, r + 1)], mode=mode)
+            batches = []
+            if hasattr(f.fn, 'call_batch'):
+                call_batch = f.fn.call_batch
+                f.fn.call_batch = lambda *a: (batches.append(a) or
+                                              call_batch(*a))
+            for k in range(2):
+                args = [(xv, k + 3) for xv in xvs]
+                out, sums = f.call_many(args)
+                assert out.shape == (4, 3)
+                assert sums.shape == (4,)
+                for i, (xv, yv) in enumerate(args):
+                    ref_out, ref_sum = g(xv, yv)
+                    assert numpy.allclose(out[i], ref_out)
+                    assert numpy.allclose(sums[i], ref_sum)
+                assert s.get_value() == r.get_value() == 4 * (k + 1)
+            # The C VM runs the calls in its C loop
+            assert len(batches) == (2 if linker == 'cvm' else 0)
+
+            # Outputs of different shapes are returned as lists
+            g = function([x], x[:x.shape[0] // 2 + 1], mode=mode)
+            rval = g.call_many([(xvs[1],), (xvs[1][:1],)])
+            assert isinstance(rval, list) and len(rval) == 2
+            assert numpy.allclose(rval[1], [0])
+
+            # Errors in the graph are reported as by __call__
+            h = function([x], T.dot(x, x[:2]), mode=mode)
+            self.assertRaises(ValueError, h.call_many, [(xvs[1],)])
+
 
 class T_picklefunction(unittest.TestCase):
 
@@ -862,6 +977,32 @@ def test_empty_givens_updates():
     function([theano.In(x)], y, updates={})
 
 
+def test_freeze_for_fork():
+    if not hasattr(os, 'fork'):
+        raise SkipTest("os.fork is not available")
+    x = T.vector()
+    f = function([x], x * 2)
+    cache = gof.cmodule._module_cache
+    freeze_for_fork()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            # Never return to the test runner from the forked process.
+            ok = False
+            try:
+                ok = (numpy.all(f(numpy.ones(3, dtype=x.dtype)) == 2) and
+                      (cache is None or cache.refresh() == []))
+            finally:
+                os._exit(0 if ok else 1)
+        status = os.waitpid(pid, 0)[1]
+    finally:
+        if cache is not None:
+            cache.frozen_pid = None
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+    assert status == 0
+
+
 if __name__ == '__main__':
 
     if 1:
@@ -104,6 +104,55 @@ class Test_profiling(unittest.TestCase):
             theano.config.profile = config1
             theano.config.profile_memory = config2
 
+    def test_measured_peak(self):
+        config1 = theano.config.profile
+        config2 = theano.config.profile_memory
+        try:
+            theano.config.profile = True
+            theano.config.profile_memory = True
+
+            x = T.vector('x')
+            # The outer product is the biggest intermediate value.
+            y = T.outer(x, x).sum(axis=1) + x[::2].sum()
+            p = theano.ProfileStats(False)
+            mode = theano.Mode(
+                linker=theano.gof.vm.VM_Linker(allow_gc=True),
+                optimizer='fast_compile')
+            f = theano.function([x], y, profile=p, mode=mode)
+            xv = numpy.ones(256, dtype='float64')
+            f(xv)
+
+            outer_bytes = 256 * 256 * 8
+            assert outer_bytes <= p.measured_peak_memory
+            assert p.measured_peak_memory < outer_bytes + 10 * 256 * 8
+            # The peak is reached while the outer product is alive
+            node = p.measured_peak_node
+            assert any(v.ndim == 2 for v in node.inputs + node.outputs)
+
+            buf = StringIO()
+            p.summary(buf)
+            assert "Measured peak:" in buf.getvalue()
+        finally:
+            theano.config.profile = config1
+            theano.config.profile_memory = config2
+
+    def test_sample_every(self):
+        x = T.vector('x')
+        p = theano.ProfileStats(False, sample_every=4)
+        f = theano.function([x], T.exp(x).sum(), profile=p)
+        n_calls = 400
+        for i in range(n_calls):
+            f(numpy.ones(10, dtype=theano.config.floatX))
+
+        assert p.fct_callcount == n_calls
+        assert 0 < p.sampled_callcount < n_calls
+        # The node call counts are estimated from the sampled calls
+        for node, count in p.apply_callcount.items():
+            assert count == 4 * p.sampled_callcount
+        buf = StringIO()
+        p.summary(buf)
+        assert "(1 in 4)" in buf.getvalue()
+
 
 if __name__ == '__main__':
     unittest.main()
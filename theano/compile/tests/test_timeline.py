@@ -0,0 +1,42 @@
+import json
+
+import numpy
+from six.moves import StringIO
+
+import theano
+import theano.tensor as T
+from theano.compile.timeline import Timeline
+
+
+def test_timeline():
+    x = T.vector('x')
+    y = T.exp(x) * 2
+    z = (y + x).sum()
+    timeline = Timeline()
+    f = theano.function([x], [y, z], mode=timeline.mode(allow_gc=True))
+    xv = numpy.ones(100, dtype=theano.config.floatX)
+    f(xv)
+    n_nodes = len(f.maker.fgraph.apply_nodes)
+
+    node_events = [e for e in timeline.events if e['ph'] == 'X']
+    assert len(node_events) == n_nodes
+    for e in node_events:
+        assert e['dur'] >= 0
+    # The nodes are executed one after the other
+    for e1, e2 in zip(node_events, node_events[1:]):
+        assert e1['ts'] + e1['dur'] <= e2['ts']
+    assert sum(e['args']['allocated'] for e in node_events) > 0
+    assert all(e['args']['freed'] >= 0 for e in node_events)
+    counters = [e for e in timeline.events if e['ph'] == 'C']
+    assert len(counters) == n_nodes
+
+    f(xv)
+    assert len([e for e in timeline.events if e['ph'] == 'X']) == 2 * n_nodes
+
+    buf = StringIO()
+    timeline.dump(buf)
+    trace = json.loads(buf.getvalue())
+    assert len(trace['traceEvents']) == len(timeline.events)
+
+    timeline.clear()
+    assert timeline.events == []
@@ -0,0 +1,162 @@
+"""
+Record the execution of Theano functions as a timeline, in the Chrome trace
+event format. The resulting file can be opened with chrome://tracing.
+
+"""
+from __future__ import print_function
+import json
+import os
+import threading
+import time
+
+from six import iteritems, string_types
+
+from theano.compile.mode import Mode
+from theano.gof.vm import VM_Linker
+
+
+def _nbytes(var, value):
+    """
+    Return the number of bytes used by `value`, the value of `var`, as an
+    int (`get_size` may return a numpy integer, which json can't dump).
+
+    """
+    try:
+        return int(var.type.get_size(var.type.get_shape_info(value)))
+    except (AttributeError, NotImplementedError):
+        return int(getattr(value, 'nbytes', 0))
+
+
+class Timeline(object):
+    """
+    Record when each node of a function is executed.
+
+    The nodes are timed by the `callback_start` and `callback` hooks of a
+    `VM_Linker`, so the functions must be compiled with `Timeline.linker`
+    or `Timeline.mode`. They then run with the Stack VM.
+
+    For each execution of a node, it records a Chrome trace event with
+    its start, duration and thread, the number of bytes allocated for its
+    outputs and the number of bytes freed since the previous node. A
+    counter event tracks the memory used by the outputs still alive.
+
+    Examples
+    --------
+    >>> timeline = Timeline()
+    >>> f = theano.function([x], y, mode=timeline.mode())
+    >>> f(x_value)
+    >>> timeline.dump('trace.json')
+
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.t0 = time.time()
+        self.clear()
+
+    def clear(self):
+        """
+        Remove the events recorded so far.
+
+        """
+        self.events = []
+        self.threads = set()
+        # (thread id, node) -> start time
+        self.starts = {}
+        # var -> (storage cell, id of its value, nbytes) for the outputs
+        # still in memory.
+        self.alive = {}
+        self.alive_bytes = 0
+
+    def linker(self, **kwargs):
+        """
+        Return a VM_Linker recording in this timeline.
+
+        The keyword arguments are passed to VM_Linker.
+
+        """
+        return VM_Linker(callback_start=self.node_start,
+                         callback=self.node_end, **kwargs)
+
+    def mode(self, optimizer='default', **kwargs):
+        """
+        Return a Mode recording in this timeline.
+
+        The keyword arguments are passed to VM_Linker.
+
+        """
+        return Mode(linker=self.linker(**kwargs), optimizer=optimizer)
+
+    def timestamp(self):
+        # Trace events are in microseconds.
+        return (time.time() - self.t0) * 1e6
+
+    def collect_freed(self):
+        """
+        Forget the outputs whose storage was cleared and return their size.
+
+        """
+        freed = 0
+        for var, (cell, value_id, nbytes) in list(iteritems(self.alive)):
+            if cell[0] is None or id(cell[0]) != value_id:
+                freed += nbytes
+                del self.alive[var]
+        self.alive_bytes -= freed
+        return freed
+
+    def node_start(self, node, thunk, storage_map, compute_map):
+        tid = threading.current_thread().ident
+        if tid not in self.threads:
+            self.threads.add(tid)
+            self.events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                'tid': tid,
+                'args': {'name': threading.current_thread().name}})
+        self.starts[(tid, node)] = self.timestamp()
+
+    def node_end(self, node, thunk, storage_map, compute_map):
+        end = self.timestamp()
+        tid = threading.current_thread().ident
+        start = self.starts.pop((tid, node), end)
+        freed = self.collect_freed()
+
+        # Views and inplace outputs do not allocate memory.
+        inplace = set(getattr(node.op, 'view_map', {}))
+        inplace.update(getattr(node.op, 'destroy_map', {}))
+        allocated = 0
+        for i, out in enumerate(node.outputs):
+            cell = storage_map[out]
+            if cell[0] is None or i in inplace:
+                continue
+            nbytes = _nbytes(out, cell[0])
+            self.alive[out] = (cell, id(cell[0]), nbytes)
+            allocated += nbytes
+        self.alive_bytes += allocated
+
+        self.events.append({
+            'name': str(node.op), 'cat': 'node', 'ph': 'X',
+            'ts': start, 'dur': end - start,
+            'pid': self.pid, 'tid': tid,
+            'args': {'node': str(node),
+                     'allocated': int(allocated),
+                     'freed': int(freed)}})
+        self.events.append({
+            'name': 'memory', 'ph': 'C', 'ts': end, 'pid': self.pid,
+            'args': {'bytes': int(self.alive_bytes)}})
+
+    def dump(self, f):
+        """
+        Write the events in the Chrome trace JSON format.
+
+        Parameters
+        ----------
+        f
+            A file name or a file object.
+
+        """
+        trace = {'traceEvents': self.events, 'displayTimeUnit': 'ms'}
+        if isinstance(f, string_types):
+            with open(f, 'w') as fd:
+                json.dump(trace, fd)
+        else:
+            json.dump(trace, f)
@@ -4,7 +4,8 @@ import logging
 
 import theano
 from theano.configparser import (AddConfigVar, BoolParam, ConfigParam, EnumStr,
-                                 IntParam, StrParam, TheanoConfigParser)
+                                 FloatParam, IntParam, StrParam,
+                                 TheanoConfigParser)
 from theano.misc.cpucount import cpuCount
 from theano.misc.windows import call_subprocess_Popen
 
@@ -198,7 +199,7 @@ if rc == 0 and config.cxx != "":
                  ("Default linker used if the theano flags mode is Mode "
                   "or ProfileMode(deprecated)"),
                  EnumStr('cvm', 'c|py', 'py', 'c', 'c|py_nogc',
-                         'vm', 'vm_nogc', 'cvm_nogc'),
+                         'vm', 'vm_nogc', 'cvm_nogc', 'vm_background'),
                  in_c_key=False)
 else:
     # g++ is not present or the user disabled it,
@@ -243,6 +244,26 @@ AddConfigVar('optimizer_verbose',
              BoolParam(False),
              in_c_key=False)
 
+AddConfigVar('optimizer_budget',
+             "If > 0, the wall-clock time in seconds allowed to optimize "
+             "each graph. Once it is spent, the remaining optimizers are "
+             "skipped and the graph is compiled as it is",
+             FloatParam(0, lambda x: x >= 0),
+             in_c_key=False)
+
+AddConfigVar('optimizer_stats',
+             "If True, accumulate the time, attempts, successes and change "
+             "in the number of nodes of each optimizer over all the graphs "
+             "optimized in the process, and print them at exit",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('optimizer_stats_file',
+             "If not empty, the optimizer_stats report is also written in "
+             "JSON to this file at exit",
+             StrParam(''),
+             in_c_key=False)
+
 AddConfigVar(
     'on_opt_error',
     ("What to do when an optimization crashes: warn and skip it, raise "
@@ -617,9 +638,9 @@ AddConfigVar(
 
 AddConfigVar(
     'cache_optimizations',
-    "WARNING: work in progress, does not work yet. "
-    "Specify if the optimization cache should be used. This cache will "
-    "any optimized graph and its optimization. Actually slow downs a lot "
-    "the first optimization, and could possibly still contains some bugs. "
-    "Use at your own risks.",
+    "Specify if the optimization cache should be used. This cache stores "
+    "each optimized graph in the 'optimized_graphs' sub-directory of the "
+    "compiledir, keyed on the graph structure, the optimizer, the Theano "
+    "version and the config options. When a graph is found in it, "
+    "optimization is skipped entirely.",
     BoolParam(False))
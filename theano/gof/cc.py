@@ -16,7 +16,7 @@ import numpy
 import theano
 from theano import config
 from theano.compat import PY3
-from theano.compat import izip
+from theano.compat import izip, get_unbound_function
 from six import string_types, reraise
 from six.moves import StringIO, xrange
 
@@ -68,6 +68,133 @@ def get_persistent_module_cache():
     return _persistent_module_cache
 
 
+def may_use_c_thunk(node, force_c_code=False):
+    """
+    Return True if the thunk of node could be made by `Op.make_c_thunk`.
+
+    That is the case if its op uses the default `Op.make_thunk` (or
+    `OpenMPOp.make_thunk`, which only updates the openmp flag of the op
+    first) and `Op.make_c_thunk`, and is not disabled because of float16.
+    This does not check that the op actually has C code.
+
+    Parameters
+    ----------
+    node
+        An Apply node.
+    force_c_code : bool
+        If True, also consider the nodes whose op has `_op_use_c_code` set
+        to False, as OpWiseCLinker uses C code whenever possible.
+
+    """
+    from theano.gof.op import Op, OpenMPOp
+
+    def default_method(op, name):
+        method = get_unbound_function(getattr(type(op), name))
+        return any(method is get_unbound_function(getattr(cls, name))
+                   for cls in (Op, OpenMPOp))
+
+    def is_f16(var):
+        return getattr(var.type, 'dtype', '') == 'float16'
+
+    op = node.op
+    if (not isinstance(op, Op) or
+            not (force_c_code or getattr(op, '_op_use_c_code', False)) or
+            not default_method(op, 'make_thunk') or
+            not default_method(op, 'make_c_thunk')):
+        return False
+    return (getattr(op, '_f16_ok', False) or
+            not any(is_f16(v) for v in node.inputs + node.outputs))
+
+
+def node_clinkers(nodes, no_recycling=(), force_c_code=False):
+    """
+    Return the CLinker `Op.make_c_thunk` would use for each node.
+
+    Only nodes for which `may_use_c_thunk` is True, and for which a module
+    key can be computed, are considered. The linkers are built like
+    `Op.make_c_thunk` does, so their keys are the ones looked up in the
+    module cache when making the thunks.
+
+    Parameters
+    ----------
+    nodes
+        List of Apply nodes, usually the schedule of a linker.
+    no_recycling
+        Variables for which memory must not be reused, as passed to
+        `Op.make_thunk`.
+    force_c_code : bool
+        If True, also consider the nodes whose op has `_op_use_c_code` set
+        to False, as OpWiseCLinker uses C code whenever possible.
+
+    Returns
+    -------
+    list of (node, key, CLinker) tuples
+
+    """
+    from theano.gof.fg import FunctionGraph
+    from theano.gof.op import OpenMPOp
+
+    rval = []
+    for node in nodes:
+        if not may_use_c_thunk(node, force_c_code):
+            continue
+        if isinstance(node.op, OpenMPOp):
+            # Like OpenMPOp.make_thunk, as it changes the key.
+            node.op.update_self_openmp()
+        try:
+            e = FunctionGraph(node.inputs, node.outputs)
+            e_no_recycling = [new_o for (new_o, old_o)
+                              in zip(e.outputs, node.outputs)
+                              if old_o in no_recycling]
+            cl = CLinker().accept(e, no_recycling=e_no_recycling)
+            key = cl.cmodule_key()
+        except (KeyError, NotImplementedError, utils.MethodNotDefined):
+            continue
+        if key is not None:
+            rval.append((node, key, cl))
+    return rval
+
+
+def precompile_nodes(nodes, no_recycling=(), n_workers=None,
+                     force_c_code=False):
+    """
+    Compile concurrently the C modules of `nodes` missing from the cache.
+
+    This gives the linkers returned by `node_clinkers` to
+    `ModuleCache.compile_modules`. The thunks must still be made by the
+    caller; they will then find their module in the cache.
+
+    Parameters
+    ----------
+    nodes
+        List of Apply nodes, usually the schedule of a linker.
+    no_recycling
+        Variables for which memory must not be reused, as passed to
+        `Op.make_thunk`.
+    n_workers
+        Maximum number of concurrent compilations. Defaults to
+        config.cmodule.compilation_workers. Nothing is done if it is 1.
+    force_c_code : bool
+        See `node_clinkers`.
+
+    """
+    if n_workers is None:
+        n_workers = config.cmodule.compilation_workers
+    if n_workers <= 1 or not config.cxx:
+        return
+
+    key_lnk_pairs = []
+    for node, key, cl in node_clinkers(nodes, no_recycling, force_c_code):
+        try:
+            # Make sure the C code can be generated for this node.
+            cl.get_src_code()
+        except (NotImplementedError, utils.MethodNotDefined):
+            continue
+        key_lnk_pairs.append((key, cl))
+    if key_lnk_pairs:
+        get_module_cache().compile_modules(key_lnk_pairs, n_workers)
+
+
 class CodeBlock:
     """
     WRITEME
@@ -1419,11 +1546,23 @@ class CLinker(link.Linker):
         mod = self.get_dynamic_module()
         return mod.code()
 
-    def compile_cmodule(self, location=None):
+    def compile_cmodule(self, location=None, lock=True, py_module=True):
         """
         This compiles the source code for this linker and returns a
         loaded module.
 
+        Parameters
+        ----------
+        location
+            Directory where the module is compiled. Defaults to a new
+            directory in the compiledir.
+        lock : bool
+            If False, the compile lock is not taken. Only use this when
+            `location` is not shared with another compilation.
+        py_module : bool
+            If False, the module is compiled but not imported, and None is
+            returned.
+
         """
         if location is None:
             location = cmodule.dlimport_workdir(config.compiledir)
@@ -1447,7 +1586,8 @@ class CLinker(link.Linker):
                 libs.remove('amdlibm')
         # We want to compute the code without the lock
         src_code = mod.code()
-        get_lock()
+        if lock:
+            get_lock()
         try:
             _logger.debug("LOCATION %s", str(location))
             module = c_compiler.compile_str(
@@ -1457,12 +1597,14 @@ class CLinker(link.Linker):
                 include_dirs=self.header_dirs(),
                 lib_dirs=self.lib_dirs(),
                 libs=libs,
-                preargs=preargs)
+                preargs=preargs,
+                py_module=py_module)
         except Exception as e:
             e.args += (str(self.fgraph),)
             raise
         finally:
-            release_lock()
+            if lock:
+                release_lock()
         return module
 
     def get_dynamic_module(self):
@@ -1744,6 +1886,8 @@ class OpWiseCLinker(link.LocalLinker):
             for k in storage_map:
                 compute_map[k] = [k.owner is None]
 
+            precompile_nodes(order, no_recycling, force_c_code=True)
+
             thunks = []
             for node in order:
                 # Maker sure we use the C version of the code whenever
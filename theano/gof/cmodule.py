@@ -14,9 +14,16 @@ import stat
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import platform
 import distutils.sysconfig
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+from functools import wraps
+from multiprocessing.pool import ThreadPool
 
 import numpy.distutils  # TODO: TensorType should handle this
 
@@ -33,7 +40,7 @@ from theano.misc.windows import (subprocess_Popen,
 from theano.gof import compilelock
 from theano.gof.compiledir import gcc_version_str, local_bitwidth
 
-from theano.configparser import AddConfigVar, BoolParam
+from theano.configparser import AddConfigVar, BoolParam, IntParam
 
 importlib = None
 try:
@@ -71,6 +78,14 @@ AddConfigVar('cmodule.preload_cache',
              BoolParam(False, allow_override=False),
              in_c_key=False)
 
+AddConfigVar('cmodule.compilation_workers',
+             "Maximum number of C modules compiled at the same time when "
+             "building a function. The modules missing from the cache are "
+             "collected before linking and compiled concurrently. "
+             "1 compiles them one after the other.",
+             IntParam(1, lambda i: i >= 1),
+             in_c_key=False)
+
 _logger = logging.getLogger("theano.gof.cmodule")
 
 METH_VARARGS = "METH_VARARGS"
@@ -524,15 +539,25 @@ class KeyData(object):
         pickle time (in which case a warning is also displayed).
 
         """
+        # We write to a temporary file that is then renamed, so that processes
+        # reading the cache without a lock never see a partial file.
         # Note that writing in binary mode is important under Windows.
+        fd, tmp_pkl = tempfile.mkstemp(prefix='key.', suffix='.tmp',
+                                       dir=os.path.dirname(self.key_pkl))
         try:
-            with open(self.key_pkl, 'wb') as f:
+            with os.fdopen(fd, 'wb') as f:
                 pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
         except pickle.PicklingError:
             _logger.warning("Cache leak due to unpickle-able key data %s",
                             self.keys)
-            os.remove(self.key_pkl)
+            os.remove(tmp_pkl)
+            if os.path.exists(self.key_pkl):
+                os.remove(self.key_pkl)
             raise
+        if os.name == 'nt' and os.path.exists(self.key_pkl):
+            # Windows does not allow to rename over an existing file.
+            os.remove(self.key_pkl)
+        os.rename(tmp_pkl, self.key_pkl)
 
     def get_entry(self):
         """
@@ -567,6 +592,18 @@ class KeyData(object):
                 del entry_from_key[key]
 
 
+def _synchronized(method):
+    """
+    Decorate a ModuleCache method so that only one thread runs it at a time.
+
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.thread_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class ModuleCache(object):
     """
     Interface to the cache of dynamically compiled modules on disk.
@@ -589,6 +626,26 @@ class ModuleCache(object):
     - possibly a delete.me file, meaning this directory has been marked
     for deletion.
 
+    Compiling a module only locks that module (see
+    `compilelock.module_lock_ctx`), so independent modules can be compiled
+    by several processes at the same time. A module is compiled in its own
+    new directory, and only becomes visible to other processes once its
+    key.pkl file is renamed into place.
+
+    Within a process, the methods updating the cache can be called from
+    several threads (e.g. to compile C thunks in the background); they hold
+    ``thread_lock`` while they run.
+
+    In addition, an SQLite database 'index.sqlite' at the root of the cache
+    directory holds one record per module directory, with the name of the
+    module file, the content of the key.pkl file and the last time the
+    module was known to be used. Records are added or replaced one at a
+    time when a module or a key is added, so concurrent processes do not
+    lose each other's records. ``refresh`` only reads the records added
+    since its last call, and trusts them instead of scanning the indexed
+    directories. Directories without a record (e.g. written by an older
+    version of Theano) are scanned and indexed.
+
     Keys should be tuples of length 2: (version, rest). The
     ``rest`` can be anything hashable and picklable, that uniquely
     identifies the computation in the module. The key is returned by
@@ -665,6 +722,12 @@ class ModuleCache(object):
     """
     Set of all key.pkl files that have been loaded.
 
+    """
+    index_version = 2
+    """
+    Version of the format of the index database. An index with a different
+    version is emptied.
+
     """
 
     def __init__(self, dirname, check_for_broken_eq=True, do_refresh=True):
@@ -676,7 +739,15 @@ class ModuleCache(object):
         self.stats = [0, 0, 0]
         self.check_for_broken_eq = check_for_broken_eq
         self.loaded_key_pkl = set()
+        # Maps the name of a cache directory to the (module file name, last
+        # use, key.pkl content) of its record in the index.
+        self.index_records = {}
+        # The highest sequence number of the records read from the index.
+        self.index_seq = 0
+        # (pid, connection) to the index database.
+        self.index_connection = None
         self.time_spent_in_check_key = 0
+        self.thread_lock = threading.RLock()
 
         if do_refresh:
             self.refresh()
@@ -687,8 +758,37 @@ class ModuleCache(object):
 
     Older modules will be deleted in ``clear_old``.
 
+    """
+    age_thresh_empty = 60 * 60    # 1 hour
+    """
+    The age threshold (in seconds) above which ``refresh`` deletes empty
+    cache directories.
+
+    """
+
+    frozen_pid = None
+    """
+    The id of the process that called ``freeze``, or None.
+
     """
 
+    def freeze(self):
+        """
+        Make the cache read-only in the processes forked from this one.
+
+        The forked processes use the modules loaded in memory at the time
+        of the fork without reading the cache directory, and do not clean
+        it at exit: this process still does. This way, the functions
+        compiled before the fork run in the forked processes without any
+        cache I/O or lock. A module that is missing from memory is still
+        compiled (or loaded) as usual.
+
+        """
+        self.frozen_pid = os.getpid()
+
+    def _forked_from_frozen(self):
+        return self.frozen_pid is not None and self.frozen_pid != os.getpid()
+
     def _get_module(self, name):
         """
         Fetch a compiled module from the loaded cache or the disk.
@@ -703,12 +803,115 @@ class ModuleCache(object):
             self.stats[0] += 1
         return self.module_from_name[name]
 
+    def _index_db(self):
+        """
+        Return a connection to the index database, or None if it can not be
+        used.
+
+        """
+        if sqlite3 is None:
+            return None
+        pid = os.getpid()
+        if self.index_connection is None or self.index_connection[0] != pid:
+            # A connection must not be used in a forked process.
+            conn = None
+            try:
+                conn = sqlite3.connect(
+                    os.path.join(self.dirname, 'index.sqlite'), timeout=60)
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if version != self.index_version:
+                    with conn:
+                        conn.execute('DROP TABLE IF EXISTS entries')
+                        conn.execute(
+                            'CREATE TABLE entries ('
+                            'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                            'name TEXT UNIQUE NOT NULL, '
+                            'module TEXT NOT NULL, '
+                            'last_used REAL NOT NULL, '
+                            'data BLOB NOT NULL)')
+                        conn.execute('PRAGMA user_version = %d' %
+                                     self.index_version)
+            except sqlite3.Error as e:
+                _logger.info("ModuleCache failed to open its index: %s", e)
+                conn = None
+            self.index_connection = (pid, conn)
+        return self.index_connection[1]
+
+    def _read_index(self):
+        """
+        Update `self.index_records` with the records added to the index
+        since we last read it.
+
+        """
+        conn = self._index_db()
+        if conn is None:
+            return
+        try:
+            rows = conn.execute(
+                'SELECT seq, name, module, last_used, data FROM entries '
+                'WHERE seq > ? ORDER BY seq', (self.index_seq,)).fetchall()
+        except sqlite3.Error as e:
+            _logger.info("ModuleCache failed to read its index: %s", e)
+            return
+        for seq, name, module, last_used, data in rows:
+            self.index_records[name] = (module, last_used, bytes(data))
+            self.index_seq = seq
+
+    def _update_index(self, add=(), remove=()):
+        """
+        Add or replace the records `add`, a list of (directory name, module
+        file name, last use, key.pkl content), and delete the records of the
+        directory names in `remove`, which takes precedence.
+
+        """
+        remove = set(remove)
+        add = [record for record in add if record[0] not in remove]
+        for name in remove:
+            self.index_records.pop(name, None)
+        for name, module, last_used, data in add:
+            self.index_records[name] = (module, last_used, data)
+        conn = self._index_db()
+        if conn is None or not (add or remove):
+            return
+        try:
+            with conn:
+                conn.executemany('DELETE FROM entries WHERE name = ?',
+                                 [(name,) for name in remove])
+                conn.executemany(
+                    'INSERT OR REPLACE INTO entries '
+                    '(name, module, last_used, data) VALUES (?, ?, ?, ?)',
+                    [(name, module, last_used, sqlite3.Binary(data))
+                     for name, module, last_used, data in add])
+        except sqlite3.Error as e:
+            _logger.info("ModuleCache failed to update its index: %s", e)
+
+    def _index_key_data(self, key_data):
+        """
+        Record the current content of the key.pkl file of `key_data` in the
+        index.
+
+        This function expects the lock of the module to be held.
+
+        """
+        try:
+            with open(key_data.key_pkl, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return
+        entry = key_data.get_entry()
+        self._update_index(add=[(os.path.basename(os.path.dirname(entry)),
+                                 os.path.basename(entry), time.time(),
+                                 data)])
+
+    @_synchronized
     def refresh(self, age_thresh_use=None, delete_if_problem=False,
                 cleanup=True):
         """
         Update cache data by walking the cache directory structure.
 
-        Load key.pkl files that have not been loaded yet.
+        Load key.pkl files that have not been loaded yet, using the index
+        file to avoid reading those that did not change since it was
+        written.
         Remove entries which have been removed from the filesystem.
         Also, remove malformed cache directories.
 
@@ -731,6 +934,8 @@ class ModuleCache(object):
             A list of modules of age higher than age_thresh_use.
 
         """
+        if self._forked_from_frozen():
+            return []
         if age_thresh_use is None:
             age_thresh_use = self.age_thresh_use
         start_time = time.time()
@@ -747,6 +952,11 @@ class ModuleCache(object):
             if cleanup:
                 to_delete_empty.append((args, kwargs))
 
+        self._read_index()
+        # Changes to make to the index.
+        index_add = []
+        index_remove = []
+
         # add entries that are not in the entry_from_key dictionary
         time_now = time.time()
         # Go through directories in alphabetical order to ensure consistent
@@ -754,25 +964,53 @@ class ModuleCache(object):
         subdirs = sorted(os.listdir(self.dirname))
         files, root = None, None  # To make sure the "del" below works
         for subdirs_elem in subdirs:
-            # Never clean/remove lock_dir
-            if subdirs_elem == 'lock_dir':
+            # Never clean/remove lock directories
+            if subdirs_elem in ('lock_dir', 'module_locks'):
                 continue
             root = os.path.join(self.dirname, subdirs_elem)
             key_pkl = os.path.join(root, 'key.pkl')
             if key_pkl in self.loaded_key_pkl:
                 continue
-            if not os.path.isdir(root):
-                continue
-            files = os.listdir(root)
-            if not files:
-                rmtree_empty(root, ignore_nocleanup=True,
-                             msg="empty dir")
-                continue
-            if 'delete.me' in files:
-                rmtree(root, ignore_nocleanup=True,
-                       msg="delete.me found in dir")
-                continue
-            elif 'key.pkl' in files:
+            record = self.index_records.get(subdirs_elem)
+            if record is not None:
+                # Trust the index: the module file and key.pkl content it
+                # records are not checked on disk.
+                entry = os.path.join(root, record[0])
+                data = record[2]
+                last_used = record[1]
+                if (time_now - last_used) >= age_thresh_use:
+                    # Another process may have used the module without
+                    # updating its record.
+                    try:
+                        last_used = last_access_time(entry)
+                    except OSError:
+                        index_remove.append(subdirs_elem)
+                        record = None
+                    else:
+                        if (time_now - last_used) < age_thresh_use:
+                            index_add.append((subdirs_elem, record[0],
+                                              last_used, data))
+            if record is None:
+                if not os.path.isdir(root):
+                    continue
+                files = os.listdir(root)
+                if not files:
+                    # A recent empty directory may be one in which another
+                    # process is about to compile a module.
+                    if (time_now - os.path.getmtime(root) >
+                            self.age_thresh_empty):
+                        rmtree_empty(root, ignore_nocleanup=True,
+                                     msg="empty dir")
+                    continue
+                if 'delete.me' in files:
+                    rmtree(root, ignore_nocleanup=True,
+                           msg="delete.me found in dir")
+                    continue
+                if 'key.pkl' not in files:
+                    # If the compilation failed, no key.pkl is in that
+                    # directory, but a mod.* should be there.
+                    # We do nothing here.
+                    continue
                 try:
                     entry = module_name_from_dir(root, files=files)
                 except ValueError:  # there is a key but no dll!
@@ -786,158 +1024,170 @@ class ModuleCache(object):
                     rmtree(root, ignore_nocleanup=True,
                            msg="missing module file", level=logging.INFO)
                     continue
-                if (time_now - last_access_time(entry)) < age_thresh_use:
-                    _logger.debug('refresh adding %s', key_pkl)
+                last_used = last_access_time(entry)
+                data = None
+            if (time_now - last_used) >= age_thresh_use:
+                too_old_to_use.append(entry)
+                continue
 
-                    def unpickle_failure():
-                        _logger.info("ModuleCache.refresh() Failed to "
-                                     "unpickle cache file %s", key_pkl)
+            _logger.debug('refresh adding %s', key_pkl)
 
-                    try:
-                        with open(key_pkl, 'rb') as f:
-                            key_data = pickle.load(f)
-                    except EOFError:
-                        # Happened once... not sure why (would be worth
-                        # investigating if it ever happens again).
-                        unpickle_failure()
-                        rmtree(root, ignore_nocleanup=True,
-                               msg='broken cache directory [EOF]',
-                               level=logging.WARNING)
-                        continue
-                    except ValueError:
-                        # This can happen when we have bad config value
-                        # in the cuda.nvcc_compiler.py file.
-                        # We should not hide it here, as this will cause
-                        # an unrelated error to appear.
-                        raise
-                    except Exception:
-                        unpickle_failure()
-                        if delete_if_problem:
-                            rmtree(root, ignore_nocleanup=True,
-                                   msg='broken cache directory',
-                                   level=logging.INFO)
-                        else:
-                            # This exception is often triggered by keys
-                            # that contain references to classes that have
-                            # not yet been imported (e.g. when running two
-                            # different Theano-based scripts). They are not
-                            # necessarily broken, but we cannot load them
-                            # now. They will be loaded later if needed.
-                            pass
-                        continue
+            def unpickle_failure():
+                _logger.info("ModuleCache.refresh() Failed to "
+                             "unpickle cache file %s", key_pkl)
 
-                    if not isinstance(key_data, KeyData):
-                        # This is some old cache data, that does not fit
-                        # the new cache format. It would be possible to
-                        # update it, but it is not entirely safe since we
-                        # do not know the config options that were used.
-                        # As a result, we delete it instead (which is also
-                        # simpler to implement).
-                        rmtree(root, ignore_nocleanup=True,
-                               msg=(
-                                   'invalid cache entry format -- this '
-                                   'should not happen unless your cache '
-                                   'was really old'),
-                               level=logging.WARN)
-                        continue
+            try:
+                if data is None:
+                    with open(key_pkl, 'rb') as f:
+                        data = f.read()
+                key_data = pickle.loads(data)
+            except EOFError:
+                # Happened once... not sure why (would be worth
+                # investigating if it ever happens again).
+                unpickle_failure()
+                rmtree(root, ignore_nocleanup=True,
+                       msg='broken cache directory [EOF]',
+                       level=logging.WARNING)
+                continue
+            except ValueError:
+                # This can happen when we have bad config value
+                # in the cuda.nvcc_compiler.py file.
+                # We should not hide it here, as this will cause
+                # an unrelated error to appear.
+                raise
+            except Exception:
+                unpickle_failure()
+                if delete_if_problem:
+                    rmtree(root, ignore_nocleanup=True,
+                           msg='broken cache directory',
+                           level=logging.INFO)
+                else:
+                    # This exception is often triggered by keys
+                    # that contain references to classes that have
+                    # not yet been imported (e.g. when running two
+                    # different Theano-based scripts). They are not
+                    # necessarily broken, but we cannot load them
+                    # now. They will be loaded later if needed.
+                    pass
+                continue
 
-                    # Check the path to the module stored in the KeyData
-                    # object matches the path to `entry`. There may be
-                    # a mismatch e.g. due to symlinks, or some directory
-                    # being renamed since last time cache was created.
-                    kd_entry = key_data.get_entry()
-                    if kd_entry != entry:
-                        if is_same_entry(entry, kd_entry):
-                            # Update KeyData object. Note that we also need
-                            # to update the key_pkl field, because it is
-                            # likely to be incorrect if the entry itself
-                            # was wrong.
-                            key_data.entry = entry
-                            key_data.key_pkl = key_pkl
-                        else:
-                            # This is suspicious. Better get rid of it.
-                            rmtree(root, ignore_nocleanup=True,
-                                   msg='module file path mismatch',
-                                   level=logging.INFO)
-                            continue
+            if not isinstance(key_data, KeyData):
+                # This is some old cache data, that does not fit
+                # the new cache format. It would be possible to
+                # update it, but it is not entirely safe since we
+                # do not know the config options that were used.
+                # As a result, we delete it instead (which is also
+                # simpler to implement).
+                rmtree(root, ignore_nocleanup=True,
+                       msg=(
+                           'invalid cache entry format -- this '
+                           'should not happen unless your cache '
+                           'was really old'),
+                       level=logging.WARN)
+                continue
 
-                    # Find unversioned keys from other processes.
-                    # TODO: check if this can happen at all
-                    to_del = [key for key in key_data.keys if not key[0]]
-                    if to_del:
-                        _logger.warning(
-                            "ModuleCache.refresh() Found unversioned "
-                            "key in cache, removing it. %s", key_pkl)
-                        # Since the version is in the module hash, all
-                        # keys should be unversioned.
-                        if len(to_del) != len(key_data.keys):
-                            _logger.warning(
-                                'Found a mix of unversioned and '
-                                'versioned keys for the same '
-                                'module %s', key_pkl)
-                        rmtree(root, ignore_nocleanup=True,
-                               msg="unversioned key(s) in cache",
-                               level=logging.INFO)
-                        continue
+            # Check the path to the module stored in the KeyData
+            # object matches the path to `entry`. There may be
+            # a mismatch e.g. due to symlinks, or some directory
+            # being renamed since last time cache was created.
+            kd_entry = key_data.get_entry()
+            if kd_entry != entry:
+                if is_same_entry(entry, kd_entry):
+                    # Update KeyData object. Note that we also need
+                    # to update the key_pkl field, because it is
+                    # likely to be incorrect if the entry itself
+                    # was wrong.
+                    key_data.entry = entry
+                    key_data.key_pkl = key_pkl
+                else:
+                    # This is suspicious. Better get rid of it.
+                    rmtree(root, ignore_nocleanup=True,
+                           msg='module file path mismatch',
+                           level=logging.INFO)
+                    continue
 
-                    mod_hash = key_data.module_hash
-                    if mod_hash in self.module_hash_to_key_data:
-                        # This may happen when two processes running
-                        # simultaneously compiled the same module, one
-                        # after the other. We delete one once it is old
-                        # enough (to be confident there is no other process
-                        # using it), or if `delete_if_problem` is True.
-                        # Note that it is important to walk through
-                        # directories in alphabetical order so as to make
-                        # sure all new processes only use the first one.
-                        if cleanup:
-                            age = time.time() - last_access_time(entry)
-                            if delete_if_problem or age > self.age_thresh_del:
-                                rmtree(root, ignore_nocleanup=True,
-                                       msg='duplicated module',
-                                       level=logging.DEBUG)
-                            else:
-                                _logger.debug('Found duplicated module not '
-                                              'old enough yet to be deleted '
-                                              '(age: %s): %s',
-                                              age, entry)
-                        continue
+            # Find unversioned keys from other processes.
+            # TODO: check if this can happen at all
+            to_del = [key for key in key_data.keys if not key[0]]
+            if to_del:
+                _logger.warning(
+                    "ModuleCache.refresh() Found unversioned "
+                    "key in cache, removing it. %s", key_pkl)
+                # Since the version is in the module hash, all
+                # keys should be unversioned.
+                if len(to_del) != len(key_data.keys):
+                    _logger.warning(
+                        'Found a mix of unversioned and '
+                        'versioned keys for the same '
+                        'module %s', key_pkl)
+                rmtree(root, ignore_nocleanup=True,
+                       msg="unversioned key(s) in cache",
+                       level=logging.INFO)
+                continue
 
-                    # Remember the map from a module's hash to the KeyData
-                    # object associated with it.
-                    self.module_hash_to_key_data[mod_hash] = key_data
-
-                    for key in key_data.keys:
-                        if key not in self.entry_from_key:
-                            self.entry_from_key[key] = entry
-                            # Assert that we have not already got this
-                            # entry somehow.
-                            assert entry not in self.module_from_name
-                            # Store safe part of versioned keys.
-                            if key[0]:
-                                self.similar_keys.setdefault(
-                                    get_safe_part(key),
-                                    []).append(key)
-                        else:
-                            dir1 = os.path.dirname(self.entry_from_key[key])
-                            dir2 = os.path.dirname(entry)
-                            _logger.warning(
-                                "The same cache key is associated to "
-                                "different modules (%s and %s). This "
-                                "is not supposed to happen! You may "
-                                "need to manually delete your cache "
-                                "directory to fix this.",
-                                dir1, dir2)
-                    # Clean up the name space to prevent bug.
-                    if key_data.keys:
-                        del key
-                    self.loaded_key_pkl.add(key_pkl)
-                else:
-                    too_old_to_use.append(entry)
+            mod_hash = key_data.module_hash
+            if mod_hash in self.module_hash_to_key_data:
+                # This may happen when two processes running
+                # simultaneously compiled the same module, one
+                # after the other. We delete one once it is old
+                # enough (to be confident there is no other process
+                # using it), or if `delete_if_problem` is True.
+                # Note that it is important to walk through
+                # directories in alphabetical order so as to make
+                # sure all new processes only use the first one.
+                if cleanup:
+                    age = time.time() - last_access_time(entry)
+                    if delete_if_problem or age > self.age_thresh_del:
+                        rmtree(root, ignore_nocleanup=True,
+                               msg='duplicated module',
+                               level=logging.DEBUG)
+                    else:
+                        _logger.debug('Found duplicated module not '
+                                      'old enough yet to be deleted '
+                                      '(age: %s): %s',
+                                      age, entry)
+                continue
 
-            # If the compilation failed, no key.pkl is in that
-            # directory, but a mod.* should be there.
-            # We do nothing here.
+            # Remember the map from a module's hash to the KeyData
+            # object associated with it.
+            self.module_hash_to_key_data[mod_hash] = key_data
+
+            for key in key_data.keys:
+                if key not in self.entry_from_key:
+                    self.entry_from_key[key] = entry
+                    # Assert that we have not already got this
+                    # entry somehow.
+                    assert entry not in self.module_from_name
+                    # Store safe part of versioned keys.
+                    if key[0]:
+                        self.similar_keys.setdefault(
+                            get_safe_part(key),
+                            []).append(key)
+                else:
+                    dir1 = os.path.dirname(self.entry_from_key[key])
+                    dir2 = os.path.dirname(entry)
+                    _logger.warning(
+                        "The same cache key is associated to "
+                        "different modules (%s and %s). This "
+                        "is not supposed to happen! You may "
+                        "need to manually delete your cache "
+                        "directory to fix this.",
+                        dir1, dir2)
+            # Clean up the name space to prevent bug.
+            if key_data.keys:
+                del key
+            self.loaded_key_pkl.add(key_pkl)
+            if record is None:
+                index_add.append((subdirs_elem, os.path.basename(entry),
+                                  last_used, data))
+
+        # Forget the index records of directories that no longer exist or
+        # that are about to be deleted.
+        existing_subdirs = set(subdirs)
+        index_remove.extend(name for name in self.index_records
+                            if name not in existing_subdirs)
+        index_remove.extend(os.path.basename(a[0]) for a, kw in to_delete)
+        self._update_index(add=index_add, remove=index_remove)
 
         # Clean up the name space to prevent bug.
         del root, files, subdirs
@@ -946,12 +1196,17 @@ class ModuleCache(object):
         items_copy = list(self.module_hash_to_key_data.items())
         for module_hash, key_data in items_copy:
             entry = key_data.get_entry()
-            try:
-                # Test to see that the file is [present and] readable.
-                open(entry).close()
-                gone = False
-            except IOError:
-                gone = True
+            parent = os.path.dirname(entry)
+            if os.path.dirname(parent) == self.dirname:
+                # The listing above tells us whether the directory is gone.
+                gone = os.path.basename(parent) not in existing_subdirs
+            else:
+                try:
+                    # Test to see that the file is [present and] readable.
+                    open(entry).close()
+                    gone = False
+                except IOError:
+                    gone = True
 
             if gone:
                 # Assert that we did not have one of the deleted files
@@ -1024,11 +1279,11 @@ class ModuleCache(object):
             return None
         return self._get_module(name)
 
-    def _get_from_hash(self, module_hash, key, keep_lock=False):
+    def _get_from_hash(self, module_hash, key):
         if module_hash in self.module_hash_to_key_data:
             key_data = self.module_hash_to_key_data[module_hash]
             module = self._get_from_key(None, key_data)
-            with compilelock.lock_ctx(keep_lock=keep_lock):
+            with compilelock.module_lock_ctx(module_hash):
                 try:
                     key_data.add_key(key, save_pkl=bool(key[0]))
                     key_broken = False
@@ -1041,6 +1296,8 @@ class ModuleCache(object):
                 if (key[0] and not key_broken and
                         self.check_for_broken_eq):
                     self.check_key(key, key_data.key_pkl)
+                if key[0]:
+                    self._index_key_data(key_data)
             self._update_mappings(key, key_data, module.__file__, check_in_keys=not key_broken)
             return module
         else:
@@ -1063,7 +1320,7 @@ class ModuleCache(object):
 
     def _add_to_cache(self, module, key, module_hash):
         """
-        This function expects the compile lock to be held.
+        This function expects the lock of the module to be held.
 
         """
         name = module.__file__
@@ -1094,6 +1351,7 @@ class ModuleCache(object):
             if not key_broken and self.check_for_broken_eq:
                 self.check_key(key, key_pkl)
             self.loaded_key_pkl.add(key_pkl)
+            self._index_key_data(key_data)
         elif config.cmodule.warn_no_version:
             key_flat = flatten(key)
             ops = [k for k in key_flat if isinstance(k, theano.Op)]
@@ -1104,6 +1362,7 @@ class ModuleCache(object):
         self._update_mappings(key, key_data, module.__file__, not key_broken)
         return key_data
 
+    @_synchronized
     def module_from_key(self, key, lnk=None, keep_lock=False):
         """
         Return a module from the cache, compiling it if necessary.
@@ -1119,7 +1378,8 @@ class ModuleCache(object):
             first one returns the source code of the module to load/compile and
             the second performs the actual compilation.
         keep_lock : bool
-            If True, the compilation lock will not be released if taken.
+            Not used anymore: only the lock of this module is taken, and it
+            is always released. Kept for backward compatibility.
 
         """
         # Is the module in the cache?
@@ -1130,11 +1390,11 @@ class ModuleCache(object):
         src_code = lnk.get_src_code()
         # Is the source code already in the cache?
         module_hash = get_module_hash(src_code, key)
-        module = self._get_from_hash(module_hash, key, keep_lock=keep_lock)
+        module = self._get_from_hash(module_hash, key)
         if module is not None:
             return module
 
-        with compilelock.lock_ctx(keep_lock=keep_lock):
+        with compilelock.module_lock_ctx(module_hash):
             # 1) Maybe somebody else compiled it for us while we
             #    where waiting for the lock. Try to load it again.
             # 2) If other repo that import Theano have Theano ops defined,
@@ -1164,7 +1424,9 @@ class ModuleCache(object):
             nocleanup = False
             try:
                 location = dlimport_workdir(self.dirname)
-                module = lnk.compile_cmodule(location)
+                # We hold the lock of this module, and nobody else uses
+                # `location`, so the global compile lock is not needed.
+                module = lnk.compile_cmodule(location, lock=False)
                 name = module.__file__
                 assert name.startswith(location)
                 assert name not in self.module_from_name
@@ -1192,6 +1454,103 @@ class ModuleCache(object):
         self.stats[2] += 1
         return module
 
+    @_synchronized
+    def compile_modules(self, key_lnk_pairs, n_workers=None):
+        """
+        Make sure the modules of several keys are in the cache, compiling
+        the missing ones concurrently.
+
+        This is meant to be called before `module_from_key` is called for
+        each of these keys, so that those calls find the modules in the
+        cache. Failures are not reported here: the module is simply left
+        out of the cache, so that `module_from_key` compiles it again and
+        raises the error.
+
+        Parameters
+        ----------
+        key_lnk_pairs
+            List of (key, lnk) pairs as given to `module_from_key`. `lnk`
+            must be a CLinker instance.
+        n_workers
+            Maximum number of modules compiled at the same time. Defaults
+            to config.cmodule.compilation_workers.
+
+        Notes
+        -----
+        Each module is compiled in its own new directory, so no lock is
+        held during compilation. The lock of each module is only taken to
+        register it, after checking that no other process added it in the
+        meantime.
+
+        """
+        if n_workers is None:
+            n_workers = config.cmodule.compilation_workers
+
+        def find_missing(pairs):
+            missing = []
+            seen_hashes = set()
+            for key, module_hash, lnk in pairs:
+                if (key in self.entry_from_key or
+                        module_hash in self.module_hash_to_key_data or
+                        module_hash in seen_hashes):
+                    continue
+                seen_hashes.add(module_hash)
+                missing.append((key, module_hash, lnk))
+            return missing
+
+        # The source code is only needed for keys not in the cache.
+        to_compile = find_missing(
+            [(key, get_module_hash(lnk.get_src_code(), key), lnk)
+             for key, lnk in key_lnk_pairs
+             if key not in self.entry_from_key])
+        if not to_compile:
+            return
+        self.refresh(cleanup=False)
+        to_compile = find_missing(to_compile)
+        if not to_compile:
+            return
+
+        locations = [dlimport_workdir(self.dirname) for _ in to_compile]
+
+        def compile_one(args):
+            lnk, location = args
+            try:
+                lnk.compile_cmodule(location, lock=False, py_module=False)
+                return True
+            except Exception as e:
+                _logger.debug('Compilation in %s failed: %s', location, e)
+                return False
+
+        _logger.debug('Compiling %d modules with %d workers',
+                      len(to_compile), n_workers)
+        pool = ThreadPool(min(n_workers, len(to_compile)))
+        try:
+            success = pool.map(compile_one,
+                               [(lnk, location) for (_, _, lnk), location
+                                in zip(to_compile, locations)])
+        finally:
+            pool.close()
+            pool.join()
+
+        self.refresh(cleanup=False)
+        for (key, module_hash, lnk), location, ok in zip(
+                to_compile, locations, success):
+            with compilelock.module_lock_ctx(module_hash):
+                if (not ok or key in self.entry_from_key or
+                        module_hash in self.module_hash_to_key_data):
+                    # Failed, or someone else compiled it meanwhile.
+                    _rmtree(location, ignore_if_missing=True,
+                            msg='unused parallel compilation')
+                    continue
+                open(os.path.join(location, '__init__.py'), 'w').close()
+                module = dlimport(module_name_from_dir(location))
+                name = module.__file__
+                assert name not in self.module_from_name
+                self.module_from_name[name] = module
+                key_data = self._add_to_cache(module, key, module_hash)
+                self.module_hash_to_key_data[module_hash] = key_data
+                self.stats[2] += 1
+
     def check_key(self, key, key_pkl):
         """
         Perform checks to detect broken __eq__ / __hash__ implementations.
@@ -1260,6 +1619,7 @@ class ModuleCache(object):
 
     """
 
+    @_synchronized
     def clear_old(self, age_thresh_del=None, delete_if_problem=False):
         """
         Delete entries from the filesystem for cache entries that are too old.
@@ -1310,6 +1670,9 @@ class ModuleCache(object):
                 assert parent.startswith(os.path.join(self.dirname, 'tmp'))
                 _rmtree(parent, msg='old cache directory', level=logging.INFO,
                         ignore_nocleanup=True)
+            self._update_index(remove=[
+                os.path.basename(os.path.dirname(entry))
+                for entry in too_old_to_use])
 
     def clear(self, unversioned_min_age=None, clear_base_files=False,
               delete_if_problem=False):
@@ -1368,6 +1731,7 @@ class ModuleCache(object):
                         _logger.warning('Could not move %s to %s',
                                         to_rename, to_delete)
 
+    @_synchronized
     def clear_unversioned(self, min_age=None):
         """
         Delete unversioned dynamic modules.
@@ -1461,6 +1825,9 @@ class ModuleCache(object):
                                     ignore_nocleanup=True)
 
     def _on_atexit(self):
+        if self._forked_from_frozen():
+            # The process that froze the cache cleans it.
+            return
         # Note: no need to call refresh() since it is called by clear_old().
         with compilelock.lock_ctx():
             self.clear_old()
@@ -1499,6 +1866,15 @@ def _rmtree(parent, ignore_nocleanup=False, msg='', level=logging.DEBUG,
 _module_cache = None
 
 
+def _reinit_after_fork():
+    # A thread of the parent process may hold the lock while it forks.
+    if _module_cache is not None:
+        _module_cache.thread_lock = threading.RLock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
 def get_module_cache(dirname, init_args=None):
     """
 
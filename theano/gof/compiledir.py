@@ -272,8 +272,14 @@ def cleanup():
 
     If there is no key left for a compiled module, we delete the module.
 
+    The index of the module cache is deleted, as it may still hold the
+    removed keys. It is rebuilt the next time the cache is refreshed.
+
     """
     compiledir = theano.config.compiledir
+    index = os.path.join(compiledir, 'index.sqlite')
+    if os.path.exists(index):
+        os.remove(index)
     for directory in os.listdir(compiledir):
         file = None
         try:
@@ -1,9 +1,11 @@
 # Locking mechanism to ensure no two compilations occur simultaneously
-# in the same compilation directory (which can cause crashes).
+# in the same compilation directory (which can cause crashes), or on the
+# same module when using module_lock_ctx.
 
 import atexit
 import os
 import socket  # only used for gethostname()
+import threading
 import time
 import logging
 
@@ -61,6 +63,119 @@ def lock_ctx(lock_dir=None, keep_lock=False, **kw):
         release_lock()
 
 
+# Maps the directory of each module lock held by this process to a list
+# [number of times it was requested, time it was acquired or refreshed].
+_module_locks = {}
+# Protects `_module_locks`, as modules may be compiled from several threads.
+_module_locks_lock = threading.Lock()
+# The thread refreshing the module locks while some are held, if any.
+_module_locks_refresher = [None]
+
+
+def _refresh_module_locks():
+    """
+    Refresh the module locks held for more than half `config.compile.timeout`,
+    so that other processes do not override them.
+
+    This function expects `_module_locks_lock` to be held.
+
+    """
+    now = time.time()
+    for lock_dir, state in _module_locks.items():
+        if now - state[1] > config.compile.timeout / 2:
+            lockpath = os.path.join(lock_dir, 'lock')
+            _logger.info('Refreshing lock %s', str(lockpath))
+            refresh_lock(lockpath)
+            state[1] = now
+
+
+def _refresh_module_locks_loop():
+    """
+    Refresh the module locks until none is held.
+
+    """
+    while True:
+        time.sleep(max(config.compile.timeout / 4., 1))
+        with _module_locks_lock:
+            if not _module_locks:
+                _module_locks_refresher[0] = None
+                return
+            _refresh_module_locks()
+
+
+def _release_module_locks():
+    """
+    Release the module locks still held when the program exits.
+
+    """
+    with _module_locks_lock:
+        for lock_dir in _module_locks:
+            Unlocker(lock_dir).unlock(force=False)
+        _module_locks.clear()
+
+atexit.register(_release_module_locks)
+
+
+@contextmanager
+def module_lock_ctx(module_hash, lock_base=None, **kw):
+    """
+    Lock the compilation directory for a single module.
+
+    Unlike `lock_ctx`, which locks the whole compilation directory, this
+    only prevents other processes from working on the module identified by
+    `module_hash` at the same time, so that independent modules can be
+    compiled concurrently. Requesting a lock that this process already
+    holds does not block. While this process holds module locks, a
+    background thread refreshes them like the lock of the compilation
+    directory, so that they are not overridden during long compilations.
+
+    Parameters
+    ----------
+    module_hash : str
+        Hash identifying the module. It is used as the lock directory name.
+    lock_base : str
+        Directory in which lock directories are created. Defaults to
+        'module_locks' in the compilation directory.
+    kw
+        Additional arguments to be forwarded to the `lock` function when
+        acquiring the lock.
+
+    """
+    if lock_base is None:
+        lock_base = os.path.join(config.compiledir, 'module_locks')
+    lock_dir = os.path.join(lock_base, module_hash)
+    enabled = getattr(get_lock, 'lock_is_enabled', True)
+    if enabled:
+        with _module_locks_lock:
+            held = lock_dir in _module_locks
+            if held:
+                _module_locks[lock_dir][0] += 1
+        if not held:
+            # Do not block the other threads while waiting for the lock.
+            lock(lock_dir, **kw)
+            with _module_locks_lock:
+                _module_locks[lock_dir] = [1, time.time()]
+                refresher = _module_locks_refresher[0]
+                if refresher is None or not refresher.is_alive():
+                    # There is no refresher yet, or we were forked.
+                    refresher = threading.Thread(
+                        target=_refresh_module_locks_loop,
+                        name='theano_module_locks_refresher')
+                    refresher.daemon = True
+                    refresher.start()
+                    _module_locks_refresher[0] = refresher
+    try:
+        yield
+    finally:
+        if enabled:
+            with _module_locks_lock:
+                state = _module_locks[lock_dir]
+                state[0] -= 1
+                if state[0] == 0:
+                    del _module_locks[lock_dir]
+                    Unlocker(lock_dir).unlock(force=False)
+
+
 # We define this name with an underscore so that python shutdown
 # deletes this before non-underscore names (like os).  We need to do
 # it this way to avoid errors on shutdown.
@@ -257,7 +372,7 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                         msg = "process '%s'" % read_owner.split('_')[0]
                         _logger.warning("Overriding existing lock by dead %s "
                                         "(I am process '%s')", msg, my_pid)
-                    get_lock.unlocker.unlock(force=True)
+                    Unlocker(tmp_dir).unlock(force=True)
                     continue
                 if last_owner == read_owner:
                     if (timeout is not None and
@@ -270,7 +385,7 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                                 msg = "process '%s'" % read_owner.split('_')[0]
                             _logger.warning("Overriding existing lock by %s "
                                             "(I am process '%s')", msg, my_pid)
-                        get_lock.unlocker.unlock(force=True)
+                        Unlocker(tmp_dir).unlock(force=True)
                         continue
                 else:
                     last_owner = read_owner
@@ -347,7 +462,7 @@ def refresh_lock(lock_file):
         # from failing, we release the lock, but as there is a
         # problem, we still keep the original exception.
         # This way, only 1 test would fail.
-        while get_lock.n_lock > 0:
+        while getattr(get_lock, 'n_lock', 0) > 0:
             release_lock()
         _logger.warn('Refreshing lock failed, we release the'
                      ' lock before raising again the exception')
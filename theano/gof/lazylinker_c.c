@@ -791,12 +791,55 @@ CLazyLinker_call(PyObject *_self, PyObject *args, PyObject *kwds)
   static char *kwlist[] = {
     (char*)"time_thunks",
     (char *)"n_calls",
+    (char *)"batch",
+    (char *)"batch_storage",
+    (char *)"post_call_clear",
+    (char *)"clear_outputs",
     NULL};
   int n_calls=1;
-  if (! PyArg_ParseTupleAndKeywords(args, kwds, "|ii", kwlist,
+  // When batch is given, it is a list of tuples of input values. The graph
+  // is executed once for each tuple, after putting its values into the
+  // cells of batch_storage, and the list of the outputs of each execution
+  // is returned.
+  PyObject * batch = NULL;
+  PyObject * batch_storage = NULL;
+  // post_call_clear is a list of cells to clear after the calls, and when
+  // clear_outputs is nonzero and allow_gc is set, the storage of the
+  // computed outputs is cleared too (they are still returned). This
+  // saves Function.__call__ from doing it in Python.
+  PyObject * post_call_clear = NULL;
+  int clear_outputs = 0;
+  if (! PyArg_ParseTupleAndKeywords(args, kwds, "|iiOOOi", kwlist,
                                     &self->do_timing,
-                                    &n_calls))
+                                    &n_calls,
+                                    &batch,
+                                    &batch_storage,
+                                    &post_call_clear,
+                                    &clear_outputs))
     return NULL;
+  if (post_call_clear == Py_None)
+    post_call_clear = NULL;
+  if (post_call_clear && !PyList_Check(post_call_clear))
+    {
+      PyErr_SetString(PyExc_TypeError, "post_call_clear must be a list");
+      return NULL;
+    }
+  PyObject * batch_rval = NULL;
+  if (batch == Py_None)
+    batch = NULL;
+  if (batch)
+    {
+      if (!PyList_Check(batch) || !batch_storage || !PyList_Check(batch_storage))
+        {
+          PyErr_SetString(PyExc_TypeError,
+                          "batch and batch_storage must be lists");
+          return NULL;
+        }
+      n_calls = PyList_Size(batch);
+      batch_rval = PyList_New(n_calls);
+      if (!batch_rval)
+        return NULL;
+    }
   int err = 0;
   self->position_of_error = -1;
   // create constants used to fill the var_compute_cells
@@ -817,6 +860,27 @@ CLazyLinker_call(PyObject *_self, PyObject *args, PyObject *kwds)
           Py_INCREF(Py_None);
           PyList_SetItem(el_i, 0, Py_None);
         }
+      if (batch)
+        {
+          // fill the input cells with the values of this call
+          PyObject * batch_i = PyList_GetItem(batch, call_i);
+          Py_ssize_t n_batch_storage = PyList_Size(batch_storage);
+          if (!PyTuple_Check(batch_i) ||
+              PyTuple_Size(batch_i) != n_batch_storage)
+            {
+              PyErr_Format(PyExc_TypeError,
+                           "batch element %d must be a tuple of %d values",
+                           call_i, (int)n_batch_storage);
+              err = 1;
+              break;
+            }
+          for (Py_ssize_t i = 0; i < n_batch_storage; ++i)
+            {
+              PyObject * el_i = PyTuple_GetItem(batch_i, i);
+              Py_INCREF(el_i);
+              PyList_SetItem(PyList_GetItem(batch_storage, i), 0, el_i);
+            }
+        }
       //clear the computed flag out of all non-input vars
       for (int i = 0; i < self->n_vars; ++i)
         {
@@ -873,6 +937,11 @@ CLazyLinker_call(PyObject *_self, PyObject *args, PyObject *kwds)
               PyList_SetItem(self->var_value_cells[dst], 0, tmp);
             }
         }
+      if (batch && !err)
+        {
+          Py_INCREF(rval);
+          PyList_SetItem(batch_rval, call_i, rval);
+        }
     }
 
   /*
@@ -900,14 +969,41 @@ CLazyLinker_call(PyObject *_self, PyObject *args, PyObject *kwds)
           Py_INCREF(Py_None);
           PyList_SetItem(self->var_value_cells[i], 0, Py_None);
         }
+      if (clear_outputs)
+        {
+          for (int j = 0; j < self->n_output_vars; ++j)
+            {
+              Py_ssize_t i = self->output_vars[j];
+              if (!self->var_has_owner[i])
+                continue;
+              Py_INCREF(Py_None);
+              PyList_SetItem(self->var_value_cells[i], 0, Py_None);
+            }
+        }
+    }
+  if (post_call_clear && !err)
+    {
+      Py_ssize_t n_post_call_clear = PyList_Size(post_call_clear);
+      for (Py_ssize_t i = 0; i < n_post_call_clear; ++i)
+        {
+          PyObject * el_i = PyList_GetItem(post_call_clear, i);
+          Py_INCREF(Py_None);
+          PyList_SetItem(el_i, 0, Py_None);
+        }
     }
   Py_DECREF(one);
   Py_DECREF(zero);
   if (err)
     {
       Py_DECREF(rval);
+      Py_XDECREF(batch_rval);
       return NULL;
     }
+  if (batch)
+    {
+      Py_DECREF(rval);
+      return batch_rval;
+    }
   return rval;
 }
 
@@ -1014,7 +1110,7 @@ static PyTypeObject lazylinker_ext_CLazyLinkerType = {
 
 static PyObject * get_version(PyObject *dummy, PyObject *args)
 {
-  PyObject *result = PyFloat_FromDouble(0.21);
+  PyObject *result = PyFloat_FromDouble(0.212);
   return result;
 }
 
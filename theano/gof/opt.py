@@ -5,8 +5,10 @@ amount of useful generic optimization tools.
 """
 from __future__ import print_function
 
+import atexit
 from collections import deque
 import copy
+import json
 import logging
 import pdb
 import sys
@@ -35,6 +37,164 @@ def _list_of_nodes(fgraph):
     return list(graph.io_toposort(fgraph.inputs, fgraph.outputs))
 
 
+def _budget_spent(fgraph):
+    """
+    Return True if the deadline set by the flag ``optimizer_budget`` for
+    the optimization of `fgraph` is passed.
+
+    """
+    deadline = getattr(fgraph, 'optimizer_deadline', None)
+    return deadline is not None and time.time() > deadline
+
+
+def _merge_sub_profiles(opt, prof1, prof2):
+    """
+    Merge two profiles of `opt`, either of which may be None if `opt` was
+    skipped because the optimization budget was spent.
+
+    """
+    if prof1 is None:
+        return prof2
+    if prof2 is None:
+        return prof1
+    assert len(prof1) == len(prof2)
+    return opt.merge_profile(prof1, prof2)
+
+
+def _opt_name(opt):
+    # str() is not safe: FromFunctionOptimizer.__str__ fails without
+    # __name__.
+    return (getattr(opt, 'name', None) or getattr(opt, '__name__', None) or
+            type(opt).__name__)
+
+
+class OptimizerStats(object):
+    """
+    Statistics of the optimizers applied in this process.
+
+    For each optimizer, it accumulates over all the graphs optimized the
+    time spent in it (including the optimizers it contains), the number of
+    times it was tried, the number of times it changed the graph and the
+    change in the number of nodes of the graph. Local optimizers are
+    recorded with the kind 'local', the other ones with the kind 'global'.
+
+    The statistics are only recorded when `enabled` is True. Unless it is
+    set explicitly, it follows the current value of the flags: it is True
+    when the flag ``optimizer_stats`` is set, or when the flag
+    ``optimizer_budget`` is, as the budget uses the payoff of the local
+    optimizers to prioritize them. Setting it to None makes it follow the
+    flags again.
+
+    """
+
+    def __init__(self, enabled=None):
+        self._enabled = enabled
+        self.clear()
+
+    @property
+    def enabled(self):
+        if self._enabled is not None:
+            return self._enabled
+        return bool(config.optimizer_stats or config.optimizer_budget > 0)
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = value
+
+    def clear(self):
+        """
+        Forget the statistics recorded so far.
+
+        """
+        # (kind, name) -> [time, attempts, successes, node delta]
+        self.stats = {}
+
+    def record(self, kind, opt, t, attempts=1, successes=0, node_delta=0):
+        """
+        Add one or more applications of `opt` that took `t` seconds.
+
+        """
+        key = (kind, _opt_name(opt))
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats[key] = [0., 0, 0, 0]
+        stat[0] += t
+        stat[1] += attempts
+        stat[2] += successes
+        stat[3] += node_delta
+
+    def payoff(self, kind, opt):
+        """
+        Return the number of successes per second of `opt` so far, or None
+        if it was never recorded.
+
+        """
+        stat = self.stats.get((kind, _opt_name(opt)))
+        if stat is None or stat[1] == 0:
+            return None
+        return stat[2] / max(stat[0], 1e-6)
+
+    def report(self):
+        """
+        Return the statistics as a list of dicts, by decreasing time.
+
+        """
+        rval = [dict(kind=kind, name=name, time=stat[0], attempts=stat[1],
+                     successes=stat[2], node_delta=stat[3])
+                for (kind, name), stat in iteritems(self.stats)]
+        rval.sort(key=lambda d: (-d['time'], d['kind'], d['name']))
+        return rval
+
+    def dump_json(self, f):
+        """
+        Write the report in JSON.
+
+        Parameters
+        ----------
+        f
+            A file name or a file object.
+
+        """
+        report = {'optimizers': self.report()}
+        if isinstance(f, string_types):
+            with open(f, 'w') as fd:
+                json.dump(report, fd, indent=1)
+        else:
+            json.dump(report, f, indent=1)
+
+    def print_summary(self, stream=sys.stderr, n_rules=None):
+        """
+        Print the report, limited to the `n_rules` slowest optimizers if
+        it is not None.
+
+        """
+        report = self.report()
+        print("Optimizer statistics (%d optimizers, %.3fs in local ones)" % (
+            len(report), sum(d['time'] for d in report
+                             if d['kind'] == 'local')), file=stream)
+        print("  <time(s)> <attempts> <successes> <node delta> <kind> <name>",
+              file=stream)
+        for d in report[:n_rules]:
+            print("  %9.3f %10d %11d %+12d  %-6s  %s" % (
+                d['time'], d['attempts'], d['successes'], d['node_delta'],
+                d['kind'], d['name']), file=stream)
+        if n_rules is not None and len(report) > n_rules:
+            print("  ... (remaining %d optimizers not shown)" % (
+                len(report) - n_rules), file=stream)
+
+
+optimizer_stats = OptimizerStats()
+
+
+def _print_optimizer_stats():
+    if config.optimizer_stats and optimizer_stats.stats:
+        optimizer_stats.print_summary()
+        if config.optimizer_stats_file:
+            optimizer_stats.dump_json(config.optimizer_stats_file)
+
+atexit.register(_print_optimizer_stats)
+
+
 class Optimizer(object):
     """
     WRITEME
@@ -83,12 +243,19 @@ class Optimizer(object):
 
         """
         self.add_requirements(fgraph)
+        # The outermost optimizer starts the budget of the graph.
+        set_deadline = (config.optimizer_budget > 0 and
+                        getattr(fgraph, 'optimizer_deadline', None) is None)
+        if set_deadline:
+            fgraph.optimizer_deadline = time.time() + config.optimizer_budget
+        orig = theano.tensor.basic.constant.enable
         try:
-            orig = theano.tensor.basic.constant.enable
             theano.tensor.basic.constant.enable = False
             ret = self.apply(fgraph, *args, **kwargs)
         finally:
             theano.tensor.basic.constant.enable = orig
+            if set_deadline:
+                del fgraph.optimizer_deadline
         return ret
 
     def __call__(self, fgraph):
@@ -225,11 +392,25 @@ class SeqOptimizer(Optimizer, list):
         nb_node_before = len(fgraph.apply_nodes)
         sub_profs = []
         for optimizer in self:
+            if _budget_spent(fgraph):
+                # Each optimizer leaves a valid graph, so we can stop here.
+                _logger.info("Optimization budget spent, skipping %s",
+                             _opt_name(optimizer))
+                l.append(0.)
+                sub_profs.append(None)
+                if fgraph.profile:
+                    sub_validate_time.append(fgraph.profile.validate_time)
+                continue
             try:
+                nb_node = len(fgraph.apply_nodes)
                 t0 = time.time()
                 sub_prof = optimizer.optimize(fgraph)
                 l.append(float(time.time() - t0))
                 sub_profs.append(sub_prof)
+                if optimizer_stats.enabled:
+                    optimizer_stats.record(
+                        'global', optimizer, l[-1],
+                        node_delta=len(fgraph.apply_nodes) - nb_node)
                 if fgraph.profile:
                     sub_validate_time.append(fgraph.profile.validate_time)
             except AssertionError:
@@ -335,9 +516,8 @@ class SeqOptimizer(Optimizer, list):
                          prof2[1][idx2])
             new_l.append(l)
             if hasattr(l, 'merge_profile'):
-                assert len(prof1[6][idx1]) == len(prof2[6][idx2])
-                new_sub_profile.append(l.merge_profile(prof1[6][idx1],
-                                                       prof2[6][idx2]))
+                new_sub_profile.append(_merge_sub_profiles(
+                    l, prof1[6][idx1], prof2[6][idx2]))
             else:
                 new_sub_profile.append(None)
 
@@ -347,9 +527,10 @@ class SeqOptimizer(Optimizer, list):
             # The set trick above only work for the same object optimization
             # It don't work for equivalent optimization.
             # So we try to merge equivalent optimization here.
-            new_l_names = [o.name for o in new_l]
-            if l.name in new_l_names:
-                idx = new_l_names.index(l.name)
+            new_l_names = [getattr(o, 'name', None) for o in new_l]
+            name = getattr(l, 'name', None)
+            if name is not None and name in new_l_names:
+                idx = new_l_names.index(name)
                 io1 = StringIO()
                 io2 = StringIO()
                 l.print_summary(io1)
@@ -361,10 +542,8 @@ class SeqOptimizer(Optimizer, list):
                         p = prof2
                     new_t[idx] += p[1][p[0].index(l)]
                     if hasattr(l, 'merge_profile'):
-                        assert len(p[6][p[0].index(l)]) == \
-                            len(new_sub_profile[idx])
-                        new_sub_profile[idx] = l.merge_profile(
-                            new_sub_profile[idx], p[6][p[0].index(l)])
+                        new_sub_profile[idx] = _merge_sub_profiles(
+                            l, new_sub_profile[idx], p[6][p[0].index(l)])
                     else:
                         new_sub_profile[idx] = None
                 continue
@@ -380,10 +559,11 @@ class SeqOptimizer(Optimizer, list):
         new_opt = SeqOptimizer(*new_l)
         # We need to assert based on the name as we merge also based on
         # the name.
-        assert set([l.name for l in prof1[0]]).issubset(
-            set([l.name for l in new_l]))
-        assert set([l.name for l in prof2[0]]).issubset(
-            set([l.name for l in new_l]))
+        new_l_names = set([getattr(l, 'name', None) for l in new_l])
+        assert set([getattr(l, 'name', None) for l in prof1[0]]).issubset(
+            new_l_names)
+        assert set([getattr(l, 'name', None) for l in prof2[0]]).issubset(
+            new_l_names)
         assert len(new_t) == len(new_opt) == len(new_sub_profile)
         return (new_opt, new_t, prof1[2] + prof2[2],
                 prof1[3] + prof2[3],
@@ -472,6 +652,11 @@ class MergeFeature(object):
     That way, the MergeOptimizer can remember the result of the last merge
     pass on the fgraph.
 
+    Distinct nodes are indexed by the type of their op and their inputs, so
+    finding the merge candidates of a node imported or modified in the
+    fgraph does not require to look at the rest of the graph. A merge pass
+    is then proportional to the number of nodes changed since the last one.
+
     """
     def on_attach(self, fgraph):
         assert not hasattr(fgraph, 'merge_feature')
@@ -489,6 +674,12 @@ class MergeFeature(object):
         self.nodes_seen = set()
         # Ordered set of distinct (not mergeable) nodes without any input
         self.noinput_nodes = OrderedSet()
+        # Index of the nodes in nodes_seen.
+        # signature -> ordered set of nodes (see `node_signature`)
+        self.sig_nodes = {}
+        # node -> signature under which it was indexed, as its inputs can
+        # have changed since.
+        self.node_sig = {}
 
         # Each element of scheduled is a list of list of (out, new_out) pairs.
         # Each list of pairs represent the substitution needed to replace all
@@ -513,9 +704,17 @@ class MergeFeature(object):
         # If inputs to node change, it is not guaranteed that it is distinct
         # from the other nodes in nodes_seen
         if node in self.nodes_seen:
-            self.nodes_seen.discard(node)
+            self.forget_node(node)
             self.process_node(fgraph, node)
 
+        # The signature of the clients of an Assert depends on its input.
+        if (i == 0 and not isinstance(node, string_types) and
+                isinstance(node.op, theano.tensor.opt.Assert)):
+            for c, _ in list(node.outputs[0].clients):
+                if c in self.nodes_seen:
+                    self.forget_node(c)
+                    self.process_node(fgraph, c)
+
         # Since we are in on_change_input, node should have inputs.
         if not isinstance(node, string_types):
             assert node.inputs
@@ -531,9 +730,7 @@ class MergeFeature(object):
         self.process_node(fgraph, node)
 
     def on_prune(self, fgraph, node, reason):
-        self.nodes_seen.discard(node)
-        if not node.inputs:
-            self.noinput_nodes.discard(node)
+        self.forget_node(node)
         for c in node.inputs:
             if isinstance(c, graph.Constant) and (len(c.clients) <= 1):
                 # This was the last node using this constant
@@ -542,6 +739,51 @@ class MergeFeature(object):
                 self.const_sig_inv.discard(sig)
                 self.seen_constants.discard(id(c))
 
+    @staticmethod
+    def node_signature(node, inputs=None):
+        """
+        Return the key under which a distinct node is indexed.
+
+        Inputs computed by an Assert are replaced by the input of the Assert,
+        as a node can be merged with a node using the asserted variable.
+
+        """
+        if inputs is None:
+            inputs = []
+            for i in node.inputs:
+                if i.owner and isinstance(i.owner.op,
+                                          theano.tensor.opt.Assert):
+                    inputs.append(i.owner.inputs[0])
+                else:
+                    inputs.append(i)
+        return (type(node.op), tuple(inputs))
+
+    def remember_node(self, node):
+        """
+        Add a distinct node to nodes_seen and to the index.
+
+        """
+        self.nodes_seen.add(node)
+        if not node.inputs:
+            self.noinput_nodes.add(node)
+        sig = self.node_signature(node)
+        self.node_sig[node] = sig
+        self.sig_nodes.setdefault(sig, OrderedSet()).add(node)
+
+    def forget_node(self, node):
+        """
+        Remove a node from nodes_seen and from the index.
+
+        """
+        self.nodes_seen.discard(node)
+        self.noinput_nodes.discard(node)
+        sig = self.node_sig.pop(node, None)
+        if sig is not None:
+            nodes = self.sig_nodes[sig]
+            nodes.discard(node)
+            if not nodes:
+                del self.sig_nodes[sig]
+
     def process_constant(self, fgraph, c):
         """
         Check if a constant can be merged, and queue that replacement.
@@ -580,8 +822,15 @@ class MergeFeature(object):
             assert len(node.inputs[0].clients) > 0
             assert (node, 0) in node.inputs[0].clients
 
-            merge_candidates = [c for (c, i) in node.inputs[0].clients
-                                if c in self.nodes_seen]
+            # Only the nodes using the same inputs as node (or asserted
+            # versions of them) can be merged with it. We look them up in
+            # the index instead of going through all the clients of the
+            # inputs, which can be numerous.
+            first_input = node.inputs[0]
+            merge_candidates = [
+                c for c in self.sig_nodes.get(
+                    self.node_signature(node, node.inputs), ())
+                if any(i is first_input for i in c.inputs)]
 
             # Put all clients of Assert inputs (if exist) into merge_candidates
             # TODO: Deactivated for now as this cause cycle in the graph.
@@ -683,9 +932,7 @@ class MergeFeature(object):
         if replacement_candidates:
             self.scheduled.append(replacement_candidates)
         else:
-            self.nodes_seen.add(node)
-            if not node.inputs:
-                self.noinput_nodes.add(node)
+            self.remember_node(node)
 
     def get_merged_assert_input(self, node, candidate):
         new_inputs = []
@@ -1208,7 +1455,13 @@ class LocalOptGroup(LocalOptimizer):
 
     def transform(self, node):
         for opt in self.opts:
-            repl = opt.transform(node)
+            if optimizer_stats.enabled:
+                t0 = time.time()
+                repl = opt.transform(node)
+                optimizer_stats.record('local', opt, time.time() - t0,
+                                       successes=int(bool(repl)))
+            else:
+                repl = opt.transform(node)
             if repl:
                 return repl
 
@@ -1747,6 +2000,20 @@ class NavigatorOptimizer(Optimizer):
 
         """
         lopt = lopt or self.local_opt
+        if not optimizer_stats.enabled:
+            return self._process_node(fgraph, node, lopt)
+        nb_node = len(fgraph.apply_nodes)
+        t0 = time.time()
+        changed = False
+        try:
+            changed = self._process_node(fgraph, node, lopt)
+        finally:
+            optimizer_stats.record(
+                'local', lopt, time.time() - t0, successes=int(changed),
+                node_delta=len(fgraph.apply_nodes) - nb_node)
+        return changed
+
+    def _process_node(self, fgraph, node, lopt):
         try:
             replacements = lopt.transform(node)
         except Exception as e:
@@ -1945,17 +2212,54 @@ class ChangeTracker:
     def __init__(self):
         self.changed = False
         self.nb_imported = 0
+        # Nodes imported, pruned or whose inputs changed since the last call
+        # to pop_nodes_changed. For pruned nodes, we keep the owners of
+        # their inputs, as those lost a client.
+        self.nodes_changed = set()
 
     def on_import(self, fgraph, node, reason):
         self.nb_imported += 1
         self.changed = True
+        self.nodes_changed.add(node)
 
     def on_change_input(self, fgraph, node, i, r, new_r, reason):
         self.changed = True
+        if not isinstance(node, string_types):
+            self.nodes_changed.add(node)
+        if r.owner:
+            self.nodes_changed.add(r.owner)
+
+    def on_prune(self, fgraph, node, reason):
+        for r in node.inputs:
+            if r.owner:
+                self.nodes_changed.add(r.owner)
 
     def reset(self):
         self.changed = False
 
+    def pop_nodes_changed(self, fgraph):
+        """
+        Return the nodes of fgraph near a change since the last call.
+
+        Those are the nodes changed, their clients and the nodes computing
+        their inputs.
+
+        """
+        nodes = set()
+        for node in self.nodes_changed:
+            if node not in fgraph.apply_nodes:
+                continue
+            nodes.add(node)
+            for r in node.inputs:
+                if r.owner:
+                    nodes.add(r.owner)
+            for r in node.outputs:
+                for c, _ in r.clients:
+                    if not isinstance(c, string_types):
+                        nodes.add(c)
+        self.nodes_changed = set()
+        return nodes
+
     def on_attach(self, fgraph):
         fgraph.change_tracker = self
 
@@ -1973,6 +2277,17 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         times.
     ignore_newtrees
         See EquilibriumDB ignore_newtrees parameter definition.
+    incremental_passes
+        If True, after the first pass, local optimizers are only applied to
+        the nodes near the changes made by the previous pass. A full pass is
+        still done before stopping, to make sure the equilibrium is reached.
+
+    Notes
+    -----
+    The local optimizers to try on a node are looked up from the class and
+    the instance of its op, through the ones returned by their `tracks`
+    method. Local optimizers whose `tracks` returns None are tried on all
+    nodes.
 
     """
 
@@ -1981,7 +2296,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                  failure_callback=None,
                  ignore_newtrees=True,
                  max_use_ratio=None,
-                 final_optimizers=None):
+                 final_optimizers=None,
+                 incremental_passes=False):
         super(EquilibriumOptimizer, self).__init__(
             None,
             ignore_newtrees=ignore_newtrees,
@@ -2005,6 +2321,29 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         self.max_use_ratio = max_use_ratio
         assert self.max_use_ratio is not None, (
             'max_use_ratio has to be a number')
+        self.incremental_passes = incremental_passes
+        # type(op) -> local optimizers to try on nodes with such an op
+        self._type_optimizers = {}
+
+    def get_node_optimizers(self, node):
+        """
+        Return the list of local optimizers to try on node.
+
+        """
+        op = node.op
+        lopts = self._type_optimizers.get(type(op))
+        if lopts is None:
+            lopts = (self.local_optimizers_all +
+                     self.local_optimizers_map.get(type(op), []))
+            self._type_optimizers[type(op)] = lopts
+        try:
+            instance_lopts = self.local_optimizers_map.get(op)
+        except TypeError:
+            # Unhashable op, it can't be tracked by instance.
+            instance_lopts = None
+        if instance_lopts:
+            return lopts + instance_lopts
+        return lopts
 
     def get_local_optimizers(self):
         for opt in self.local_optimizers_all:
@@ -2052,14 +2391,35 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         node_created = {}
         global_sub_profs = []
         final_sub_profs = []
+        nb_attempts = {}
         for opt in (self.global_optimizers +
                     list(self.get_local_optimizers()) +
                     self.final_optimizers):
             global_process_count.setdefault(opt, 0)
             time_opts.setdefault(opt, 0)
             node_created.setdefault(opt, 0)
+            nb_attempts.setdefault(opt, 0)
+        full_pass = True
+
+        get_node_optimizers = self.get_node_optimizers
+        if getattr(fgraph, 'optimizer_deadline', None) is not None:
+            # With a time budget, try first the local optimizers that
+            # succeeded the most per second spent in them so far, and the
+            # ones never tried.
+            priority = {}
+            for lopt in self.get_local_optimizers():
+                payoff = optimizer_stats.payoff('local', lopt)
+                priority[lopt] = -numpy.inf if payoff is None else -payoff
+
+            def get_node_optimizers(node):
+                return sorted(self.get_node_optimizers(node),
+                              key=priority.__getitem__)
 
         while changed and not max_use_abort:
+            if _budget_spent(fgraph):
+                _logger.info("Optimization budget spent, stopping %s",
+                             _opt_name(self))
+                break
             process_count = {}
             t0 = time.time()
             changed = False
@@ -2069,10 +2429,16 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             for gopt in self.global_optimizers:
                 change_tracker.reset()
                 nb = change_tracker.nb_imported
+                nb_node = len(fgraph.apply_nodes)
                 t_opt = time.time()
                 sub_prof = gopt.apply(fgraph)
                 time_opts[gopt] += time.time() - t_opt
                 sub_profs.append(sub_prof)
+                if optimizer_stats.enabled:
+                    optimizer_stats.record(
+                        'global', gopt, time.time() - t_opt,
+                        successes=int(change_tracker.changed),
+                        node_delta=len(fgraph.apply_nodes) - nb_node)
                 if change_tracker.changed:
                     process_count.setdefault(gopt, 0)
                     process_count[gopt] += 1
@@ -2089,7 +2455,11 @@ class EquilibriumOptimizer(NavigatorOptimizer):
 
             # apply local optimizer
             topo_t0 = time.time()
-            q = deque(graph.io_toposort(fgraph.inputs, start_from))
+            nodes_changed = change_tracker.pop_nodes_changed(fgraph)
+            q = graph.io_toposort(fgraph.inputs, start_from)
+            if not full_pass:
+                q = [n for n in q if n in nodes_changed]
+            q = deque(q)
             io_toposort_timing.append(time.time() - topo_t0)
 
             nb_nodes.append(len(q))
@@ -2109,17 +2479,16 @@ class EquilibriumOptimizer(NavigatorOptimizer):
 
             u = self.attach_updater(fgraph, importer, pruner)
             try:
-                while q:
+                while q and not _budget_spent(fgraph):
                     node = q.pop()
                     current_node = node
 
-                    for lopt in (self.local_optimizers_all +
-                                 self.local_optimizers_map.get(type(node.op), []) +
-                                 self.local_optimizers_map.get(node.op, [])):
+                    for lopt in get_node_optimizers(node):
                         nb = change_tracker.nb_imported
                         t_opt = time.time()
                         lopt_change = self.process_node(fgraph, node, lopt)
                         time_opts[lopt] += time.time() - t_opt
+                        nb_attempts[lopt] += 1
                         if lopt_change:
                             process_count.setdefault(lopt, 0)
                             process_count[lopt] += 1
@@ -2142,10 +2511,16 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             for gopt in self.final_optimizers:
                 change_tracker.reset()
                 nb = change_tracker.nb_imported
+                nb_node = len(fgraph.apply_nodes)
                 t_opt = time.time()
                 sub_prof = gopt.apply(fgraph)
                 time_opts[gopt] += time.time() - t_opt
                 sub_profs.append(sub_prof)
+                if optimizer_stats.enabled:
+                    optimizer_stats.record(
+                        'global', gopt, time.time() - t_opt,
+                        successes=int(change_tracker.changed),
+                        node_delta=len(fgraph.apply_nodes) - nb_node)
                 if change_tracker.changed:
                     process_count.setdefault(gopt, 0)
                     process_count[gopt] += 1
@@ -2163,6 +2538,16 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             loop_process_count.append(process_count)
             loop_timing.append(float(time.time() - t0))
 
+            if self.incremental_passes:
+                if changed:
+                    full_pass = False
+                elif not full_pass:
+                    # Nothing changed near the last changes, but a full
+                    # pass is needed to know that the equilibrium is
+                    # reached.
+                    changed = True
+                    full_pass = True
+
         end_nb_nodes = len(fgraph.apply_nodes)
 
         if max_use_abort:
@@ -2174,7 +2559,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         return (self, loop_timing, loop_process_count,
                 (start_nb_nodes, end_nb_nodes, max_nb_nodes),
                 global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
-                node_created, global_sub_profs, final_sub_profs)
+                node_created, global_sub_profs, final_sub_profs, nb_attempts)
 
     def print_summary(self, stream=sys.stdout, level=0, depth=-1):
         name = getattr(self, 'name', None)
@@ -2190,7 +2575,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         (opt, loop_timing, loop_process_count,
          (start_nb_nodes, end_nb_nodes, max_nb_nodes),
          global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
-         node_created, global_sub_profs, final_sub_profs) = prof
+         node_created, global_sub_profs, final_sub_profs, nb_attempts) = prof
 
         blanc = ('    ' * level)
         print(blanc, "EquilibriumOptimizer", end=' ', file=stream)
@@ -2239,26 +2624,29 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         for o, count in iteritems(process_count):
             if count > 0:
                 count_opt.append((time_opts[o], count,
+                                  nb_attempts.get(o, 0),
                                   node_created[o], o))
             else:
-                not_used.append((time_opts[o], o))
+                not_used.append((time_opts[o], nb_attempts.get(o, 0), o))
                 not_used_time += time_opts[o]
 
         if count_opt:
             print(blanc,
-                  '  times - times applied - nb node created - name:',
+                  '  times - times applied - times tried - '
+                  'nb node created - name:',
                   file=stream)
             count_opt.sort()
-            for (t, count, n_created, o) in count_opt[::-1]:
-                print(blanc, '  %.3fs - %d - %d - %s' % (
-                    t, count, n_created, o), file=stream)
+            for (t, count, n_tried, n_created, o) in count_opt[::-1]:
+                print(blanc, '  %.3fs - %d - %d - %d - %s' % (
+                    t, count, n_tried, n_created, o), file=stream)
             print(blanc, '  %.3fs - in %d optimization that where not used (display only those with a runtime > 0)' % (
                 not_used_time, len(not_used)), file=stream)
             not_used.sort()
-            for (t, o) in not_used[::-1]:
+            for (t, n_tried, o) in not_used[::-1]:
                 if t > 0:
                     # Skip opt that have 0 times, they probably wasn't even tried.
-                    print(blanc + "  ", '  %.3fs - %s' % (t, o), file=stream)
+                    print(blanc + "  ", '  %.3fs - %d tried - %s' % (
+                        t, n_tried, o), file=stream)
             print(file=stream)
         gf_opts = [o for o in (opt.global_optimizers +
                                list(opt.final_optimizers))
@@ -2344,6 +2732,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         node_created = merge_dict(prof1[8], prof2[8])
         global_sub_profs = merge_list(prof1[9], prof2[9])
         final_sub_profs = merge_list(prof1[10], prof2[10])
+        nb_attempts = merge_dict(prof1[11], prof2[11])
         return (new_opt,
                 loop_timing,
                 loop_process_count,
@@ -2354,7 +2743,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 io_toposort_timing,
                 node_created,
                 global_sub_profs,
-                final_sub_profs)
+                final_sub_profs,
+                nb_attempts)
 
 #################
 #   Utilities   #
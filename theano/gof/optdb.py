@@ -7,7 +7,7 @@ from theano.compat import DefaultOrderedDict
 from theano.misc.ordered_set import OrderedSet
 from six import StringIO
 from theano.gof import opt
-from theano.configparser import AddConfigVar, FloatParam
+from theano.configparser import AddConfigVar, BoolParam, FloatParam
 from theano import config
 
 AddConfigVar('optdb.position_cutoff',
@@ -19,6 +19,12 @@ AddConfigVar('optdb.max_use_ratio',
              'A ratio that prevent infinite loop in EquilibriumOptimizer.',
              FloatParam(5),
              in_c_key=False)
+AddConfigVar('optdb.incremental_passes',
+             'If True, the passes of EquilibriumOptimizer after the first one'
+             ' only apply local optimizations near the nodes changed by the'
+             ' previous pass.',
+             BoolParam(True),
+             in_c_key=False)
 
 
 class DB(object):
@@ -263,7 +269,8 @@ class EquilibriumDB(DB):
             max_use_ratio=config.optdb.max_use_ratio,
             ignore_newtrees=self.ignore_newtrees,
             failure_callback=opt.NavigatorOptimizer.warn_inplace,
-            final_optimizers=final_opts)
+            final_optimizers=final_opts,
+            incremental_passes=config.optdb.incremental_passes)
 
 
 class SequenceDB(DB):
@@ -1,6 +1,7 @@
 from collections import defaultdict
+import numpy
 from six import iteritems
-from theano.gof.graph import list_of_nodes
+from theano.gof.graph import list_of_nodes, Constant
 from theano.compat import cmp
 
 # {{{ http://code.activestate.com/recipes/578231/ (r1)
@@ -270,3 +271,199 @@ def key_to_cmp(key):
     def key_cmp(a, b):
         return cmp(key(a), key(b))
     return key_cmp
+
+
+def static_size_fn(fgraph, unknown_dim=100):
+    """
+    Make a function estimating the size in bytes of a variable of `fgraph`.
+
+    The dimensions that are broadcastable or known constants in the
+    ShapeFeature of `fgraph` (if it has one) are used, and the other ones
+    are assumed to be `unknown_dim`.
+
+    """
+    shape_feature = getattr(fgraph, 'shape_feature', None)
+
+    def size(var):
+        dtype = getattr(var.type, 'dtype', None)
+        ndim = getattr(var.type, 'ndim', None)
+        if dtype is None or ndim is None:
+            return 0
+        shape = [unknown_dim] * ndim
+        for i, b in enumerate(getattr(var.type, 'broadcastable', ())):
+            if b:
+                shape[i] = 1
+        if shape_feature is not None and var in shape_feature.shape_of:
+            for i, d in enumerate(shape_feature.shape_of[var] or ()):
+                if isinstance(d, Constant):
+                    shape[i] = int(d.data)
+        return numpy.dtype(dtype).itemsize * int(numpy.prod(shape))
+    return size
+
+
+def memory_minimizing_order(fgraph, size_fn=None, lookahead=1,
+                            max_candidates=8):
+    """
+    Order the nodes of `fgraph` to keep the peak memory of the
+    intermediate results low.
+
+    This is a list scheduling: among the nodes whose dependencies (including
+    the orderings of `fgraph`, e.g. from the destroy handler) have been
+    executed, it picks the one giving the lowest peak over the next
+    `lookahead` + 1 steps, then the lowest memory in use after them.
+    Ties keep the order of `fgraph.toposort()`. An intermediate result is
+    freed when all its clients and those of its views have run. Outputs
+    that are views or destroy an input (view_map and destroy_map) use the
+    memory of that input.
+
+    Parameters
+    ----------
+    fgraph
+        The FunctionGraph to order.
+    size_fn
+        Function returning the estimated size of a variable. By default,
+        `static_size_fn(fgraph)`.
+    lookahead
+        Number of steps to look ahead of each choice.
+    max_candidates
+        When more nodes than this can be executed, only the ones giving
+        the lowest memory after one step are searched further.
+
+    Returns
+    -------
+    list
+        The nodes of `fgraph` in a valid execution order.
+
+    """
+    order = fgraph.toposort()
+    if size_fn is None:
+        size_fn = static_size_fn(fgraph)
+    position = dict((node, i) for i, node in enumerate(order))
+    ords = fgraph.orderings()
+
+    succs = dict((node, []) for node in order)
+    n_preds = {}
+    for node in order:
+        preds = set(i.owner for i in node.inputs if i.owner in position)
+        preds.update(ords.get(node, ()))
+        n_preds[node] = len(preds)
+        for pred in preds:
+            succs[pred].append(node)
+
+    # The variable owning the memory of each variable, and its size.
+    root = {}
+    size = {}
+    for var in fgraph.inputs:
+        root[var] = var
+        size[var] = 0
+    for node in order:
+        for var in node.inputs:
+            if var.owner is None and var not in root:
+                root[var] = var
+                size[var] = 0
+        view_map = getattr(node.op, 'view_map', {})
+        destroy_map = getattr(node.op, 'destroy_map', {})
+        for i, out in enumerate(node.outputs):
+            aliased = view_map.get(i) or destroy_map.get(i)
+            if aliased:
+                root[out] = root[node.inputs[aliased[0]]]
+            else:
+                root[out] = out
+                size[out] = size_fn(out)
+    # The number of clients left of each memory owner and its views.
+    users_left = dict((r, 0) for r in size)
+    for node in order:
+        for var in node.inputs:
+            users_left[root[var]] += 1
+    pinned = set(root[var] for var in fgraph.outputs)
+
+    ready = [node for node in order if n_preds[node] == 0]
+
+    def run(node):
+        # Update the state as if node was executed, and return the memory
+        # it allocates and the memory freed after it.
+        alloc = sum(size[o] for o in node.outputs if root[o] is o)
+        freed = 0
+        for var in node.inputs:
+            r = root[var]
+            users_left[r] -= 1
+            if users_left[r] == 0 and r not in pinned:
+                freed += size[r]
+        for o in node.outputs:
+            if root[o] is o and users_left[o] == 0 and o not in pinned:
+                freed += size[o]
+        ready.remove(node)
+        for succ in succs[node]:
+            n_preds[succ] -= 1
+            if n_preds[succ] == 0:
+                ready.append(succ)
+        return alloc, freed
+
+    def undo(node):
+        for succ in succs[node]:
+            if n_preds[succ] == 0:
+                ready.remove(succ)
+            n_preds[succ] += 1
+        ready.append(node)
+        for var in node.inputs:
+            users_left[root[var]] += 1
+
+    def candidates():
+        if len(ready) <= max_candidates:
+            return list(ready)
+        scores = []
+        for node in list(ready):
+            alloc, freed = run(node)
+            undo(node)
+            scores.append((alloc - freed, position[node], node))
+        scores.sort()
+        return [node for _, _, node in scores[:max_candidates]]
+
+    def search(live, depth):
+        # Return (peak, memory after, position, node) for the best node.
+        best = None
+        for node in candidates():
+            alloc, freed = run(node)
+            peak = live + alloc
+            after = peak - freed
+            if depth and ready:
+                sub = search(after, depth - 1)
+                key = (max(peak, sub[0]), sub[1], position[node], node)
+            else:
+                key = (peak, after, position[node], node)
+            undo(node)
+            if best is None or key[:3] < best[:3]:
+                best = key
+        return best
+
+    result = []
+    live = 0
+    while ready:
+        node = search(live, lookahead)[3]
+        alloc, freed = run(node)
+        live += alloc - freed
+        result.append(node)
+    assert len(result) == len(order)
+    return result
+
+
+def memory_schedule_fn(size_fn=None, lookahead=1, max_candidates=8):
+    """
+    Make a schedule function ordering the nodes to reduce the peak memory.
+
+    It can be given to a Linker, e.g. ``VM_Linker(schedule=...)``.
+
+    See Also
+    --------
+    memory_minimizing_order
+
+    """
+    def schedule(fgraph):
+        """
+        Order nodes in a FunctionGraph.
+
+        """
+        return memory_minimizing_order(fgraph, size_fn=size_fn,
+                                       lookahead=lookahead,
+                                       max_candidates=max_candidates)
+    return schedule
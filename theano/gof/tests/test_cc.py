@@ -6,7 +6,9 @@ import numpy
 
 import theano
 from theano.gof.link import PerformLinker
-from theano.gof.cc import CLinker, DualLinker, OpWiseCLinker
+from theano.gof.cc import (CLinker, DualLinker, OpWiseCLinker,
+                           get_module_cache, may_use_c_thunk, node_clinkers,
+                           precompile_nodes)
 from theano.gof.type import Type
 from theano.gof.graph import Variable, Apply, Constant
 from theano.gof.op import Op
@@ -262,6 +264,35 @@ def test_opwiseclinker_straightforward():
         assert fn(2.0, 2.0, 2.0) == -6
 
 
+def test_opwiseclinker_parallel_compilation():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x, y, z = inputs()
+    e = add(mul(add(x, y), div(x, y)), bad_sub(bad_sub(x, y), z))
+    orig_workers = theano.config.cmodule.compilation_workers
+    try:
+        theano.config.cmodule.compilation_workers = 4
+        lnk = OpWiseCLinker().accept(Env([x, y, z], [e]))
+        fn = lnk.make_function()
+        assert fn(2.0, 2.0, 2.0) == 2.0
+    finally:
+        theano.config.cmodule.compilation_workers = orig_workers
+
+
+def test_precompile_elemwise():
+    # Elemwise ops are OpenMPOps, whose make_thunk only updates the openmp
+    # flag, so their modules are compiled concurrently too.
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = theano.tensor.dvector('x')
+    node = theano.tensor.exp(x).owner
+    assert isinstance(node.op, theano.tensor.Elemwise)
+    assert may_use_c_thunk(node)
+    (_, key, _), = node_clinkers([node])
+    precompile_nodes([node], n_workers=2)
+    assert key in get_module_cache().entry_from_key
+
+
 def test_opwiseclinker_constant():
     x, y, z = inputs()
     x = Constant(tdouble, 7.2, name='x')
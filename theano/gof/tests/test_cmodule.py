@@ -4,10 +4,16 @@ But this one tests a current behavior that isn't good: the c_code isn't
 deterministic based on the input type and the op.
 
 """
+import os
+import shutil
+import tempfile
+
 import numpy
 
 import theano
-from theano.gof.cmodule import GCC_compiler
+from theano.gof.cmodule import GCC_compiler, KeyData, ModuleCache
+from theano.gof import compilelock
+from theano.gof.compilelock import module_lock_ctx
 
 
 class MyOp(theano.compile.ops.DeepCopyOp):
@@ -67,3 +73,92 @@ def test_flag_detection():
     # but was not detected because that path is not usually taken,
     # so we test it here directly.
     GCC_compiler.try_flags(["-lblas"])
+
+
+def test_module_cache_index():
+    # Check that refresh() records the KeyData in the index and that another
+    # ModuleCache trusts it, and sees the records added later.
+    dirname = tempfile.mkdtemp()
+    try:
+        subdir = os.path.join(dirname, 'tmp_index_test')
+        os.mkdir(subdir)
+        entry = os.path.join(subdir, 'm_index_test.so')
+        open(entry, 'w').close()
+        # Keys in the layout produced by CLinker.cmodule_key.
+        key = ((1,), ('CLinker.cmodule_key', 'md5:abc', 'node_abc'))
+        key_data = KeyData(keys=set([key]), module_hash='index_test_hash',
+                           key_pkl=os.path.join(subdir, 'key.pkl'),
+                           entry=entry)
+        key_data.save_pkl()
+
+        cache = ModuleCache(dirname, check_for_broken_eq=False)
+        assert cache.entry_from_key[key] == entry
+        assert os.path.exists(os.path.join(dirname, 'index.sqlite'))
+
+        # The key.pkl file is not read for an indexed directory.
+        os.remove(key_data.key_pkl)
+        cache = ModuleCache(dirname, check_for_broken_eq=False,
+                            do_refresh=False)
+        cache._read_index()
+        assert 'tmp_index_test' in cache.index_records
+        cache.refresh()
+        assert cache.entry_from_key[key] == entry
+
+        # A key added to the module is recorded in the index.
+        other_key = ((1,), ('CLinker.cmodule_key', 'md5:abc', 'node_def'))
+        key_data.add_key(other_key)
+        cache._index_key_data(key_data)
+        cache = ModuleCache(dirname, check_for_broken_eq=False)
+        assert cache.entry_from_key[other_key] == entry
+
+        # The record of a removed directory is deleted.
+        shutil.rmtree(subdir)
+        cache.refresh()
+        assert key not in cache.entry_from_key
+        cache = ModuleCache(dirname, check_for_broken_eq=False,
+                            do_refresh=False)
+        cache._read_index()
+        assert 'tmp_index_test' not in cache.index_records
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_module_lock_ctx():
+    # Module locks are independent from each other, and taking a lock
+    # already held by this process does not block.
+    lock_base = tempfile.mkdtemp()
+    try:
+        lock_a = os.path.join(lock_base, 'module_a')
+        lock_b = os.path.join(lock_base, 'module_b')
+        with module_lock_ctx('module_a', lock_base=lock_base):
+            assert os.path.isdir(lock_a)
+            with module_lock_ctx('module_a', lock_base=lock_base):
+                with module_lock_ctx('module_b', lock_base=lock_base):
+                    assert os.path.isdir(lock_b)
+                assert not os.path.exists(lock_b)
+            assert os.path.isdir(lock_a)
+        assert not os.path.exists(lock_a)
+    finally:
+        shutil.rmtree(lock_base)
+
+
+def test_module_lock_refresh():
+    # Module locks held for a long time are refreshed by a background
+    # thread, and forgotten once released.
+    lock_base = tempfile.mkdtemp()
+    try:
+        lock_file = os.path.join(lock_base, 'module_a', 'lock')
+        with module_lock_ctx('module_a', lock_base=lock_base):
+            refresher = compilelock._module_locks_refresher[0]
+            assert refresher is not None and refresher.is_alive()
+            with open(lock_file) as f:
+                owner = f.read()
+            with compilelock._module_locks_lock:
+                state = compilelock._module_locks[os.path.dirname(lock_file)]
+                state[1] -= theano.config.compile.timeout
+                compilelock._refresh_module_locks()
+            with open(lock_file) as f:
+                assert f.read() != owner
+        assert not compilelock._module_locks
+    finally:
+        shutil.rmtree(lock_base)
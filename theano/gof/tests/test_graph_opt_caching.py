@@ -1,4 +1,5 @@
 import os
+import shutil
 import numpy
 import theano
 import theano.tensor as T
@@ -7,8 +8,9 @@ floatX = 'float32'
 
 
 def test_graph_opt_caching():
-    opt_db_file = theano.config.compiledir + '/optimized_graphs.pkl'
-    os.system('rm %s' % opt_db_file)
+    opt_db_dir = os.path.join(theano.config.compiledir, 'optimized_graphs')
+    if os.path.isdir(opt_db_dir):
+        shutil.rmtree(opt_db_dir)
 
     mode = theano.config.mode
     if mode in ["DEBUG_MODE", "DebugMode"]:
@@ -22,17 +24,58 @@ def test_graph_opt_caching():
         d = theano.shared(numpy.ones((10, 10), dtype=floatX))
         e = T.sum(T.sum(T.sum(a ** 2 + b) + c) + d)
         f1 = theano.function([a, b], e, mode=mode)
+        assert len(os.listdir(opt_db_dir)) == 1
 
+        # Same structure, different names: this must hit the cache
+        # instead of adding a new entry.
         m = T.fmatrix('x1')
         n = T.fmatrix('x2')
         p = theano.shared(numpy.ones((10, 10), dtype=floatX))
         q = theano.shared(numpy.ones((10, 10), dtype=floatX))
         j = T.sum(T.sum(T.sum(m ** 2 + n) + p) + q)
         f2 = theano.function([m, n], j, mode=mode)
+        assert len(os.listdir(opt_db_dir)) == 1
 
         in1 = numpy.ones((10, 10), dtype=floatX)
         in2 = numpy.ones((10, 10), dtype=floatX)
         assert f1(in1, in2) == f2(in1, in2)
+
+        # A different graph gets its own entry.
+        f3 = theano.function([a, b], T.sum(a * b), mode=mode)
+        assert len(os.listdir(opt_db_dir)) == 2
+        assert numpy.allclose(f3(in1, in2), 100)
+
+        # The values of the shared variables are not stored in the entries,
+        # and a hit uses the shared variables of the new graph.
+        w = theano.shared(numpy.ones((1000, 1000), dtype=floatX))
+        f4 = theano.function([a], T.sum(T.dot(a, w[:10, :10])), mode=mode)
+        assert len(os.listdir(opt_db_dir)) == 3
+        for entry in os.listdir(opt_db_dir):
+            assert os.path.getsize(os.path.join(opt_db_dir, entry)) < 1e6
+        w2 = theano.shared(2 * numpy.ones((1000, 1000), dtype=floatX))
+        f5 = theano.function([a], T.sum(T.dot(a, w2[:10, :10])), mode=mode)
+        assert len(os.listdir(opt_db_dir)) == 3
+        assert numpy.allclose(f4(in1), 1000)
+        assert numpy.allclose(f5(in1), 2000)
+    finally:
+        theano.config.cache_optimizations = default
+
+
+def test_graph_opt_caching_custom_optimizer():
+    # Optimizers that are not given by name or Query have no deterministic
+    # description, so their graphs are not cached.
+    opt_db_dir = os.path.join(theano.config.compiledir, 'optimized_graphs')
+    if os.path.isdir(opt_db_dir):
+        shutil.rmtree(opt_db_dir)
+    default = theano.config.cache_optimizations
+    try:
+        theano.config.cache_optimizations = True
+        a = T.fmatrix('a')
+        mode = theano.compile.Mode(optimizer=theano.gof.MergeOptimizer())
+        f = theano.function([a], a + a, mode=mode)
+        assert not os.path.isdir(opt_db_dir) or not os.listdir(opt_db_dir)
+        in1 = numpy.ones((10, 10), dtype=floatX)
+        assert numpy.allclose(f(in1), 2)
     finally:
         theano.config.cache_optimizations = default
 
@@ -1,3 +1,6 @@
+import time
+
+from six.moves import StringIO
 
 from theano.gof.type import Type
 from theano.gof.graph import Variable, Apply, Constant
@@ -510,6 +513,27 @@ class TestMergeOptimizer:
                         if isinstance(n.op, NoInputOp)]
         assert len(no_input_ops) == 2, fg.apply_nodes
 
+    def test_merge_incremental(self):
+        # Check that the index of distinct nodes follows the changes made
+        # to the graph between two merge passes.
+        x, y, z = inputs()
+        e1 = op2(x, y)
+        e2 = op1(op2(x, z), e1)
+        g = FunctionGraph([x, y, z], [e1, e2])
+        MergeOptimizer().optimize(g)
+        feature = g.merge_feature
+        assert set(feature.node_sig) == set(g.apply_nodes)
+        assert sum(len(v) for v in feature.sig_nodes.values()) == 3
+
+        # After this, Op2(x, z) is a duplicate of Op2(x, y). The graph
+        # holds clones of x, y and z.
+        gx, gy, gz = g.inputs
+        g.replace(gz, gy)
+        MergeOptimizer().optimize(g)
+        assert len(g.apply_nodes) == 2, str(g)
+        assert set(feature.node_sig) == set(g.apply_nodes)
+        assert sum(len(v) for v in feature.sig_nodes.values()) == 2
+
 
 class TestEquilibrium(object):
 
@@ -544,6 +568,28 @@ class TestEquilibrium(object):
         opt.optimize(g)
         assert str(g) == '[Op2(x, y)]'
 
+    def test_incremental_passes(self):
+        x, y, z = map(MyVariable, 'xyz')
+        # op2(x, z) is not changed and should only be visited by the first
+        # pass and the last full one.
+        e = op1(op1(op3(x, y)), op2(x, z))
+        g = FunctionGraph([x, y, z], [e])
+        lopts = [PatternSub((op3, 'x', 'y'), (op4, 'x', 'y')),
+                 PatternSub((op4, 'x', 'y'), (op5, 'x', 'y')),
+                 PatternSub((op5, 'x', 'y'), (op6, 'x', 'y')),
+                 PatternSub((op2, (op5, 'x', 'y'), 'z'), (op2, 'x', 'z'))]
+        opt = EquilibriumOptimizer(lopts, max_use_ratio=10,
+                                   incremental_passes=True)
+        prof = opt.optimize(g)
+        assert str(g) == '[Op1(Op1(Op6(x, y)), Op2(x, z))]', str(g)
+        nb_attempts = prof[-1]
+        # The rules only tracking op3, op4 and op5 are not tried on the
+        # other nodes.
+        assert nb_attempts[lopts[0]] == 1
+        assert nb_attempts[lopts[3]] == 2, nb_attempts[lopts[3]]
+        loop_process_count = prof[2]
+        assert sum(c.get(lopts[0], 0) for c in loop_process_count) == 1
+
     def test_low_use_ratio(self):
         x, y, z = map(MyVariable, 'xyz')
         e = op3(op4(x, y))
@@ -583,3 +629,139 @@ def test_pre_constant_merge_slice():
 
     # Make sure constant of slice signature is hashable.
     hash(cst.signature())
+
+
+def test_optimizer_stats():
+    x, y, z = inputs()
+    g = FunctionGraph([x, y, z], [op1(op2(x), op3(y))])
+    lopt = PatternSub((op1, (op2, 'x'), 'y'), (op4, 'x', 'y'))
+    lopt.__name__ = 'op1_op2_to_op4'
+    topo = TopoOptimizer(lopt)
+    topo.name = 'topo_op4'
+
+    enabled = optimizer_stats._enabled
+    stats = optimizer_stats.stats
+    optimizer_stats.enabled = True
+    optimizer_stats.clear()
+    try:
+        SeqOptimizer([topo]).optimize(g)
+        report = dict(((d['kind'], d['name']), d)
+                      for d in optimizer_stats.report())
+        f = StringIO()
+        optimizer_stats.dump_json(f)
+        optimizer_stats.print_summary(f)
+    finally:
+        optimizer_stats.enabled = enabled
+        optimizer_stats.stats = stats
+    assert str(g) == "[Op4(x, Op3(y))]"
+
+    local = report[('local', 'op1_op2_to_op4')]
+    assert local['attempts'] >= 1
+    assert local['successes'] == 1
+    assert local['node_delta'] == -1
+    glob = report[('global', 'topo_op4')]
+    assert glob['attempts'] == 1
+    assert glob['node_delta'] == -1
+    assert glob['time'] >= local['time']
+    assert 'op1_op2_to_op4' in f.getvalue()
+
+
+def test_optimizer_stats_unnamed():
+    # Optimizers without a name are recorded under their class name.
+    x, y, z = inputs()
+    g = FunctionGraph([x, y, z], [op1(x)])
+
+    def apply(fgraph):
+        pass
+
+    enabled = optimizer_stats._enabled
+    stats = optimizer_stats.stats
+    optimizer_stats.enabled = True
+    optimizer_stats.clear()
+    try:
+        SeqOptimizer([FromFunctionOptimizer(apply),
+                      TopoOptimizer(OpSub(op1, op2))]).optimize(g)
+        names = set((d['kind'], d['name'])
+                    for d in optimizer_stats.report())
+    finally:
+        optimizer_stats.enabled = enabled
+        optimizer_stats.stats = stats
+    assert str(g) == "[Op2(x)]"
+    assert ('global', 'FromFunctionOptimizer') in names
+    assert ('global', 'TopoOptimizer') in names
+    assert ('local', 'OpSub') in names
+
+
+@theano.configparser.change_flags(optimizer_budget=0.01)
+def test_optimizer_budget():
+    x, y, z = inputs()
+    g = FunctionGraph([x, y, z], [op1(x)])
+    applied = []
+
+    def slow_opt(fgraph):
+        applied.append('slow_opt')
+        time.sleep(0.05)
+
+    SeqOptimizer([FromFunctionOptimizer(slow_opt),
+                  OpSubOptimizer(op1, op2)]).optimize(g)
+    # The budget was spent by the first optimizer.
+    assert applied == ['slow_opt']
+    assert str(g) == "[Op1(x)]"
+    assert not hasattr(g, 'optimizer_deadline')
+
+
+def test_merge_profile_skipped_optimizer():
+    # A sub-optimizer skipped because the budget was spent has no profile.
+    x, y, z = inputs()
+    g = FunctionGraph([x, y, z], [op1(x)])
+    # Profiles are merged in profiling mode, where the graph has a profile.
+    g.profile = theano.ProfileStats(False)
+    inner = SeqOptimizer([OpSubOptimizer(op1, op2)])
+    opt = SeqOptimizer([inner])
+    prof = opt.optimize(g)
+    skipped = prof[:6] + ([None],) + prof[7:]
+    for prof1, prof2 in [(prof, skipped), (skipped, prof)]:
+        merged = SeqOptimizer.merge_profile(prof1, prof2)
+        assert merged[6] == [prof[6][0]]
+
+
+def test_optimizer_stats_follow_flags():
+    # The flags are checked when recording, not when theano is imported.
+    change_flags = theano.configparser.change_flags
+
+    def enabled():
+        return optimizer_stats.enabled
+
+    old_enabled = optimizer_stats._enabled
+    optimizer_stats.enabled = None
+    try:
+        assert change_flags(optimizer_stats=True,
+                            optimizer_budget=0.)(enabled)()
+        assert change_flags(optimizer_stats=False,
+                            optimizer_budget=1.)(enabled)()
+        assert not change_flags(optimizer_stats=False,
+                                optimizer_budget=0.)(enabled)()
+    finally:
+        optimizer_stats.enabled = old_enabled
+
+
+@theano.configparser.change_flags(optimizer_budget=10.)
+def test_optimizer_budget_payoff():
+    # With a budget, the local optimizer with the highest payoff so far is
+    # tried first.
+    x, y, z = inputs()
+    g = FunctionGraph([x, y, z], [op1(x)])
+    low = PatternSub((op1, 'x'), (op2, 'x'))
+    low.__name__ = 'op1_to_op2'
+    high = PatternSub((op1, 'x'), (op3, 'x'))
+    high.__name__ = 'op1_to_op3'
+
+    stats = optimizer_stats.stats
+    optimizer_stats.clear()
+    try:
+        optimizer_stats.record('local', low, 1., successes=1)
+        optimizer_stats.record('local', high, 1., successes=10)
+        EquilibriumOptimizer([low, high], max_use_ratio=10).optimize(g)
+    finally:
+        optimizer_stats.stats = stats
+    assert str(g) == "[Op3(x)]", str(g)
@@ -1,5 +1,8 @@
 from theano.gof.sched import (make_dependence_cmp, sort_apply_nodes,
-                              reverse_dict, _toposort, posort)
+                              reverse_dict, _toposort, posort,
+                              memory_minimizing_order, memory_schedule_fn)
+
+import numpy
 
 from theano import tensor
 from theano.gof.graph import io_toposort
@@ -67,3 +70,57 @@ def test_posort():
             lambda a, b: a - b]
     assert (posort(l, *cmps) ==
             [10, 1, 11, 2, 12, 3, 13, 4, 14, 5, 15, 6, 16, 7, 17, 8, 18, 9, 19])
+
+
+def _peak(order, outputs, size):
+    # Peak of the intermediate results (all owned here), freed after
+    # their last client.
+    last_use = {}
+    for i, node in enumerate(order):
+        for inp in node.inputs:
+            last_use[inp] = i
+    live = peak = 0
+    for i, node in enumerate(order):
+        live += sum(size(o) for o in node.outputs)
+        peak = max(peak, live)
+        for inp in set(node.inputs):
+            if inp.owner and last_use[inp] == i and inp not in outputs:
+                live -= size(inp)
+    return peak
+
+
+def test_memory_minimizing_order():
+    import theano
+    x = tensor.vector('x')
+    # Two chains each making a big temporary reduced to a scalar. Running
+    # one chain after the other keeps one big temporary alive at a time.
+    outs = []
+    for i in range(3):
+        big = tensor.outer(x + i, x)
+        outs.append((big * 2).sum())
+    y = outs[0] + outs[1] + outs[2]
+    fgraph = theano.FunctionGraph([x], [y])
+
+    def size(var):
+        if var.ndim == 2 and not any(var.broadcastable):
+            return 100
+        return 1
+
+    order = memory_minimizing_order(fgraph, size_fn=size)
+    assert set(order) == set(fgraph.apply_nodes)
+    # It is a valid order
+    seen = set()
+    for node in order:
+        for inp in node.inputs:
+            assert inp.owner is None or inp.owner in seen
+        seen.add(node)
+    # Only one chain's big temporaries (the outer product and its
+    # double) are alive at a time.
+    assert _peak(order, fgraph.outputs, size) < 300
+
+    f = theano.function([x], y, mode=theano.Mode(
+        linker=theano.gof.vm.VM_Linker(schedule=memory_schedule_fn()),
+        optimizer='fast_run'))
+    xv = numpy.arange(4).astype(theano.config.floatX)
+    expected = sum(((numpy.outer(xv + i, xv)) * 2).sum() for i in range(3))
+    assert numpy.allclose(f(xv), expected)
@@ -6,7 +6,7 @@ import unittest
 
 from nose.plugins.skip import SkipTest
 import numpy
-from six import itervalues
+from six import iteritems, itervalues
 
 from theano import function
 from theano.gof import vm
@@ -62,7 +62,10 @@ def test_c_thunks():
     if theano.config.cxx:
         cases.append(True)
     for c_thunks in cases:
-        f = function([a, b, c], ifelse(a, a * b, b * c),
+        # c_thunks=False disables the C code of the ops of the graph, so do
+        # not use the shared instance of mul, which other tests use.
+        mul = tensor.Elemwise(theano.scalar.mul)
+        f = function([a, b, c], ifelse(a, mul(a, b), mul(b, c)),
                      mode=Mode(
                          optimizer=None,
                          linker=vm.VM_Linker(c_thunks=c_thunks,
@@ -73,6 +76,38 @@ def test_c_thunks():
         assert any([hasattr(t, 'cthunk') for t in f.fn.thunks]) == c_thunks
 
 
+def test_background_c_thunks():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    a, b = tensor.vectors('ab')
+    for lazy in [False, True]:
+        f = function([a, b], tensor.exp(a * b) + a,
+                     mode=Mode(
+                         optimizer=None,
+                         linker=vm.VM_Linker(use_cloop=False, lazy=lazy,
+                                             background_c_thunks=True)))
+        x = numpy.asarray([1, 2], dtype=a.dtype)
+        y = numpy.asarray([3, 4], dtype=a.dtype)
+        expected = numpy.exp(x * y) + x
+        # The first call does not wait for the compilation.
+        assert numpy.allclose(f(x, y), expected)
+        assert f.fn.c_thunks_thread is not None
+        f.fn.c_thunks_thread.join()
+        assert numpy.allclose(f(x, y), expected)
+        assert all([hasattr(t, 'cthunk') for t in f.fn.thunks])
+        assert not f.fn.pending_thunks
+
+    # Without C thunks to make, there is no thread. A new op is used, as
+    # c_thunks=False disables the C code of the ops of the graph.
+    mul = tensor.Elemwise(theano.scalar.mul)
+    f = function([a, b], mul(a, b),
+                 mode=Mode(optimizer=None,
+                           linker=vm.VM_Linker(
+                               use_cloop=False, c_thunks=False,
+                               background_c_thunks=True)))
+    assert f.fn.c_thunks_thread is None
+
+
 def test_speed():
     if not theano.config.cxx:
         raise SkipTest("G++ not available, so we need to skip this test.")
@@ -217,6 +252,32 @@ def test_allow_gc_cvm():
     assert f.fn.storage_map[n][0] is None
 
 
+def test_cvm_clears_storage():
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+    x = tensor.vector('x')
+    s = theano.shared(numpy.zeros(2, dtype=theano.config.floatX))
+    for allow_gc in [True, False]:
+        linker = vm.VM_Linker(allow_gc=allow_gc, use_cloop=True)
+        f = function([x], [x * 2, x + 1], updates=[(s, s + x)],
+                     mode=Mode(linker=linker, optimizer='fast_compile'))
+        assert f.fn.clears_storage
+        xv = numpy.ones(2, dtype=theano.config.floatX)
+        for call in [f, f.fast_call]:
+            outs = call(xv)
+            assert numpy.allclose(outs[0], 2) and numpy.allclose(outs[1], 2)
+            # The required input and the outputs are cleared in C
+            assert f.input_storage[0].storage[0] is None
+            for c in f.output_storage:
+                assert (c.storage[0] is None) == allow_gc
+
+        # Calling the VM directly (like scan does) leaves the storage alone
+        f.input_storage[0].storage[0] = xv
+        f.fn()
+        assert f.input_storage[0].storage[0] is xv
+        assert all(c.storage[0] is not None for c in f.output_storage)
+
+
 run_memory_usage_tests = False
 if run_memory_usage_tests:
     # these are not normal unit tests, do not run them as part of standard
@@ -396,3 +457,61 @@ def test_reallocation():
         assert check_storage(storage_map)[0]
         assert len(set(id(v) for v in
                        itervalues(storage_map))) < len(storage_map)
+
+
+@theano.configparser.change_flags(**{'vm.parallel_threads': 4})
+def test_parallel_loop():
+    x = tensor.vector('x')
+    # Several independent branches, and an inplace op at the end.
+    branches = [tensor.exp(x * i).sum() for i in range(5)]
+    z = tensor.stack(branches) + tensor.dot(x, x)
+    xv = numpy.asarray([0.1, 0.2, 0.3], dtype=x.dtype)
+    for allow_gc in [False, True]:
+        for use_cloop in [False, True]:
+            linker = vm.VM_Linker(allow_gc=allow_gc, use_cloop=use_cloop)
+            f = function([x], z, mode=Mode(linker=linker))
+            assert isinstance(f.fn, vm.ParallelLoop)
+            expected = (numpy.exp(numpy.outer(numpy.arange(5), xv)).sum(1) +
+                        numpy.dot(xv, xv))
+            for i in range(3):
+                assert numpy.allclose(f(xv), expected)
+            if allow_gc:
+                # Only the inputs, outputs and constants are kept.
+                for var, storage in iteritems(f.fn.storage_map):
+                    if (var.owner and var.clients and
+                            var not in f.maker.fgraph.outputs):
+                        assert storage[0] is None, var
+
+    # Errors are raised like in the other VMs.
+    f = function([x], tensor.exp(x) + x[:2],
+                 mode=Mode(linker=vm.VM_Linker(use_cloop=False)))
+    from nose.tools import assert_raises
+    assert_raises(ValueError, f, xv)
+
+
+@theano.configparser.change_flags(**{'vm.memory_planner': True})
+def test_memory_planner():
+    x = tensor.vector('x')
+    y = x
+    for i in range(6):
+        y = tensor.tanh(y * (i + 1)) + x
+    z = y.sum()
+    xv = numpy.asarray([0.1, 0.2, 0.3], dtype=x.dtype)
+    for allow_gc in [False, True]:
+        linker = vm.VM_Linker(allow_gc=allow_gc, lazy=False, use_cloop=False)
+        mode = theano.compile.get_mode(Mode(linker=linker))
+        mode = mode.excluding('fusion', 'inplace')
+        f = function([x], z, mode=mode)
+        f_ref = function([x], z, mode=mode.excluding('ShapeOpt'))
+        for i in range(3):
+            assert numpy.allclose(f(xv), f_ref(xv))
+
+        # The vectors of the same shape now share a few storages.
+        storage_map = f.fn.storage_map
+        vectors = [v for v in f.maker.fgraph.variables
+                   if v.owner and getattr(v, 'ndim', None) == 1]
+        assert len(set(id(storage_map[v]) for v in vectors)) < len(vectors)
+        # And their buffers are kept between calls.
+        bufs = set(id(storage_map[v][0]) for v in vectors)
+        f(xv)
+        assert bufs == set(id(storage_map[v][0]) for v in vectors)
@@ -10,16 +10,22 @@ from collections import defaultdict
 import logging
 import os
 import sys
+import threading
 import time
 import warnings
 
+import numpy
+
 from theano.configparser import (config, AddConfigVar,
-                                 BoolParam, ConfigParam, _config_var_list)
+                                 BoolParam, ConfigParam, IntParam,
+                                 _config_var_list)
 
 import theano.gof.cmodule
+import theano.gof.sched
 
+from theano.compat import get_unbound_function
 from six import iteritems, itervalues
-from six.moves import xrange
+from six.moves import queue, xrange
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +62,37 @@ AddConfigVar('vm.lazy',
              ConfigParam('None', filter_vm_lazy),
              in_c_key=False)
 
+AddConfigVar('vm.parallel_threads',
+             "Useful only for the vm linkers. If higher than 1, the nodes of"
+             " graphs without lazy evaluation are run by ParallelLoop, which"
+             " executes independent nodes at the same time in that many"
+             " threads. This only helps if the ops release the GIL while"
+             " they run (e.g. NumPy or BLAS calls on large arrays). The C VM"
+             " is then not used.",
+             IntParam(1, lambda i: i >= 1),
+             in_c_key=False)
+
+AddConfigVar('vm.memory_planner',
+             "Useful only for the vm linkers without lazy evaluation. If True,"
+             " intermediate results that are never alive at the same time and"
+             " have the same dtype and shape (as inferred by the ShapeFeature)"
+             " share their storage, so their buffers are allocated once and"
+             " reused by the next calls. Those buffers are kept between"
+             " calls, even with allow_gc. A buffer is only reused if the op"
+             " computing the result writes into its existing output storage,"
+             " as the C code of most ops does; Python implementations"
+             " usually allocate a new array each time.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('vm.memory_schedule',
+             "If True, the vm linkers without an explicit schedule order the"
+             " nodes to lower the peak memory of the intermediate results"
+             " (see theano.gof.sched.memory_minimizing_order), instead of"
+             " using the default topological order.",
+             BoolParam(False),
+             in_c_key=False)
+
 
 def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
                               dependencies):
@@ -143,6 +180,106 @@ def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
     return reallocated_info
 
 
+def calculate_memory_plan(order, fgraph, no_recycling=()):
+    """
+    Assign the intermediate results of a schedule to shared storage.
+
+    The live interval of a variable goes from the node computing it to the
+    last node using it. Going through `order`, each output is given the
+    storage of a variable whose interval ended before its own starts and
+    that has the same dtype and shape, or a new storage if there is none.
+    As the thunks of most ops reuse the buffer already in their output
+    storage when it has the right shape, the buffers are then only
+    allocated by the first call, and their number is kept to the maximum
+    number of such variables alive at the same time.
+
+    Only variables with a dtype, computed by the graph, and that are not
+    outputs of the fgraph or in no_recycling are considered. Variables that
+    are a view of, or destroy, another variable (or are viewed or destroyed)
+    are left alone, as the buffer can then outlive the variable. The shapes
+    are compared using ``fgraph.shape_feature``; without it, only scalars
+    are considered.
+
+    Parameters
+    ----------
+    order
+        The nodes of fgraph in the order in which they will be run.
+    fgraph
+        The FunctionGraph.
+    no_recycling
+        Variables whose storage is emptied before each call.
+
+    Returns
+    -------
+    dict
+        Maps each planned variable `var` to a pair (`owner`, `var`), where
+        `var` must use the storage of `owner`. This is the format returned
+        by `calculate_reallocate_info`.
+
+    """
+    shape_feature = getattr(fgraph, 'shape_feature', None)
+    outputs = set(fgraph.outputs)
+    no_recycling = set(no_recycling)
+
+    aliased = set()
+    for node in order:
+        for amap in (getattr(node.op, 'destroy_map', None),
+                     getattr(node.op, 'view_map', None)):
+            if not amap:
+                continue
+            for o, i_list in iteritems(amap):
+                aliased.add(node.outputs[o])
+                aliased.update(node.inputs[i] for i in i_list)
+
+    def signature(var):
+        # Return a hashable description of the dtype and shape of var, or
+        # None if they are not known.
+        dtype = getattr(var.type, 'dtype', None)
+        ndim = getattr(var.type, 'ndim', None)
+        if dtype is None or ndim is None:
+            return None
+        if ndim == 0:
+            return (type(var.type), dtype, ())
+        if shape_feature is None or var not in shape_feature.shape_of:
+            return None
+        shape = []
+        for s in shape_feature.shape_of[var]:
+            if isinstance(s, theano.Constant):
+                shape.append(int(s.data))
+            else:
+                shape.append(s)
+        return (type(var.type), dtype, tuple(shape))
+
+    last_use = {}
+    for idx, node in enumerate(order):
+        for r in node.inputs:
+            last_use[r] = idx
+
+    plan = {}
+    # signature -> owners whose storage is free
+    free = defaultdict(list)
+    # node index -> (signature, owner) freed once that node has run
+    release = defaultdict(list)
+    for idx, node in enumerate(order):
+        for out in node.outputs:
+            if (out in outputs or out in no_recycling or out in aliased):
+                continue
+            sig = signature(out)
+            if sig is None:
+                continue
+            if free[sig]:
+                owner = free[sig].pop()
+            else:
+                owner = out
+            plan[out] = (owner, out)
+            release[last_use.get(out, idx)].append((sig, owner))
+        # The storage of the inputs of this node is only free after it ran,
+        # so an output never shares the storage of an input of its node.
+        for sig, owner in release.pop(idx, []):
+            free[sig].append(owner)
+    return plan
+
+
 class VM(object):
     """
     A VM object's __call__ method evaluates a Theano program.
@@ -180,6 +317,13 @@ class VM(object):
         True indicates that Function.__call__ must implement the feedback from
         output storage to input storage. False means it *must not* repeat that
         feedback.
+    pending_thunks
+        List of (index, thunk) pairs. Before each call, thunks[index] is
+        replaced by thunk for each pair (see `VM_Linker` with
+        background_c_thunks=True).
+    c_thunks_thread
+        The thread making the C thunks in the background, or None if there
+        are none to make.
 
     """
 
@@ -193,6 +337,8 @@ class VM(object):
         self.call_counts = [0] * len(nodes)
         self.call_times = [0] * len(nodes)
         self.time_thunks = False
+        self.pending_thunks = []
+        self.c_thunks_thread = None
 
         # This variable (self.need_update_inputs) is overshadowed by
         # CLazyLinker in CVM which has an attribute of the same name that
@@ -209,6 +355,19 @@ class VM(object):
         """
         raise NotImplementedError('override me')
 
+    def swap_pending_thunks(self):
+        """
+        Replace thunks by the ones in pending_thunks.
+
+        This is called at the beginning of a call, so a thunk is never
+        replaced while the VM runs. The new thunk must use the same storage
+        as the one it replaces.
+
+        """
+        while self.pending_thunks:
+            i, thunk = self.pending_thunks.pop()
+            self.thunks[i] = thunk
+
     def clear_storage(self):
         """
         Free any internal references to temporary variables.
@@ -220,15 +379,16 @@ class VM(object):
         """
         raise NotImplementedError('override me')
 
-    def update_profile(self, profile):
-        # accumulate into the profile object
+    def update_profile(self, profile, scale=1):
+        # accumulate into the profile object, multiplying the timings by
+        # scale when only some calls were timed
         for node, thunk, t, c in zip(self.nodes, self.thunks,
                                      self.call_times, self.call_counts):
             profile.apply_time.setdefault(node, 0.0)
-            profile.apply_time[node] += t
+            profile.apply_time[node] += t * scale
 
             profile.apply_callcount.setdefault(node, 0)
-            profile.apply_callcount[node] += c
+            profile.apply_callcount[node] += c * scale
 
             profile.apply_cimpl[node] = hasattr(thunk, 'cthunk')
 
@@ -245,6 +405,15 @@ class VM(object):
         if hasattr(self, 'dependencies'):
             profile.dependencies = self.dependencies
 
+        tracker = getattr(self, 'memory_tracker', None)
+        if (tracker is not None and
+                tracker.peak > profile.measured_peak_memory):
+            profile.measured_peak_memory = tracker.peak
+            profile.measured_peak_node = tracker.peak_node
+
+        self.clear_profile()
+
+    def clear_profile(self):
         # clear the timer info out of the buffers
         for i in xrange(len(self.call_times)):
             self.call_times[i] = 0.0
@@ -261,6 +430,8 @@ class Loop(VM):
     allow_gc = False
 
     def __call__(self):
+        if self.pending_thunks:
+            self.swap_pending_thunks()
         if self.time_thunks:
             for cont in self.pre_call_clear:
                 cont[0] = None
@@ -300,6 +471,8 @@ class LoopGC(VM):
             raise ValueError()
 
     def __call__(self):
+        if self.pending_thunks:
+            self.swap_pending_thunks()
         if self.time_thunks:
             for cont in self.pre_call_clear:
                 cont[0] = None
@@ -331,6 +504,280 @@ class LoopGC(VM):
                 link.raise_with_op(node, thunk)
 
 
+# Thread pool shared by all ParallelLoop instances, see _get_thread_pool.
+_thread_pool = [None, 0]
+# Set in the threads of the pool while they run a thunk.
+_in_pool_thread = threading.local()
+
+
+def _reset_thread_pool():
+    # The threads of the pool do not survive a fork: the forked process
+    # must start its own pool.
+    _thread_pool[:] = [None, 0]
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_thread_pool)
+
+
+def _get_thread_pool(n_threads):
+    """
+    Return the thread pool used by ParallelLoop, with n_threads threads.
+
+    """
+    from multiprocessing.pool import ThreadPool
+    pool, size = _thread_pool
+    if pool is None or size != n_threads:
+        if pool is not None:
+            pool.close()
+        _thread_pool[:] = [ThreadPool(n_threads), n_threads]
+    return _thread_pool[0]
+
+
+class ParallelLoop(VM):
+    """
+    Program execution in Python, running independent nodes concurrently.
+
+    A node is given to a pool of threads as soon as all the nodes it depends
+    on are done, either because it uses their outputs or because of the
+    orderings of the fgraph (e.g. the ones added by the destroy handler).
+    Each node only writes to the storage of its own outputs, so the results
+    are the same as with Loop, whatever the order in which the threads
+    finish.
+
+    When called from a thread of the pool (e.g. by the inner function of an
+    op), nodes are run one after the other in the calling thread, so the
+    pool can not deadlock.
+
+    Parameters
+    ----------
+    nodes
+        A list of nodes in toposort order.
+    thunks
+        A list of thunks to execute those nodes, in toposort order.
+    pre_call_clear
+        A list of containers to empty at the beginning of each call.
+    storage_map
+        The storage_map of the thunks.
+    fgraph
+        The FunctionGraph of nodes.
+    allow_gc
+        If True, the storage of an intermediate result is emptied once all
+        the nodes using it are done.
+    n_threads
+        Number of threads running nodes at the same time.
+
+    """
+
+    def __init__(self, nodes, thunks, pre_call_clear, storage_map, fgraph,
+                 allow_gc, n_threads):
+        super(ParallelLoop, self).__init__(nodes, thunks, pre_call_clear)
+        self.allow_gc = allow_gc
+        self.n_threads = n_threads
+
+        node_idx = dict((node, i) for i, node in enumerate(nodes))
+        ords = fgraph.orderings()
+        # successors[i] lists the nodes depending on node i.
+        self.successors = [[] for _ in nodes]
+        # n_predecessors[i] is the number of nodes node i depends on.
+        self.n_predecessors = []
+        for i, node in enumerate(nodes):
+            preds = set(r.owner for r in node.inputs if r.owner in node_idx)
+            preds.update(p for p in ords.get(node, []) if p in node_idx)
+            for p in preds:
+                self.successors[node_idx[p]].append(i)
+            self.n_predecessors.append(len(preds))
+
+        # The intermediate results that can be freed, the number of nodes
+        # using each of them, and for each node, the results it uses.
+        self.gc_storage = []
+        self.gc_n_users = []
+        self.node_gc_vars = [[] for _ in nodes]
+        if allow_gc:
+            gc_idx = {}
+            outputs = set(fgraph.outputs)
+            for i, node in enumerate(nodes):
+                for r in set(node.inputs):
+                    if r.owner is None or r in outputs:
+                        continue
+                    if r not in gc_idx:
+                        gc_idx[r] = len(self.gc_storage)
+                        self.gc_storage.append(storage_map[r])
+                        self.gc_n_users.append(0)
+                    self.gc_n_users[gc_idx[r]] += 1
+                    self.node_gc_vars[i].append(gc_idx[r])
+
+    def __call__(self):
+        if self.pending_thunks:
+            self.swap_pending_thunks()
+        for cont in self.pre_call_clear:
+            cont[0] = None
+        if getattr(_in_pool_thread, 'value', False) or len(self.nodes) < 2:
+            self.run_sequentially()
+        else:
+            self.run_in_pool()
+
+    def node_done(self, i, n_users):
+        # Free the intermediate results node i was the last to use.
+        for v in self.node_gc_vars[i]:
+            n_users[v] -= 1
+            if n_users[v] == 0:
+                self.gc_storage[v][0] = None
+
+    def run_sequentially(self):
+        n_users = list(self.gc_n_users)
+        time_thunks = self.time_thunks
+        for i, thunk in enumerate(self.thunks):
+            try:
+                if time_thunks:
+                    t0 = time.time()
+                    thunk()
+                    self.call_counts[i] += 1
+                    self.call_times[i] += time.time() - t0
+                else:
+                    thunk()
+            except Exception:
+                link.raise_with_op(self.nodes[i], thunk)
+            self.node_done(i, n_users)
+
+    def run_in_pool(self):
+        pool = _get_thread_pool(self.n_threads)
+        thunks = self.thunks
+        done = queue.Queue()
+
+        def run(i):
+            _in_pool_thread.value = True
+            try:
+                t0 = time.time()
+                thunks[i]()
+                done.put((i, time.time() - t0, None))
+            except Exception:
+                done.put((i, 0, sys.exc_info()))
+            finally:
+                _in_pool_thread.value = False
+
+        n_predecessors = list(self.n_predecessors)
+        n_users = list(self.gc_n_users)
+        n_running = 0
+        error = None
+        for i, n in enumerate(n_predecessors):
+            if n == 0:
+                pool.apply_async(run, (i,))
+                n_running += 1
+        while n_running:
+            i, dt, exc_info = done.get()
+            n_running -= 1
+            if exc_info is not None:
+                # Let the running nodes finish, but do not start new ones.
+                if error is None:
+                    error = (i, exc_info)
+                continue
+            if self.time_thunks:
+                self.call_counts[i] += 1
+                self.call_times[i] += dt
+            self.node_done(i, n_users)
+            if error is not None:
+                continue
+            for j in self.successors[i]:
+                n_predecessors[j] -= 1
+                if n_predecessors[j] == 0:
+                    pool.apply_async(run, (j,))
+                    n_running += 1
+        if error is not None:
+            i, exc_info = error
+            link.raise_with_op(self.nodes[i], thunks[i], exc_info)
+
+
+class MemoryTracker(object):
+    """
+    Count the bytes held by the values of a storage_map during a call.
+
+    Values sharing memory are counted once: ndarrays are grouped by the
+    ndarray owning their data (found by following ``base``), and other
+    values by the input they are a view of or destroy, according to the
+    view_map and destroy_map of the node computing them.
+
+    Attributes
+    ----------
+    live
+        The number of bytes currently held.
+    peak
+        The maximum of `live` so far.
+    peak_node
+        The node after which `peak` was reached (None for the inputs).
+
+    """
+
+    def __init__(self):
+        # buffer key -> [nbytes, number of variables using it]
+        self.buffers = {}
+        # variable -> buffer key
+        self.var_buffer = {}
+        self.live = 0
+        self.peak = 0
+        self.peak_node = None
+
+    def buffer_of(self, var, value, node=None):
+        """
+        Return the key and size of the memory holding `value`.
+
+        """
+        if isinstance(value, numpy.ndarray):
+            while isinstance(value.base, numpy.ndarray):
+                value = value.base
+            return id(value), value.nbytes
+        if node is not None:
+            idx = node.outputs.index(var)
+            aliased = (getattr(node.op, 'view_map', {}).get(idx) or
+                       getattr(node.op, 'destroy_map', {}).get(idx))
+            if aliased and node.inputs[aliased[0]] in self.var_buffer:
+                return self.var_buffer[node.inputs[aliased[0]]], 0
+        try:
+            nbytes = var.type.get_size(var.type.get_shape_info(value))
+        except (AttributeError, NotImplementedError):
+            nbytes = getattr(value, 'nbytes', 0)
+        return id(value), nbytes
+
+    def add(self, var, value, node=None):
+        """
+        Record that `var` holds `value`, computed by `node`.
+
+        """
+        self.remove(var)
+        if value is None:
+            return
+        key, nbytes = self.buffer_of(var, value, node)
+        buf = self.buffers.get(key)
+        if buf is None:
+            self.buffers[key] = [nbytes, 1]
+            self.live += nbytes
+        else:
+            buf[1] += 1
+        self.var_buffer[var] = key
+
+    def remove(self, var):
+        """
+        Record that the storage of `var` was cleared.
+
+        """
+        key = self.var_buffer.pop(var, None)
+        if key is None:
+            return
+        buf = self.buffers[key]
+        buf[1] -= 1
+        if buf[1] == 0:
+            del self.buffers[key]
+            self.live -= buf[0]
+
+    def record(self, node):
+        """
+        Update the peak after `node` was executed.
+
+        """
+        if self.live > self.peak:
+            self.peak = self.live
+            self.peak_node = node
+
+
 class Stack(VM):
     """
     Finish-to-start evalution order of thunks.
@@ -359,7 +806,7 @@ class Stack(VM):
 
     def __init__(self, nodes, thunks, pre_call_clear,
                  storage_map, compute_map, fgraph, allow_gc,
-                 dependencies=None, callback=None):
+                 dependencies=None, callback=None, callback_start=None):
         super(Stack, self).__init__(nodes, thunks, pre_call_clear)
 
         self.allow_gc = allow_gc
@@ -372,6 +819,9 @@ class Stack(VM):
         self.compute_map = compute_map
         self.node_idx = node_idx = {}
         self.callback = callback
+        self.callback_start = callback_start
+        # A MemoryTracker measuring the last call, with profile_memory.
+        self.memory_tracker = None
 
         ords = fgraph.orderings()
 
@@ -406,10 +856,18 @@ class Stack(VM):
         """
         Run the thunk corresponding to Apply instance `node`.
 
-        Calls self.callback if it is defined.
+        Calls self.callback_start before and self.callback after it, if
+        they are defined.
 
         """
         idx = self.node_idx[node]
+        if self.callback_start is not None:
+            self.callback_start(
+                node=node,
+                thunk=self.thunks[idx],
+                storage_map=self.storage_map,
+                compute_map=self.compute_map,
+            )
         t0 = time.time()
         rval = self.thunks[idx]()
         self.node_executed_order.append(node)
@@ -429,6 +887,8 @@ class Stack(VM):
         return rval, dt
 
     def __call__(self):
+        if self.pending_thunks:
+            self.swap_pending_thunks()
         storage_map = self.storage_map
         compute_map = self.compute_map
         thunks = self.thunks
@@ -443,10 +903,16 @@ class Stack(VM):
         apply_stack = list(self.base_apply_stack)
         last_apply_stack_len = -1
 
+        tracker = None
+        if config.profile and config.profile_memory:
+            tracker = self.memory_tracker = MemoryTracker()
+
         # This record all function inputs/shared varibles and constants
         for var, data in iteritems(self.storage_map):
             if data[0] is None:
                 continue
+            if tracker is not None:
+                tracker.add(var, data[0])
             if hasattr(var.type, 'get_shape_info'):
                 sh = var.type.get_shape_info(data[0])
             else:
@@ -459,6 +925,8 @@ class Stack(VM):
                   data[0].is_c_contiguous()):
                 st = "c"
             self.variable_strides[var] = st
+        if tracker is not None:
+            tracker.record(None)
 
         while apply_stack:
             # Make sure something happened last time round.  This is
@@ -527,6 +995,10 @@ class Stack(VM):
                             storage_map=storage_map)
                     for o in current_apply.outputs:
                         compute_map[o][0] = 1
+                    if tracker is not None:
+                        for o in current_apply.outputs:
+                            tracker.add(o, storage_map[o][0], current_apply)
+                        tracker.record(current_apply)
 
                     input_index = []
                     # A list store the index of inputs variables
@@ -541,6 +1013,8 @@ class Stack(VM):
                                 if all(compute_map[v][0]
                                         for v in dependencies[i]):
                                     storage_map[i][0] = None
+                                    if tracker is not None:
+                                        tracker.remove(i)
                                     input_index.append(
                                         current_apply.inputs.index(i))
 
@@ -629,6 +1103,11 @@ class Stack(VM):
                                 st = "c"
                             self.variable_strides[var] = st
 
+                    if tracker is not None:
+                        for o in current_apply.outputs:
+                            tracker.add(o, storage_map[o][0], current_apply)
+                        tracker.record(current_apply)
+
                     input_index = []
 
                     if self.allow_gc:
@@ -642,6 +1121,8 @@ class Stack(VM):
                                         break
                                 if empty_storage_map:
                                     storage_map[i][0] = None
+                                    if tracker is not None:
+                                        tracker.remove(i)
                                     input_index.append(
                                         current_apply.inputs.index(i))
                                     # See the not lazy gc code for explanations
@@ -662,6 +1143,8 @@ class Stack(VM):
                         continue
                     else:
                         storage_map[v][0] = None
+                        if tracker is not None:
+                            tracker.remove(v)
                         final_index.append(v)
                         compute_map[v][0] = 2
 
@@ -676,6 +1159,26 @@ try:
         def __init__(self, *args, **kwargs):
             lazylinker_c.CLazyLinker.__init__(self, *args, **kwargs)
             # skip VM.__init__
+
+        # Calls take the post_call_clear and clear_outputs arguments, to
+        # clear the storage in C after the call (see Function.__call__).
+        clears_storage = True
+
+        def call_batch(self, batch, batch_storage):
+            """
+            Execute the graph once for each tuple of values in `batch`.
+
+            The loop runs in C: before each execution, the values of the
+            tuple are put in the cells of `batch_storage`.
+
+            Returns
+            -------
+            list
+                For each execution, the list of its outputs (including the
+                values of the update expressions).
+
+            """
+            return self(batch=batch, batch_storage=batch_storage)
 except ImportError:
     pass
 except (OSError, theano.gof.cmodule.MissingGXX) as e:
@@ -705,6 +1208,8 @@ class VM_Linker(link.LocalLinker):
         A callable object to call after each call to a thunk within
         the virtual machine.  It will be called with four arguments called
         'node', 'thunk', 'storage_map', and 'compute_map'.
+    callback_start
+        Like callback, but called before each call to a thunk.
     lazy
         Useful only when use_cloop is False. When lazy is None, use the
         theano flag vm.lazy value. Then if we have a None (default) we auto
@@ -714,11 +1219,18 @@ class VM_Linker(link.LocalLinker):
     c_thunks
         If None or True, don't change the default. If False,
         don't compile c code for the thunks.
+    background_c_thunks
+        If True, the nodes that would use a C thunk start with their Python
+        implementation, so the function can be called without waiting for
+        the compilation. The C thunks are made in a background thread and
+        replace the Python ones, between two calls, once they are ready.
+        The C VM can't replace its thunks, so use_cloop is then ignored.
 
     """
 
     def __init__(self, allow_gc=None, use_cloop=False, callback=None,
-                 lazy=None, schedule=None, c_thunks=None):
+                 lazy=None, schedule=None, c_thunks=None,
+                 background_c_thunks=False, callback_start=None):
         # Note: if more parameters are added to __init__, make sure to forward
         # them in the "type(self)(...)" call in the "accept" method below.
         if allow_gc is None:
@@ -727,12 +1239,19 @@ class VM_Linker(link.LocalLinker):
         self.allow_gc = allow_gc
         self.use_cloop = use_cloop
         self.callback = callback
+        self.callback_start = callback_start
         self.lazy = lazy
         self.c_thunks = c_thunks
+        self.background_c_thunks = background_c_thunks
         self.updated_vars = {}
         if schedule:
             self.schedule = schedule
 
+    def schedule(self, fgraph):
+        if config.vm.memory_schedule:
+            return theano.gof.sched.memory_minimizing_order(fgraph)
+        return super(VM_Linker, self).schedule(fgraph)
+
     def accept(self, fgraph, no_recycling=None):
         """
 
@@ -776,6 +1295,8 @@ class VM_Linker(link.LocalLinker):
                 lazy=self.lazy,
                 schedule=self.schedule,
                 c_thunks=self.c_thunks,
+                background_c_thunks=self.background_c_thunks,
+                callback_start=self.callback_start,
             ).accept(fgraph, no_recycling)
         self.fgraph = fgraph
         self.no_recycling = no_recycling
@@ -832,6 +1353,22 @@ class VM_Linker(link.LocalLinker):
                 dependencies[k] += ls
         return dependencies
 
+    def use_parallel_vm(self, thunks):
+        """
+        Return True if make_vm returns a ParallelLoop for those thunks.
+
+        """
+        if (config.vm.parallel_threads <= 1 or self.callback is not None or
+                self.callback_start is not None or
+                (config.profile and config.profile_memory)):
+            return False
+        lazy = self.lazy
+        if lazy is None:
+            lazy = config.vm.lazy
+        if lazy is None:
+            lazy = not all([(not th.lazy) for th in thunks])
+        return not lazy
+
     def make_vm(self, nodes, thunks,
                 input_storage, output_storage, storage_map,
                 post_thunk_clear,
@@ -842,10 +1379,11 @@ class VM_Linker(link.LocalLinker):
 
         pre_call_clear = [storage_map[v] for v in self.no_recycling]
 
-        if (self.callback is not None or
+        if (self.callback is not None or self.callback_start is not None or
                 (config.profile and config.profile_memory)):
 
-            if self.use_cloop and self.callback is not None:
+            if self.use_cloop and (self.callback is not None or
+                                   self.callback_start is not None):
                 logger.warn('CVM does not support callback, using Stack VM.')
             if self.use_cloop and config.profile_memory:
                 warnings.warn(
@@ -857,8 +1395,10 @@ class VM_Linker(link.LocalLinker):
                 storage_map, compute_map,
                 self.fgraph, self.allow_gc,
                 dependencies=deps,
-                callback=self.callback)
-        elif self.use_cloop:
+                callback=self.callback,
+                callback_start=self.callback_start)
+        elif (self.use_cloop and not self.background_c_thunks and
+              not self.use_parallel_vm(thunks)):
             # create a map from nodes to ints and vars to ints
             nodes_idx = {}
             vars_idx = {}
@@ -975,7 +1515,17 @@ class VM_Linker(link.LocalLinker):
                 lazy = not all([(not th.lazy) for th in thunks])
             if not lazy:
                 # there is no conditional in the graph
-                if self.allow_gc:
+                if config.vm.parallel_threads > 1:
+                    vm = ParallelLoop(
+                        nodes,
+                        thunks,
+                        pre_call_clear,
+                        storage_map,
+                        self.fgraph,
+                        self.allow_gc,
+                        config.vm.parallel_threads,
+                    )
+                elif self.allow_gc:
                     vm = LoopGC(
                         nodes,
                         thunks,
@@ -1027,26 +1577,56 @@ class VM_Linker(link.LocalLinker):
         reallocated_info = calculate_reallocate_info(
             order, fgraph, storage_map, compute_map_re, dependencies)
 
-        for node in order:
+        background_nodes = []
+        if self.c_thunks is not False and self.background_c_thunks:
+            # Those nodes start with a Python thunk, see
+            # start_c_thunks_thread. Ops without perform must wait for
+            # their C code.
+            perform = get_unbound_function(theano.gof.op.PureOp.perform)
+            background_nodes = [
+                (i, node) for i, node in enumerate(order)
+                if (theano.gof.cc.may_use_c_thunk(node) and
+                    get_unbound_function(type(node.op).perform) is
+                    not perform)]
+        elif self.c_thunks is not False:
+            # Compile the missing C modules concurrently, so the calls to
+            # make_thunk below find them in the cache.
+            theano.gof.cc.precompile_nodes(order, no_recycling)
+        py_thunk_nodes = set(node for _, node in background_nodes)
+
+        def make_thunk(node):
             try:
                 if self.c_thunks is False:
                     node.op._op_use_c_code = False
-                thunks.append(node.op.make_thunk(node,
-                                                 storage_map,
-                                                 compute_map,
-                                                 no_recycling))
-                if not hasattr(thunks[-1], 'lazy'):
+                if node in py_thunk_nodes:
+                    thunk = node.op.make_py_thunk(node,
+                                                  storage_map,
+                                                  compute_map,
+                                                  no_recycling)
+                else:
+                    thunk = node.op.make_thunk(node,
+                                               storage_map,
+                                               compute_map,
+                                               no_recycling)
+                if not hasattr(thunk, 'lazy'):
                     # We don't want all ops maker to think about lazy Ops.
                     # So if they didn't specify that its lazy or not, it isn't.
                     # If this member isn't present, it will crash later.
-                    thunks[-1].lazy = False
+                    thunk.lazy = False
             except Exception as e:
                 e.args = ("The following error happened while"
                           " compiling the node", node, "\n") + e.args
                 raise
-        for node, thunk in zip(order, thunks):
             thunk.inputs = [storage_map[v] for v in node.inputs]
             thunk.outputs = [storage_map[v] for v in node.outputs]
+            return thunk
+
+        for node in order:
+            thunks.append(make_thunk(node))
+
+        # The C thunks made in the background must use the storage of the
+        # thunks they replace, so keep it before it is reallocated.
+        thunk_storage_map = dict(storage_map)
 
         lazy = self.lazy
         if lazy is None:
@@ -1054,9 +1634,27 @@ class VM_Linker(link.LocalLinker):
         if lazy is None:
             lazy = not all([(not th.lazy) for th in thunks])
         if not (lazy or (config.profile and config.profile_memory) or
-                self.use_cloop or self.callback):
-            for pair in itervalues(reallocated_info):
-                storage_map[pair[1]] = storage_map[pair[0]]
+                (self.use_cloop and not self.background_c_thunks) or
+                self.callback or self.callback_start or
+                self.use_parallel_vm(thunks)):
+            if config.vm.memory_planner:
+                # The nodes are run in order, so the storage can be planned.
+                # Unlike the reallocation above, this is done before the
+                # thunks use the storage: remake the thunks of the nodes
+                # whose variables got the storage of another one.
+                reallocated_info = calculate_memory_plan(order, fgraph,
+                                                         no_recycling)
+                moved = set(var for owner, var in itervalues(reallocated_info)
+                            if owner is not var)
+                for pair in itervalues(reallocated_info):
+                    storage_map[pair[1]] = storage_map[pair[0]]
+                for i, node in enumerate(order):
+                    if any(v in moved for v in node.inputs + node.outputs):
+                        thunks[i] = make_thunk(node)
+                thunk_storage_map = dict(storage_map)
+            else:
+                for pair in itervalues(reallocated_info):
+                    storage_map[pair[1]] = storage_map[pair[0]]
 
         computed, last_user = link.gc_helper(order)
         if self.allow_gc:
@@ -1082,6 +1680,10 @@ class VM_Linker(link.LocalLinker):
                           )
 
         vm.storage_map = storage_map
+        vm.c_thunks_thread = None
+        if background_nodes:
+            vm.c_thunks_thread = self.start_c_thunks_thread(
+                vm, background_nodes, thunk_storage_map, compute_map)
 
         return (vm,
                 [link.Container(input, storage)
@@ -1091,7 +1693,65 @@ class VM_Linker(link.LocalLinker):
                 thunks,
                 order)
 
+    def start_c_thunks_thread(self, vm, nodes, storage_map, compute_map):
+        """
+        Make the C thunks of nodes in a new thread, and give them to vm.
+
+        Parameters
+        ----------
+        vm
+            The VM whose thunks are replaced. Each C thunk is added to its
+            pending_thunks once made.
+        nodes
+            List of (index, node) pairs, where index is the position of the
+            thunk of node in vm.thunks.
+        storage_map
+            The storage_map used to make the current thunks.
+        compute_map
+            The compute_map used to make the current thunks.
+
+        Returns
+        -------
+        threading.Thread
+            The thread, already started. It is a daemon thread, so it does
+            not prevent the interpreter from exiting.
+
+        """
+        no_recycling = self.no_recycling
+
+        def make_c_thunks():
+            # Compile the missing C modules concurrently first.
+            theano.gof.cc.precompile_nodes([node for _, node in nodes],
+                                           no_recycling)
+            for i, node in nodes:
+                if isinstance(node.op, theano.gof.op.OpenMPOp):
+                    # Like OpenMPOp.make_thunk.
+                    node.op.update_self_openmp()
+                try:
+                    thunk = node.op.make_c_thunk(node, storage_map,
+                                                 compute_map, no_recycling)
+                except (NotImplementedError,
+                        theano.gof.utils.MethodNotDefined):
+                    # No C code, keep using perform.
+                    continue
+                except Exception:
+                    logger.warning('Compiling the C thunk of %s failed, '
+                                   'keeping its Python implementation.',
+                                   node, exc_info=True)
+                    continue
+                vm.pending_thunks.append((i, thunk))
+
+        thread = threading.Thread(target=make_c_thunks,
+                                  name='theano C thunks compilation')
+        thread.daemon = True
+        thread.start()
+        return thread
+
     def __setstate__(self, d):
         self.__dict__.update(d)
         if not hasattr(self, 'c_thunks'):
             self.c_thunks = True
+        if not hasattr(self, 'background_c_thunks'):
+            self.background_c_thunks = False
+        if not hasattr(self, 'callback_start'):
+            self.callback_start = None
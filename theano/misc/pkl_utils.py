@@ -7,6 +7,8 @@ unit tests or regression tests.
 import numpy
 import os
 import pickle
+import shutil
+import struct
 import sys
 import tempfile
 import zipfile
@@ -250,6 +252,63 @@ class PersistentNdarrayLoad(object):
             return array
 
 
+class PersistentNdarrayMmapLoad(PersistentNdarrayLoad):
+    """Load NumPy arrays persisted to a zip file as copy-on-write memory maps.
+
+    Arrays stored without compression in a zip file that was opened from a
+    path are mapped directly from that file, so their data is neither read
+    nor copied when loading. They can still be modified, but changes are
+    not written back to the file. Other arrays, as well as arrays whose
+    data is not aligned in the file for their dtype (which Theano's C code
+    does not support), are loaded as with :class:`PersistentNdarrayLoad`.
+
+    :param zip_file: The zip file handle in which the NumPy arrays are saved.
+    :type zip_file: :class:`zipfile.ZipFile`
+
+    """
+    def __call__(self, persid):
+        array_type, name = persid.split('.')
+        if array_type == 'ndarray':
+            array = self._memmap(name)
+            if array is not None:
+                return array
+        return super(PersistentNdarrayMmapLoad, self).__call__(persid)
+
+    def _memmap(self, name):
+        info = self.zip_file.getinfo(name)
+        path = self.zip_file.filename
+        if (info.compress_type != zipfile.ZIP_STORED or
+                not isinstance(path, string_types)):
+            return None
+        with open(path, 'rb') as f:
+            # Skip the local file header, whose fixed part is 30 bytes long
+            # and ends with the lengths of the file name and extra field.
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack('<HH', f.read(30)[26:])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = numpy.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = numpy.lib.format.read_array_header_1_0(f)
+            elif (version == (2, 0) and
+                    hasattr(numpy.lib.format, 'read_array_header_2_0')):
+                header = numpy.lib.format.read_array_header_2_0(f)
+            else:
+                return None
+            offset = f.tell()
+        shape, fortran_order, dtype = header
+        if dtype.hasobject or not shape or 0 in shape:
+            # Those can not be memory mapped.
+            return None
+        if offset % dtype.alignment:
+            # The memory map would not be aligned.
+            return None
+        array = numpy.memmap(path, dtype=dtype, mode='c', shape=shape,
+                             order='F' if fortran_order else 'C',
+                             offset=offset)
+        # The memmap stays open as long as the view exists.
+        return array.view(numpy.ndarray)
+
+
 def dump(obj, file_handler, protocol=DEFAULT_PROTOCOL,
          persistent_id=PersistentSharedVariableID):
     """Pickles an object to a zip file using external persistence.
@@ -340,3 +399,199 @@ def zipadd(func, zip_file, name):
         zip_file.write(temp_file.name, arcname=name)
     if os.path.isfile(temp_file.name):
         os.remove(temp_file.name)
+
+
+def _function_module_dirs(fn):
+    """Return the cache directories of the C modules used by a function.
+
+    Only versioned modules are returned, as unversioned ones are not kept in
+    the cache between processes. The functions of ops with an inner
+    function (e.g. scan) are also inspected, once they have been compiled.
+
+    """
+    from theano.compile.function_module import Function
+    from theano.gof.cc import CLinker, get_module_cache, node_clinkers
+
+    cache = get_module_cache()
+    fgraph = fn.maker.fgraph
+    linker = fn.maker.linker
+    if isinstance(linker, CLinker):
+        try:
+            keys = [linker.cmodule_key()]
+        except KeyError:
+            keys = []
+    else:
+        no_recycling = getattr(linker, 'no_recycling', [])
+        if no_recycling is True:
+            no_recycling = fgraph.variables
+        keys = [key for _, key, _ in node_clinkers(
+            fgraph.toposort(), no_recycling, force_c_code=True)]
+
+    dirs = set()
+    for key in keys:
+        if key is not None and key[0] and key in cache.entry_from_key:
+            dirs.add(os.path.dirname(cache.entry_from_key[key]))
+    for node in fgraph.apply_nodes:
+        inner_fn = getattr(node.op, 'fn', None)
+        if isinstance(inner_fn, Function):
+            dirs.update(_function_module_dirs(inner_fn))
+    return dirs
+
+
+def dump_function(fn, file_handler, protocol=DEFAULT_PROTOCOL):
+    """Export a compiled function with everything needed to run it.
+
+    The function is saved to a zip file containing its optimized graph,
+    the values of its inputs (including shared variables) as NPY files, and
+    the compiled C modules it uses. Loading it with :func:`load_function`
+    then does not need to optimize the graph nor, as long as the modules
+    are compatible with the host, to compile C code.
+
+    :param fn: The function to export.
+    :type fn: :class:`theano.compile.function_module.Function`
+
+    :param file_handler: The file handle to save the function to.
+    :type file_handler: file
+
+    :param protocol: The pickling protocol to use.
+    :type protocol: int, optional
+
+    .. note::
+        Unlike :func:`dump`, the zip file is not compressed, so that the
+        arrays can be memory mapped when loading. The modules of ops that
+        are not versioned, as well as the modules Theano compiles for
+        itself (e.g. the C VM), are not included and may still be compiled
+        when loading.
+
+    """
+    with closing(zipfile.ZipFile(file_handler, 'w', zipfile.ZIP_STORED,
+                                 allowZip64=True)) as zip_file:
+        for module_dir in sorted(_function_module_dirs(fn)):
+            dirname = os.path.basename(module_dir)
+            for filename in os.listdir(module_dir):
+                if (filename == 'key.pkl' or
+                        filename.endswith('.so') or
+                        filename.endswith('.pyd')):
+                    zip_file.write(
+                        os.path.join(module_dir, filename),
+                        arcname='modules/{0}/{1}'.format(dirname, filename))
+
+        def func(f):
+            p = pickle.Pickler(f, protocol=protocol)
+            p.persistent_id = PersistentSharedVariableID(zip_file)
+            p.dump(fn)
+        zipadd(func, zip_file, 'pkl')
+
+
+def _same_module(data, key_pkl):
+    """Return True if `key_pkl` describes the module pickled in `data`.
+
+    The files are equal if the module was extracted from this bundle,
+    otherwise the module hashes are compared.
+
+    """
+    try:
+        with open(key_pkl, 'rb') as f:
+            existing = f.read()
+    except (IOError, OSError):
+        return False
+    if existing == data:
+        return True
+    try:
+        return (pickle.loads(existing).module_hash ==
+                pickle.loads(data).module_hash)
+    except Exception:
+        return False
+
+
+def _extract_modules(zip_file):
+    """Copy the modules of a function bundle to the compilation directory.
+
+    Each module directory is first written in a staging directory and
+    then renamed into place, so other processes using the cache never see
+    a partial module. Modules already in the cache are not copied again.
+    If the directory name of a bundled module is used by another module in
+    the cache, the bundled one is extracted in a new directory, with its
+    key.pkl updated to point to it.
+
+    """
+    members = defaultdict(list)
+    for name in zip_file.namelist():
+        if name.startswith('modules/'):
+            _, dirname, filename = name.split('/')
+            members[dirname].append((name, filename))
+    if not members:
+        return
+    staging_base = os.path.join(config.compiledir, 'bundle_staging')
+    if not os.path.isdir(staging_base):
+        try:
+            os.makedirs(staging_base)
+        except OSError:
+            # Someone else created it at the same time.
+            pass
+    cache = None
+    for dirname, files in members.items():
+        contents = dict((filename, zip_file.read(name))
+                        for name, filename in files)
+        if 'key.pkl' not in contents:
+            continue
+        target = os.path.join(config.compiledir, dirname)
+        if os.path.exists(target):
+            if _same_module(contents['key.pkl'],
+                            os.path.join(target, 'key.pkl')):
+                continue
+            try:
+                key_data = pickle.loads(contents['key.pkl'])
+            except Exception:
+                warnings.warn("Could not read the key of the bundled module "
+                              "%s, it will be compiled again." % dirname)
+                continue
+            if cache is None:
+                cache = theano.gof.cc.get_module_cache()
+                cache.refresh(cleanup=False)
+            if key_data.module_hash in cache.module_hash_to_key_data:
+                # It was already extracted in another directory.
+                continue
+            target = tempfile.mkdtemp(dir=config.compiledir)
+            key_data.key_pkl = os.path.join(target, 'key.pkl')
+            key_data.entry = os.path.join(
+                target, os.path.basename(key_data.entry))
+            contents['key.pkl'] = pickle.dumps(
+                key_data, protocol=pickle.HIGHEST_PROTOCOL)
+            # The module is renamed over this empty directory below.
+            os.rmdir(target)
+        staging = tempfile.mkdtemp(dir=staging_base)
+        for filename, content in contents.items():
+            with open(os.path.join(staging, filename), 'wb') as f:
+                f.write(content)
+        open(os.path.join(staging, '__init__.py'), 'w').close()
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another process extracted the same module meanwhile.
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def load_function(f):
+    """Load a function exported with :func:`dump_function`.
+
+    The compiled modules of the bundle are added to the module cache, and
+    the optimized graph is used as is, so neither the optimizer nor the
+    compiler are run for them. Arrays are memory mapped from the file when
+    it was opened from a path.
+
+    :param f: The file handle to the zip file to load the function from.
+    :type f: file
+
+    """
+    with closing(zipfile.ZipFile(f, 'r')) as zip_file:
+        _extract_modules(zip_file)
+        theano.gof.cc.get_module_cache().refresh(cleanup=False)
+        p = pickle.Unpickler(BytesIO(zip_file.open('pkl').read()))
+        p.persistent_load = PersistentNdarrayMmapLoad(zip_file)
+        reoptimize = config.reoptimize_unpickled_function
+        config.reoptimize_unpickled_function = False
+        try:
+            return p.load()
+        finally:
+            config.reoptimize_unpickled_function = reoptimize
@@ -1,6 +1,9 @@
 import os
+import pickle
 import shutil
 import unittest
+import zipfile
+from contextlib import closing
 from tempfile import mkdtemp
 
 import numpy
@@ -13,7 +16,10 @@ import theano.sandbox.cuda as cuda_ndarray
 from theano.sandbox.cuda.type import CudaNdarrayType
 from theano.sandbox.cuda.var import CudaNdarraySharedVariable
 from theano.sandbox.rng_mrg import MRG_RandomStreams
-from theano.misc.pkl_utils import dump, load
+from theano.gof.cmodule import KeyData
+from theano.misc.pkl_utils import (dump, load, dump_function, load_function,
+                                   zipadd, PersistentNdarrayMmapLoad,
+                                   _extract_modules)
 
 
 class T_dump_load(unittest.TestCase):
@@ -69,3 +75,76 @@ class T_dump_load(unittest.TestCase):
         with open('model.zip', 'rb') as f:
             foo_1, foo_2, foo_3, array = load(f)
         assert array == numpy.array(3)
+
+    def test_dump_load_function(self):
+        w = theano.shared(numpy.arange(6, dtype=theano.config.floatX)
+                          .reshape((2, 3)), name='w')
+        x = theano.tensor.vector('x', dtype=theano.config.floatX)
+        y = theano.tensor.dot(w, x).sum()
+        fn = theano.function([x], y, updates=[(w, w * 2)])
+        v = numpy.ones(3, dtype=theano.config.floatX)
+
+        with open('fn.zip', 'wb') as f:
+            dump_function(fn, f)
+        with open('fn.zip', 'rb') as f:
+            fn_2 = load_function(f)
+
+        assert_allclose(fn_2(v), fn(v))
+        assert_allclose(fn_2(v), fn(v))
+
+    def test_mmap_load_alignment(self):
+        # Arrays are only memory mapped if their data is aligned in the file.
+        # The data of the first member starts after a local header of 30
+        # bytes plus its name, and an NPY header whose length is a multiple
+        # of 16.
+        value = numpy.arange(6, dtype='float64')
+        arrays = {}
+        for name in ['a', 'ab']:
+            with closing(zipfile.ZipFile(name + '.zip', 'w')) as zip_file:
+                zipadd(lambda f: numpy.lib.format.write_array(f, value),
+                       zip_file, name)
+            with closing(zipfile.ZipFile(name + '.zip', 'r')) as zip_file:
+                arrays[name] = PersistentNdarrayMmapLoad(zip_file)(
+                    'ndarray.' + name)
+            assert arrays[name].flags.aligned
+            assert_allclose(arrays[name], value)
+        assert not isinstance(arrays['a'].base, numpy.memmap)
+        assert isinstance(arrays['ab'].base, numpy.memmap)
+
+    def test_extract_modules_name_clash(self):
+        # A bundled module whose directory is used by another module of the
+        # cache is extracted in a new directory.
+        compiledir = theano.config.compiledir
+        existing = mkdtemp(dir=compiledir)
+        dirname = os.path.basename(existing)
+        added = []
+        try:
+            key_pkl = os.path.join(existing, 'key.pkl')
+            entry = os.path.join(existing, 'm.so')
+            KeyData(keys=set(), module_hash='existing_hash', key_pkl=key_pkl,
+                    entry=entry).save_pkl()
+            open(entry, 'w').close()
+            key_data = KeyData(keys=set(), module_hash='bundled_hash',
+                               key_pkl=key_pkl, entry=entry)
+            with closing(zipfile.ZipFile('fn.zip', 'w')) as zip_file:
+                zip_file.writestr('modules/%s/key.pkl' % dirname,
+                                  pickle.dumps(key_data))
+                zip_file.writestr('modules/%s/m.so' % dirname, b'bundled')
+
+            before = set(os.listdir(compiledir))
+            with closing(zipfile.ZipFile('fn.zip', 'r')) as zip_file:
+                _extract_modules(zip_file)
+            added = sorted(set(os.listdir(compiledir)) - before)
+            added = [name for name in added if name.startswith('tmp')]
+            assert len(added) == 1, added
+            new_dir = os.path.join(compiledir, added[0])
+
+            with open(os.path.join(new_dir, 'key.pkl'), 'rb') as f:
+                key_data = pickle.load(f)
+            assert key_data.module_hash == 'bundled_hash'
+            assert key_data.get_entry() == os.path.join(new_dir, 'm.so')
+            with open(os.path.join(existing, 'key.pkl'), 'rb') as f:
+                assert pickle.load(f).module_hash == 'existing_hash'
+        finally:
+            for name in [dirname] + added:
+                shutil.rmtree(os.path.join(compiledir, name))
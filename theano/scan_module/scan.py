@@ -80,7 +80,8 @@ def scan(fn,
          name=None,
          profile=False,
          allow_gc=None,
-         strict=False):
+         strict=False,
+         batch_shards=1):
     """
     This function constructs and applies a Scan op to the provided
     arguments.
@@ -319,6 +320,23 @@ def scan(fn,
         If true, all the shared variables used in ``fn`` must be provided as a
         part of ``non_sequences`` or ``sequences``.
 
+    batch_shards
+        If higher than 1, the rows of the batch are split into that many
+        shards, and the loops over the shards run at the same time in
+        different threads. This is only valid if each row of the batch is
+        computed independently of the others: the step must never combine
+        rows along the batch dimension, as ``x_t.sum()`` or a softmax over
+        the batch would. Scans whose step visibly reduces, indexes or
+        reshapes over the batch are not split, but this check can't catch
+        every case. The sequences, the initial states and the outputs must
+        have the batch as their second dimension (the first one of each
+        step), and the non sequences are used by all the rows. It only
+        helps if the inner function spends most of its time in ops that
+        release the GIL, like the BLAS calls of Gemm, Dot22, Gemv and Ger
+        on large matrices. Scans with taps on the future, shared variable
+        updates or a stopping condition, and scans on the GPU, are not
+        split.
+
     Returns
     -------
     tuple
@@ -1014,6 +1032,7 @@ def scan(fn,
     info['profile'] = profile
     info['allow_gc'] = allow_gc
     info['strict'] = strict
+    info['batch_shards'] = batch_shards
     if strict:
         warnings.warn('In the strict mode, all neccessary shared variables '
                       'must be passed as a part of non_sequences', Warning)
@@ -0,0 +1,183 @@
+"""
+This module provides a variant of scan that lowers the memory used by its
+gradient by recomputing the states of the loop instead of storing them.
+
+See scan.py for details on scan.
+
+"""
+__docformat__ = 'restructedtext en'
+
+import logging
+
+from theano import tensor
+from theano.scan_module.scan import scan
+
+_logger = logging.getLogger('theano.scan_module.scan_checkpoints')
+
+
+def _as_list(x):
+    if x is None:
+        return []
+    elif not isinstance(x, (list, tuple)):
+        return [x]
+    return list(x)
+
+
+def scan_checkpoints(fn,
+                     sequences=None,
+                     outputs_info=None,
+                     non_sequences=None,
+                     n_steps=None,
+                     save_every_N=None,
+                     mode=None,
+                     name=None):
+    """
+    Scan with a gradient that uses O(sqrt(n_steps)) memory for the states.
+
+    The loop is split into segments of `save_every_N` steps. An outer scan
+    iterates over the segments, and runs an inner scan over the steps of
+    each segment. The forward pass only keeps the states at the end of
+    each segment (the checkpoints). The backward pass recomputes the states
+    of one segment at a time from its checkpoint. So the gradient stores
+    about ``n_steps / save_every_N + save_every_N`` states instead of
+    ``n_steps``, for about twice the computation of the forward pass.
+    The inner scan of the forward pass only needs its last state, so
+    the ``scan_save_mem`` optimization keeps just that one.
+
+    Parameters
+    ----------
+    fn
+        The function applied at each step, as for ``scan``.
+    sequences
+        List of variables iterated over their first dimension. Taps are
+        not supported.
+    outputs_info
+        List of the initial states of the recurrent outputs, which can
+        only use the tap -1, or None for the outputs that are not fed back
+        to `fn`.
+    non_sequences
+        List of the other arguments of `fn`.
+    n_steps
+        The number of steps. By default, the length of the first sequence.
+    save_every_N
+        The number of steps between two checkpoints. By default, the
+        square root of `n_steps`, which minimizes the memory.
+    mode
+        See ``scan``.
+    name
+        See ``scan``.
+
+    Returns
+    -------
+    tuple
+        Like ``scan``, a variable or list of variables, and an (empty)
+        dictionary of updates. Unlike ``scan``, the recurrent outputs only
+        contain the states at the checkpoints, i.e. after every
+        `save_every_N` steps, the last one being the final state. The
+        outputs not fed back to `fn` contain all the steps.
+
+    Notes
+    -----
+    `fn` must not return updates (e.g. of random streams), nor a condition
+    to stop the loop.
+
+    """
+    sequences = _as_list(sequences)
+    outputs_info = _as_list(outputs_info)
+    non_sequences = _as_list(non_sequences)
+    if name is None:
+        name = 'scan_checkpoints_fn'
+
+    for seq in sequences:
+        if isinstance(seq, dict):
+            raise ValueError("scan_checkpoints does not support sequences "
+                             "with taps")
+    initial_states = []
+    for i, info in enumerate(outputs_info):
+        if isinstance(info, dict):
+            if info.get('taps', [-1]) != [-1] or 'initial' not in info:
+                raise ValueError("scan_checkpoints only supports recurrent "
+                                 "outputs with the tap -1")
+            outputs_info[i] = info = info['initial']
+        if info is not None:
+            initial_states.append(tensor.as_tensor_variable(info))
+    sequences = [tensor.as_tensor_variable(seq) for seq in sequences]
+
+    if n_steps is None:
+        if not sequences:
+            raise ValueError("scan_checkpoints needs n_steps when there are "
+                             "no sequences")
+        n_steps = sequences[0].shape[0]
+    n_steps = tensor.cast(n_steps, 'int64')
+    if save_every_N is None:
+        save_every_N = tensor.maximum(
+            tensor.cast(tensor.ceil(tensor.sqrt(n_steps)), 'int64'), 1)
+    n_segments = (n_steps + save_every_N - 1) // save_every_N
+
+    # The last segment can be shorter than the others.
+    segment_steps = tensor.alloc(
+        tensor.cast(save_every_N, 'int64'), n_segments)
+    segment_steps = tensor.set_subtensor(
+        segment_steps[-1], n_steps - (n_segments - 1) * save_every_N)
+
+    # Pad the sequences to a whole number of segments, and split them.
+    outer_sequences = []
+    for seq in sequences:
+        trailing = [seq.shape[i] for i in range(1, seq.ndim)]
+        padding = tensor.zeros(
+            [n_segments * save_every_N - n_steps] + trailing, dtype=seq.dtype)
+        seq = tensor.concatenate([seq[:n_steps], padding])
+        outer_sequences.append(seq.reshape(
+            [n_segments, save_every_N] + trailing, ndim=seq.ndim + 1))
+    outer_sequences.append(segment_steps)
+    n_seqs = len(sequences)
+    n_states = len(initial_states)
+
+    def segment_step(*args):
+        states = iter(args[n_seqs + 1:n_seqs + 1 + n_states])
+        inner_outputs_info = [None if info is None else next(states)
+                              for info in outputs_info]
+        results, updates = scan(fn,
+                                sequences=list(args[:n_seqs]),
+                                outputs_info=inner_outputs_info,
+                                non_sequences=list(args[n_seqs + 1 +
+                                                        n_states:]),
+                                n_steps=args[n_seqs],
+                                mode=mode,
+                                name=name + '_inner')
+        if updates:
+            raise ValueError("scan_checkpoints does not support updates")
+        results = _as_list(results)
+        rval = []
+        for info, res in zip(outputs_info, results):
+            if info is None:
+                # Pad the outputs of the last segment to save_every_N steps
+                # like the others.
+                padded = tensor.zeros(
+                    [save_every_N] +
+                    [res.shape[i] for i in range(1, res.ndim)],
+                    dtype=res.dtype)
+                rval.append(tensor.set_subtensor(padded[:res.shape[0]],
+                                                 res))
+            else:
+                rval.append(res[-1])
+        return rval
+
+    results, updates = scan(segment_step,
+                            sequences=outer_sequences,
+                            outputs_info=outputs_info,
+                            non_sequences=non_sequences,
+                            n_steps=n_segments,
+                            mode=mode,
+                            name=name,
+                            allow_gc=True)
+    results = _as_list(results)
+    for i, info in enumerate(outputs_info):
+        if info is None:
+            res = results[i]
+            trailing = [res.shape[j] for j in range(2, res.ndim)]
+            results[i] = res.reshape([n_segments * save_every_N] + trailing,
+                                     ndim=res.ndim - 1)[:n_steps]
+    if len(results) == 1:
+        results = results[0]
+    return results, updates
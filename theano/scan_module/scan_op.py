@@ -58,6 +58,8 @@ __contact__ = "Razvan Pascanu <r.pascanu@gmail>"
 
 import itertools
 import logging
+import os
+import threading
 import time
 
 import numpy
@@ -70,6 +72,7 @@ from theano.compile import function, Param, Out
 from theano import compile, config, gradient, gof, tensor
 from theano.gof import PureOp, Apply
 from theano.gof.graph import io_connection_pattern
+from theano.gof.vm import _in_pool_thread
 from theano.compat import OrderedDict, izip
 from theano.tensor import TensorType
 from theano.tensor.opt import Shape_i
@@ -95,6 +98,30 @@ AddConfigVar('scan.allow_output_prealloc',
              "(default: True)",
              BoolParam(True))
 
+AddConfigVar('scan.c_inner_function',
+             "If True, compile the inner function of scan with the C linker "
+             "when all its nodes have a C implementation, so each step is "
+             "one call to a C module instead of one per inner node "
+             "(default: False)",
+             BoolParam(False),
+             in_c_key=False)
+
+# Thread pools running the batch shards of scans, by number of threads.
+_shard_pools = {}
+# Set in the threads of those pools while they run a shard.
+_in_shard_thread = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    # The threads of the pools do not survive a fork.
+    os.register_at_fork(after_in_child=_shard_pools.clear)
+
+
+def _get_shard_pool(n_threads):
+    from multiprocessing.pool import ThreadPool
+    if n_threads not in _shard_pools:
+        _shard_pools[n_threads] = ThreadPool(n_threads)
+    return _shard_pools[n_threads]
+
 
 class Scan(PureOp):
     """
@@ -136,6 +163,8 @@ class Scan(PureOp):
                 ):
         if 'gpua' not in info:
             info['gpua'] = False
+        if 'batch_shards' not in info:
+            info['batch_shards'] = 1
         # adding properties into self
         self.inputs = inputs
         self.outputs = outputs
@@ -315,6 +344,9 @@ class Scan(PureOp):
         if not hasattr(self, 'gpua'):
             self.gpua = False
             self.info['gpua'] = False
+        if not hasattr(self, 'batch_shards'):
+            self.batch_shards = 1
+            self.info['batch_shards'] = 1
         if not hasattr(self, 'var_mappings'):
             # Generate the mappings between inner and outer inputs and outputs
             # if they haven't already been generated.
@@ -640,7 +672,8 @@ class Scan(PureOp):
                          'as_while', 'n_mit_sot', 'destroy_map',
                          'n_nit_sot', 'n_shared_outs',
                          'n_sit_sot', 'gpu', 'gpua', 'n_mit_mot_outs',
-                         'n_mit_mot', 'mit_mot_out_slices']
+                         'n_mit_mot', 'mit_mot_out_slices',
+                         'batch_shards']
         # This are some safety checks ( namely that the inner graph has the
         # same number of inputs and same number of outputs )
         if not len(self.inputs) == len(other.inputs):
@@ -770,12 +803,19 @@ class Scan(PureOp):
         # make_thunk can be called many times on the same op
         # we do not want to recompile the inner fct every time.
         if not getattr(self, 'fn', None):
-            self.fn = function(wrapped_inputs,
-                               wrapped_outputs,
-                               mode=self.mode_instance,
-                               name=self.name,
-                               profile=profile,
-                               on_unused_input='ignore')
+            self.fn = None
+            if (config.scan.c_inner_function and config.cxx and
+                    profile is None and
+                    type(self.mode_instance) is compile.mode.Mode):
+                self.fn = self.make_c_inner_function(wrapped_inputs,
+                                                     wrapped_outputs)
+            if self.fn is None:
+                self.fn = function(wrapped_inputs,
+                                   wrapped_outputs,
+                                   mode=self.mode_instance,
+                                   name=self.name,
+                                   profile=profile,
+                                   on_unused_input='ignore')
 
         try:
             cython_mintaps = numpy.asarray(self.mintaps, dtype='int32')
@@ -819,7 +859,7 @@ class Scan(PureOp):
             cython_destroy_map = numpy.asarray(cython_destroy_map,
                                                dtype='int32')
             from . import scan_perform_ext
-            p = lambda node, args, outs:\
+            p = lambda node, args, outs, fnct=self.fn:\
                     scan_perform_ext.perform(
                         self.n_shared_outs,
                         self.n_mit_mot_outs,
@@ -837,14 +877,16 @@ class Scan(PureOp):
                         cython_vector_outs,
                         cython_mit_mot_out_slices,
                         cython_mit_mot_out_nslices,
-                        self.fn.fn,
-                        self.fn,
+                        fnct.fn,
+                        fnct,
                         cython_destroy_map,
                         args,
                         outs,
                         self, node)
         except (ImportError, theano.gof.cmodule.MissingGXX):
             p = self.execute
+        if self.batch_shards > 1 and self.can_split_batch(node):
+            p = self.make_sharded_perform(p)
         # default arguments are stored in the closure of `rval`
 
         # Big ugly hack since we can't get the real value of allow_gc
@@ -857,7 +899,8 @@ class Scan(PureOp):
             for o in node.outputs:
                 compute_map[o][0] = True
             if allow_gc:
-                self.fn.free()
+                for fn in getattr(p, 'fns', [self.fn]):
+                    fn.free()
             return r
         rval.inputs = node_input_storage
         rval.outputs = node_output_storage
@@ -865,6 +908,149 @@ class Scan(PureOp):
         rval.lazy = False
         return rval
 
+    def can_split_batch(self, node):
+        """
+        Return True if the loop can be run on shards of the batch, as
+        requested by `batch_shards`.
+
+        The sequences, the initial states and the nit_sot outputs must have
+        the batch as their second dimension, and the inner graph must not
+        combine the rows of the batch, e.g. by reducing over it (see
+        `scan_utils.mixes_batch_rows`).
+
+        """
+        if (self.as_while or self.n_mit_mot or self.n_shared_outs or
+                self.gpu or self.gpua):
+            return False
+        split_inputs = node.inputs[1:1 + self.n_seqs + self.n_outs]
+        nit_sot_outputs = node.outputs[self.n_outs:
+                                       self.n_outs + self.n_nit_sot]
+        if not all(v.ndim >= 2 for v in split_inputs + nit_sot_outputs):
+            return False
+        inner_inputs = (self.inner_seqs(self.inputs) +
+                        self.inner_mitsot(self.inputs) +
+                        self.inner_sitsot(self.inputs))
+        inner_outputs = (self.inner_mitsot_outs(self.outputs) +
+                         self.inner_sitsot_outs(self.outputs) +
+                         self.inner_nitsot_outs(self.outputs))
+        return not scan_utils.mixes_batch_rows(inner_inputs, inner_outputs)
+
+    def make_sharded_perform(self, perform):
+        """
+        Return a perform function running `perform` on `batch_shards` shards
+        of the batch at the same time, in different threads.
+
+        Each shard has its own copy of the inner function. The shards write
+        their outputs into slices of the outputs of the previous call when
+        they have the right shape, and the outputs of the shards are
+        concatenated along the batch dimension otherwise. If the batch has
+        fewer rows than shards, or if the sequences and initial states do
+        not agree on its size, `perform` runs on the whole batch.
+
+        The shards only run at the same time while the inner function does
+        not hold the GIL, e.g. in the BLAS calls of Gemm, Dot22, Gemv and
+        Ger.
+
+        """
+        n_shards = self.batch_shards
+        n_split = 1 + self.n_seqs + self.n_outs
+        n_split_outs = self.n_outs + self.n_nit_sot
+        fns = [self.fn] + [self.fn.copy() for _ in xrange(n_shards - 1)]
+        shard_outs = [[[None] for _ in xrange(n_split_outs)]
+                      for _ in xrange(n_shards)]
+
+        def run_shard(node, args, k, bounds):
+            flags = (getattr(_in_shard_thread, 'value', False),
+                     getattr(_in_pool_thread, 'value', False))
+            _in_shard_thread.value = True
+            # Nodes run by a ParallelLoop in the inner function must not
+            # wait for its pool from here.
+            _in_pool_thread.value = True
+            try:
+                shard_args = list(args)
+                for j in xrange(1, n_split):
+                    shard_args[j] = args[j][:, bounds[k]:bounds[k + 1]]
+                perform(node, shard_args, shard_outs[k], fns[k])
+            finally:
+                _in_shard_thread.value, _in_pool_thread.value = flags
+
+        def in_place(out, j, k, bounds):
+            # True if shard k wrote its output j in its slice of `out`.
+            res = shard_outs[k][j][0]
+            view = out[:, bounds[k]:bounds[k + 1]]
+            return (res.shape == view.shape and res.strides == view.strides
+                    and (res.__array_interface__['data'][0] ==
+                         view.__array_interface__['data'][0]))
+
+        def sharded_perform(node, args, outs):
+            batch_sizes = set(args[j].shape[1] for j in xrange(1, n_split))
+            if len(batch_sizes) != 1 or batch_sizes.pop() < n_shards:
+                return perform(node, args, outs)
+            batch_size = args[1].shape[1]
+            bounds = [batch_size * k // n_shards
+                      for k in xrange(n_shards + 1)]
+            reuse = []
+            for j in xrange(n_split_outs):
+                out = outs[j][0]
+                reuse.append(isinstance(out, numpy.ndarray) and
+                             out.ndim >= 2 and out.shape[1] == batch_size)
+                for k in xrange(n_shards):
+                    shard_outs[k][j][0] = (
+                        out[:, bounds[k]:bounds[k + 1]] if reuse[j] else None)
+
+            if getattr(_in_shard_thread, 'value', False):
+                # Already in a thread of a pool: waiting for the same pool
+                # could deadlock.
+                for k in xrange(n_shards):
+                    run_shard(node, args, k, bounds)
+            else:
+                pool = _get_shard_pool(n_shards)
+                results = [pool.apply_async(run_shard,
+                                            (node, args, k, bounds))
+                           for k in xrange(n_shards)]
+                # Wait for all the shards before raising an error.
+                for r in results:
+                    r.wait()
+                for r in results:
+                    r.get()
+
+            for j in xrange(n_split_outs):
+                if not (reuse[j] and
+                        all(in_place(outs[j][0], j, k, bounds)
+                            for k in xrange(n_shards))):
+                    outs[j][0] = numpy.concatenate(
+                        [shard_outs[k][j][0] for k in xrange(n_shards)],
+                        axis=1)
+                for k in xrange(n_shards):
+                    shard_outs[k][j][0] = None
+
+        sharded_perform.fns = fns
+        return sharded_perform
+
+    def make_c_inner_function(self, inputs, outputs):
+        """
+        Compile the inner function with the C linker, which puts the whole
+        inner graph in one C module.
+
+        Return None if a node of the inner graph has no C implementation
+        (after the optimizations of `self.mode_instance`).
+
+        """
+        # Ops like scan or ifelse can not be part of a C module at all.
+        inner_nodes = gof.graph.io_toposort(self.inputs, self.outputs)
+        if not all(isinstance(n.op, gof.op.CLinkerOp) for n in inner_nodes):
+            return None
+        mode = compile.mode.Mode(
+            linker=gof.CLinker(),
+            optimizer=self.mode_instance.provided_optimizer)
+        try:
+            return function(inputs, outputs, mode=mode, name=self.name,
+                            on_unused_input='ignore')
+        except (NotImplementedError, gof.utils.MethodNotDefined) as e:
+            _logger.debug('Scan %s: inner graph not fully in C (%s), using '
+                          'the linker of its mode', self.name, e)
+            return None
+
     def inner_seqs(self, list_inputs):
         # Given the list of inner inputs this function grabs those
         # corresponding to sequences
@@ -1012,7 +1198,7 @@ class Scan(PureOp):
                   self.n_sit_sot + self.n_nit_sot + self.n_shared_outs)
         return list_inputs[offset:]
 
-    def execute(self, node, args, outs):
+    def execute(self, node, args, outs, fnct=None):
         """
         The args are packed like this:
 
@@ -1033,6 +1219,8 @@ class Scan(PureOp):
 
             Y sequence outputs y_1, y_2, ... y_<self.n_outs>
 
+        The inner function `fnct` defaults to self.fn.
+
         """
         # 1. Unzip the number of steps and sequences. If number of steps is
         # negative flip sequences around, and make n_steps positive
@@ -1096,14 +1284,32 @@ class Scan(PureOp):
             else:
                 outs[idx][0] = args[self.seqs_arg_offset + idx].copy()
 
+        # 2.2 Outputs that only keep their last state get a second row, so
+        # that the inner function can compute each state directly in the
+        # buffer, next to the previous one, instead of the state being
+        # copied in after every step. The last state is moved back into
+        # the one-row buffer after the loop.
+        last_state = [None] * self.n_outs
+        for idx in xrange(self.n_mit_mot, self.n_outs):
+            if (store_steps[idx] == 1 and not self.vector_outs[idx] and
+                    self.mintaps[idx] == -1):
+                last_state[idx] = outs[idx][0]
+                outs[idx][0] = node.outputs[idx].type.value_zeros(
+                    (2,) + last_state[idx].shape[1:])
+                outs[idx][0][0] = last_state[idx][0]
+                store_steps[idx] = 2
+                pos[idx] = 1
+
         offset = self.nit_sot_arg_offset + self.n_nit_sot
         other_args = args[offset:]
-        input_storage = self.fn.input_storage
-        output_storage = self.fn.output_storage
+        if fnct is None:
+            fnct = self.fn
+        input_storage = fnct.input_storage
+        output_storage = fnct.output_storage
         old_output_storage = [None] * len(output_storage)
         old_output_data = [None] * len(output_storage)
         output_reused = [None] * len(output_storage)
-        fn = self.fn.fn
+        fn = fnct.fn
         offset = (self.n_seqs + sum(map(len, self.tap_array[:self.n_outs])) +
                     self.n_shared_outs)
         for idx in xrange(len(other_args)):
@@ -1156,20 +1362,17 @@ class Scan(PureOp):
 
             # 4.2. Collect slices for mitsots, sitsots and nitsots
             offset = self.n_mit_mot_outs
-            if i != 0:
-                for idx in xrange(self.n_outs + self.n_nit_sot -
-                                  self.n_mit_mot):
-                    if (store_steps[idx + self.n_mit_mot] == 1 or
-                        self.vector_outs[idx + self.n_mit_mot]):
-                        output_storage[idx + offset].storage[0] = None
-                    else:
-                        _pos0 = idx + self.n_mit_mot
-                        output_storage[idx + offset].storage[0] =\
-                            outs[_pos0][0][pos[_pos0]]
-            else:
-                for idx in xrange(self.n_outs + self.n_nit_sot -
-                                  self.n_mit_mot):
+            for idx in xrange(self.n_outs + self.n_nit_sot -
+                              self.n_mit_mot):
+                _pos0 = idx + self.n_mit_mot
+                # The buffers of the nit_sot outputs are only allocated
+                # after the first step, when their shape is known.
+                if (store_steps[_pos0] == 1 or self.vector_outs[_pos0] or
+                        (i == 0 and _pos0 >= self.n_outs)):
                     output_storage[idx + offset].storage[0] = None
+                else:
+                    output_storage[idx + offset].storage[0] =\
+                        outs[_pos0][0][pos[_pos0]]
 
             # 4.3. Collect slices for shared outputs
             offset += self.n_outs + self.n_nit_sot - self.n_mit_mot
@@ -1307,6 +1510,13 @@ class Scan(PureOp):
                                izip(pos, store_steps)]
             i = i + 1
 
+        for idx in xrange(self.n_mit_mot, self.n_outs):
+            if last_state[idx] is not None:
+                last_state[idx][0] = outs[idx][0][(pos[idx] + 1) % 2]
+                outs[idx][0] = last_state[idx]
+                store_steps[idx] = 1
+                pos[idx] = 0
+
         # 6. Check if you need to re-order output buffers
         begin = self.n_mit_mot
         end = self.n_outs + self.n_nit_sot
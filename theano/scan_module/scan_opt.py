@@ -4,7 +4,8 @@ The Optimization provided in this file:
 
 local opt: remove_constants_and_unused_inputs_scan,
            constant_folding_for_scan2,
-           scan_merge_inouts
+           scan_merge_inouts,
+           vectorize_independent_scan
            They are wrapped in in2out to create global opt.
 global opt: ScanInplaceOptimizer,
             PushOutNonSeqScan,
@@ -19,7 +20,8 @@ optdb: scan_eqopt1 (.1), scan_eqopt2(1.6), scan_inplace(75)
 scan_eqopt1 -> scan_seqopt1
 scan_seqopt1 -> in2out(remove_constants_and_unused_inputs_scan)(1),
                 PushOutNonSeqScan(2),
-                PushOutSeqScan(3), PushOutDot1(4)
+                PushOutSeqScan(3), PushOutDot1(4), PushOutScanOutput(5),
+                in2out(vectorize_independent_scan)(6)
 scan_eqopt2 -> They are all global optimizer. (in2out convert local to global).
                This is important, as the order is important and all global
                optimizer run before local optimizer in the order they where
@@ -68,7 +70,7 @@ import theano
 from theano import tensor
 from theano.tensor import opt, get_scalar_constant_value
 from theano import gof
-from theano.compat import OrderedDict
+from theano.compat import OrderedDict, izip
 from six import integer_types, iteritems
 from six.moves import xrange
 from theano.gof.opt import Optimizer
@@ -1683,6 +1685,7 @@ class ScanMerge(gof.Optimizer):
         info['as_while'] = as_while
         info['profile'] = nodes[0].op.profile
         info['allow_gc'] = nodes[0].op.allow_gc
+        info['batch_shards'] = nodes[0].op.batch_shards
 
         # We keep the inner_ins and inner_outs of each original node separated.
         # To be able to recombine them in the right order after the clone,
@@ -1860,6 +1863,8 @@ class ScanMerge(gof.Optimizer):
         can_add = can_add and (node.op.truncate_gradient ==
                                rep.op.truncate_gradient)
         can_add = can_add and (node.op.mode == rep.op.mode)
+        can_add = can_add and (node.op.batch_shards ==
+                               rep.op.batch_shards)
         if not node.op.as_while:
             return nsteps == rep_nsteps and can_add
         cond = node.op.outputs[-1]
@@ -2272,6 +2277,131 @@ class PushOutDot1(gof.Optimizer):
                             old_new, remove=[node], reason='scan_pushout_dot1')
 
 
+def _vectorize_node(node, inputs):
+    """
+    Return the outputs of `node` for all the steps of a scan at once.
+
+    Parameters
+    ----------
+    node
+        An Apply node of the inner graph of the scan.
+    inputs
+        For each input of `node`, a pair (variable, batched) where the
+        variable is in the outer graph. If `batched` is True, it has a
+        leading axis for the steps, otherwise it is the same at each step.
+
+    Returns
+    -------
+    list or None
+        The (variable, batched) pairs of the outputs of `node`, or None if
+        we do not know how to batch `node`.
+
+    """
+    op = node.op
+    values = [v for v, batched in inputs]
+    if not any(batched for v, batched in inputs):
+        # The node does not depend on the steps.
+        return [(o, False) for o in op.make_node(*values).outputs]
+
+    if isinstance(op, tensor.Elemwise):
+        if op.inplace_pattern:
+            op = tensor.Elemwise(op.scalar_op)
+        args = [v if batched else v.dimshuffle(['x'] + list(range(v.ndim)))
+                for v, batched in inputs]
+        return [(o, True) for o in op.make_node(*args).outputs]
+
+    if isinstance(op, tensor.DimShuffle):
+        new_order = [0] + [i if i == 'x' else i + 1 for i in op.new_order]
+        return [(values[0].dimshuffle(new_order), True)]
+
+    if isinstance(op, tensor.elemwise.CAReduce):
+        ndim = values[0].ndim - 1
+        axis = op.axis
+        if axis is None:
+            axis = range(ndim)
+        op = copy.copy(op)
+        op.axis = tuple(sorted((a % ndim) + 1 for a in axis))
+        return [(op(values[0]), True)]
+
+    if isinstance(op, tensor.Dot):
+        (x, x_batched), (y, y_batched) = inputs
+        x_ndim = node.inputs[0].ndim
+        y_ndim = node.inputs[1].ndim
+        if x_batched and y_batched:
+            if x_ndim == 1 and y_ndim == 1:
+                return [((x * y).sum(axis=1), True)]
+            if x_ndim == 2 and y_ndim == 2:
+                return [(tensor.batched_dot(x, y), True)]
+        elif x_batched:
+            # (steps, ..., k) . (k, ...)
+            return [(tensor.dot(x, y), True)]
+        elif y_ndim == 1:
+            # (..., k) . (steps, k)
+            return [(tensor.dot(y, x.T), True)]
+    return None
+
+
+@gof.local_optimizer([scan_op.Scan])
+def vectorize_independent_scan(node):
+    """
+    Replace a scan whose steps are independent by the computation of all
+    the steps at once.
+
+    This applies to scans that only have sequences, non-sequences and
+    outputs that are not fed back to the inner graph, when each node of
+    the inner graph can be batched along the steps (see `_vectorize_node`).
+    PushOutSeqScan only moves out the first elemwise nodes of such a scan,
+    while this removes the loop.
+
+    """
+    if not isinstance(node.op, scan_op.Scan):
+        return False
+    op = node.op
+    if (op.as_while or op.n_mit_mot or op.n_mit_sot or op.n_sit_sot or
+            op.n_shared_outs or not op.n_nit_sot or
+            op.info['gpu'] or op.info['gpua']):
+        return False
+    n_steps = node.inputs[0]
+    # ScanSaveMem may have asked for fewer steps of the outputs.
+    if not all(equal_computations([l], [n_steps])
+               for l in op.outer_nitsot(node)):
+        return False
+
+    values = {}
+    for inner, outer in izip(op.inner_seqs(op.inputs), op.outer_seqs(node)):
+        values[inner] = (outer[:n_steps], True)
+    for inner, outer in izip(op.inner_non_seqs(op.inputs),
+                             op.outer_non_seqs(node)):
+        values[inner] = (outer, False)
+    for var in gof.graph.inputs(op.outputs):
+        if isinstance(var, gof.Constant):
+            # The inner graph may hold cached constants, which can't be
+            # put in the outer fgraph.
+            values[var] = (var.clone(), False)
+        elif var not in values:
+            return False
+
+    for apply_node in gof.graph.io_toposort(op.inputs, op.outputs):
+        outs = _vectorize_node(apply_node,
+                               [values[i] for i in apply_node.inputs])
+        if outs is None:
+            return False
+        values.update(izip(apply_node.outputs, outs))
+
+    rval = []
+    for inner, outer in izip(op.outputs, node.outputs):
+        value, batched = values[inner]
+        if not batched:
+            value = tensor.alloc(value, n_steps,
+                                 *[value.shape[i] for i in range(value.ndim)])
+        if value.dtype != outer.dtype or value.ndim != outer.ndim:
+            return False
+        if value.broadcastable != outer.broadcastable:
+            value = tensor.patternbroadcast(value, outer.broadcastable)
+        rval.append(value)
+    return rval
+
+
 # I've added an equilibrium because later scan optimization in the sequence
 # can make it such that earlier optimizations should apply. However, in
 # general I do not expect the sequence to run more then once
@@ -2334,6 +2464,17 @@ scan_seqopt1.register('scanOp_pushout_output',
                       'scan')
 
 
+# The steps of the scan are computed at once, so all the intermediate
+# results are in memory at the same time.
+scan_seqopt1.register('scanOp_vectorize_independent',
+                      opt.in2out(vectorize_independent_scan,
+                                 ignore_newtrees=True),
+                      6,
+                      'fast_run',
+                      'more_mem',
+                      'scan')
+
+
 scan_eqopt2.register('constant_folding_for_scan2',
                       opt.in2out(tensor.opt.constant_folding,
                                  ignore_newtrees=True),
@@ -62,7 +62,7 @@ import copy
 
 
 def get_version():
-    return 0.286
+    return 0.287
 
 @cython.boundscheck(False)
 def perform(
@@ -250,6 +250,22 @@ def perform(
         else:
             outs[idx][0] = args[<unsigned int>(seqs_arg_offset + idx)].copy()
 
+    # 2.2 Outputs that only keep their last state get a second row, so
+    # that the inner function can compute each state directly in the
+    # buffer, next to the previous one, instead of the state being copied
+    # in after every step. The last state is moved back into the one-row
+    # buffer after the loop.
+    last_state = [None] * n_outs
+    for idx in range(n_mit_mot, n_outs):
+        if (store_steps[idx] == 1 and vector_outs[idx] == 0 and
+                mintaps[idx] == -1):
+            last_state[idx] = outs[idx][0]
+            outs[idx][0] = node.outputs[idx].type.value_zeros(
+                (2,) + last_state[idx].shape[1:])
+            outs[idx][0][0] = last_state[idx][0]
+            store_steps[idx] = 2
+            pos[idx] = 1
+
 
     offset = nit_sot_arg_offset + n_nit_sot
     other_args = args[offset:]
@@ -317,18 +333,16 @@ def perform(
 
         # 4.2. Collect slices for mitsots, sitsots and nitsots
         offset = n_mit_mot_outs
-        if i != 0:
-            for idx in range(n_outs + n_nit_sot - n_mit_mot):
-                if ( store_steps[<unsigned int>(idx+n_mit_mot)] == 1 or
-                    vector_outs[<unsigned int>(idx+n_mit_mot)] == 1):
-                    output_storage[<unsigned int>(idx+offset)].storage[0] = None
-                else:
-                    output_storage[<unsigned int>(idx+offset)].storage[0] =\
-                        outs[<unsigned int>(idx+n_mit_mot)][0][pos[\
-                                            <unsigned int>(idx+n_mit_mot)]]
-        else:
-            for idx in range(n_outs + n_nit_sot - n_mit_mot):
+        for idx in range(n_outs + n_nit_sot - n_mit_mot):
+            jout = idx + n_mit_mot
+            # The buffers of the nit_sot outputs are only allocated after
+            # the first step, when their shape is known.
+            if ( store_steps[jout] == 1 or vector_outs[jout] == 1 or
+                (i == 0 and jout >= n_outs)):
                 output_storage[<unsigned int>(idx+offset)].storage[0] = None
+            else:
+                output_storage[<unsigned int>(idx+offset)].storage[0] =\
+                    outs[jout][0][pos[jout]]
 
         # 4.3. Collect slices for shared outputs
         offset += n_outs+n_nit_sot - n_mit_mot
@@ -456,6 +470,12 @@ def perform(
             pos[idx] = (pos[idx]+1)%store_steps[idx]
         i = i + 1
 
+    for idx in range(n_mit_mot, n_outs):
+        if last_state[idx] is not None:
+            last_state[idx][0] = outs[idx][0][(pos[idx] + 1) % 2]
+            outs[idx][0] = last_state[idx]
+            store_steps[idx] = 1
+            pos[idx] = 0
 
 
     # 6. Check if you need to re-order output buffers
@@ -754,6 +754,7 @@ def compress_outs(op, not_required, inputs):
     info['as_while'] = op.info['as_while']
     info['profile'] = op.info['profile']
     info['allow_gc'] = op.info['allow_gc']
+    info['batch_shards'] = op.info.get('batch_shards', 1)
 
     op_inputs = op.inputs[:op.n_seqs]
     op_outputs = []
@@ -884,6 +885,69 @@ def find_up(l_node, f_node):
     return f_node in nodes
 
 
+def mixes_batch_rows(inputs, outputs):
+    """
+    Return True if computing `outputs` may combine different rows of the
+    batch, the first dimension of `inputs`, or may move the batch away from
+    the first dimension of `outputs`.
+
+    The batch dimension is followed through Elemwise, DimShuffle and
+    CAReduce. The other ops are assumed to compute each row on its own when
+    the batch is the first dimension of their inputs of 2 dimensions or
+    more, except for the ops that index, reshape or join their inputs, and
+    the second input of Dot. This is a conservative check of the common
+    cases, not a proof that the rows are independent.
+
+    """
+    batch_axis = dict((v, 0) for v in inputs)
+    for node in gof.graph.io_toposort(inputs, outputs):
+        axes = [(i, batch_axis[v]) for i, v in enumerate(node.inputs)
+                if v in batch_axis]
+        if not axes:
+            continue
+        op = node.op
+        axis = axes[0][1]
+        if isinstance(op, tensor.Elemwise):
+            if len(set(a for i, a in axes)) > 1:
+                return True
+        elif isinstance(op, tensor.DimShuffle):
+            if axis not in op.new_order:
+                return True
+            axis = list(op.new_order).index(axis)
+        elif isinstance(op, tensor.CAReduce):
+            if op.axis is None or axis in op.axis:
+                return True
+            axis -= len([a for a in op.axis if a < axis])
+        elif isinstance(op, tensor.MaxAndArgmax):
+            reduced = node.inputs[1]
+            if (not isinstance(reduced, gof.Constant) or
+                    axis in numpy.atleast_1d(reduced.data)):
+                return True
+            axis -= len([a for a in numpy.atleast_1d(reduced.data)
+                         if a < axis])
+        elif isinstance(op, (tensor.Shape, theano.compile.ops.Shape_i)):
+            # The shape is not a row of the batch.
+            continue
+        elif (isinstance(op, (tensor.AdvancedSubtensor1,
+                              tensor.AdvancedSubtensor,
+                              tensor.AdvancedIncSubtensor1,
+                              tensor.AdvancedIncSubtensor,
+                              tensor.Reshape, tensor.Flatten,
+                              tensor.Join, tensor.Split)) or
+              any(a != 0 or node.inputs[i].ndim < 2 for i, a in axes)):
+            return True
+        elif isinstance(op, tensor.basic.Dot) and axes[-1][0] > 0:
+            return True
+        elif (isinstance(op, (tensor.Subtensor, tensor.IncSubtensor)) and
+                op.idx_list and op.idx_list[0] != slice(None)):
+            return True
+        for out in node.outputs:
+            if getattr(out, 'ndim', 0) == 0:
+                return True
+            batch_axis[out] = axis
+    return any(batch_axis.get(v, 0) != 0 for v in outputs)
+
+
 def reconstruct_graph(inputs, outputs, tag=None):
     """
     Different interface to clone, that allows you to pass inputs.
@@ -1025,7 +1089,8 @@ class scan_args(object):
 
         self.other_info = OrderedDict()
         for k in ('truncate_gradient', 'name', 'mode', 'destroy_map',
-                  'gpu', 'gpua', 'as_while', 'profile', 'allow_gc'):
+                  'gpu', 'gpua', 'as_while', 'profile', 'allow_gc',
+                  'batch_shards'):
             if k in info:
                 self.other_info[k] = info[k]
 
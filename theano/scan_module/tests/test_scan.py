@@ -2539,6 +2539,9 @@ class T_Scan(unittest.TestCase):
     def test_merge(self):
         x = theano.tensor.vector()
         y = theano.tensor.vector()
+        # Keep the scans in the graph.
+        mode = mode_with_opt.excluding('scanOp_pushout_seqs_ops',
+                                       'scanOp_vectorize_independent')
 
         def sum(s):
             return s + 1
@@ -2546,8 +2549,7 @@ class T_Scan(unittest.TestCase):
         sx, upx = theano.scan(sum, sequences=[x])
         sy, upy = theano.scan(sum, sequences=[y])
 
-        f = theano.function([x, y], [sx, sy],
-                            mode=mode_with_opt.excluding('scanOp_pushout_seqs_ops'))
+        f = theano.function([x, y], [sx, sy], mode=mode)
         topo = f.maker.fgraph.toposort()
         scans = [n for n in topo if isinstance(
             n.op, theano.scan_module.scan_op.Scan)]
@@ -2556,8 +2558,7 @@ class T_Scan(unittest.TestCase):
         sx, upx = theano.scan(sum, sequences=[x], n_steps=2)
         sy, upy = theano.scan(sum, sequences=[y], n_steps=3)
 
-        f = theano.function([x, y], [sx, sy],
-                            mode=mode_with_opt.excluding('scanOp_pushout_seqs_ops'))
+        f = theano.function([x, y], [sx, sy], mode=mode)
         topo = f.maker.fgraph.toposort()
         scans = [n for n in topo if isinstance(
             n.op, theano.scan_module.scan_op.Scan)]
@@ -2566,8 +2567,7 @@ class T_Scan(unittest.TestCase):
         sx, upx = theano.scan(sum, sequences=[x], n_steps=4)
         sy, upy = theano.scan(sum, sequences=[y], n_steps=4)
 
-        f = theano.function([x, y], [sx, sy],
-                            mode=mode_with_opt.excluding('scanOp_pushout_seqs_ops'))
+        f = theano.function([x, y], [sx, sy], mode=mode)
         topo = f.maker.fgraph.toposort()
         scans = [n for n in topo if isinstance(
             n.op, theano.scan_module.scan_op.Scan)]
@@ -2576,8 +2576,7 @@ class T_Scan(unittest.TestCase):
         sx, upx = theano.scan(sum, sequences=[x])
         sy, upy = theano.scan(sum, sequences=[x])
 
-        f = theano.function([x], [sx, sy],
-                            mode=mode_with_opt.excluding('scanOp_pushout_seqs_ops'))
+        f = theano.function([x], [sx, sy], mode=mode)
         topo = f.maker.fgraph.toposort()
         scans = [n for n in topo if isinstance(
             n.op, theano.scan_module.scan_op.Scan)]
@@ -2586,8 +2585,7 @@ class T_Scan(unittest.TestCase):
         sx, upx = theano.scan(sum, sequences=[x])
         sy, upy = theano.scan(sum, sequences=[x], mode='FAST_COMPILE')
 
-        f = theano.function([x], [sx, sy],
-                            mode=mode_with_opt.excluding('scanOp_pushout_seqs_ops'))
+        f = theano.function([x], [sx, sy], mode=mode)
         topo = f.maker.fgraph.toposort()
         scans = [n for n in topo if isinstance(
             n.op, theano.scan_module.scan_op.Scan)]
@@ -2596,8 +2594,7 @@ class T_Scan(unittest.TestCase):
         sx, upx = theano.scan(sum, sequences=[x])
         sy, upy = theano.scan(sum, sequences=[x], truncate_gradient=1)
 
-        f = theano.function([x], [sx, sy],
-                            mode=mode_with_opt.excluding('scanOp_pushout_seqs_ops'))
+        f = theano.function([x], [sx, sy], mode=mode)
         topo = f.maker.fgraph.toposort()
         scans = [n for n in topo if isinstance(
             n.op, theano.scan_module.scan_op.Scan)]
@@ -2621,7 +2618,8 @@ class T_Scan(unittest.TestCase):
 
         f = theano.function(
             [x, y], [sy, sz],
-            mode=mode_with_opt.excluding('scanOp_pushout_seqs_ops'))
+            mode=mode_with_opt.excluding('scanOp_pushout_seqs_ops',
+                                         'scanOp_vectorize_independent'))
         topo = f.maker.fgraph.toposort()
         scans = [n for n in topo if isinstance(
             n.op, theano.scan_module.scan_op.Scan)]
@@ -5298,3 +5296,162 @@ def test_constant_folding_n_steps():
         theano.function([], res)()
     finally:
         theano.config.on_opt_error = on_opt_error
+
+
+@theano.configparser.change_flags(**{'scan.c_inner_function': True})
+def test_c_inner_function():
+    if not theano.config.cxx:
+        raise SkipTest("Need cxx for the C linker")
+    x = tensor.matrix('x')
+    w = tensor.matrix('w')
+    h0 = tensor.vector('h0')
+    hs, _ = theano.scan(lambda x_t, h, w: tensor.tanh(x_t + tensor.dot(h, w)),
+                        sequences=x, outputs_info=h0, non_sequences=w)
+    f = theano.function([x, w, h0], hs)
+    scan_nodes = [n for n in f.maker.fgraph.toposort()
+                  if isinstance(n.op, Scan)]
+    assert len(scan_nodes) == 1
+
+    rng = numpy.random.RandomState(utt.fetch_seed())
+    vx = rng.uniform(size=(5, 3)).astype(theano.config.floatX)
+    vw = rng.uniform(size=(3, 3)).astype(theano.config.floatX)
+    vh0 = rng.uniform(size=(3,)).astype(theano.config.floatX)
+    expected = []
+    h = vh0
+    for x_t in vx:
+        h = numpy.tanh(x_t + numpy.dot(h, vw))
+        expected.append(h)
+    utt.assert_allclose(f(vx, vw, vh0), numpy.asarray(expected))
+    # The whole inner graph is run by one C thunk.
+    assert isinstance(scan_nodes[0].op.fn.fn, theano.gof.cc._CThunk)
+
+
+def test_last_state_only():
+    # When only the last state is kept, scan gives its buffer a second row
+    # for the inner function to write to, and moves the last state back.
+    x = tensor.matrix('x')
+    w = tensor.matrix('w')
+    h0 = tensor.vector('h0')
+
+    def step(x_t, h, w):
+        h_t = tensor.tanh(x_t + tensor.dot(h, w))
+        return h_t, theano.scan_module.until(h_t.sum() > 1e5)
+
+    hs, _ = theano.scan(lambda x_t, h, w: tensor.tanh(x_t + tensor.dot(h, w)),
+                        sequences=x, outputs_info=h0, non_sequences=w)
+    hs_while, _ = theano.scan(step, sequences=x, outputs_info=h0,
+                              non_sequences=w)
+    f = theano.function([x, w, h0], [hs[-1], hs_while[-1]])
+
+    rng = numpy.random.RandomState(utt.fetch_seed())
+    vw = rng.uniform(size=(3, 3)).astype(theano.config.floatX)
+    vh0 = rng.uniform(size=(3,)).astype(theano.config.floatX)
+    results = []
+    for n_steps in [1, 2, 5]:
+        vx = rng.uniform(size=(n_steps, 3)).astype(theano.config.floatX)
+        h = vh0
+        for x_t in vx:
+            h = numpy.tanh(x_t + numpy.dot(h, vw))
+        last, last_while = f(vx, vw, vh0)
+        utt.assert_allclose(last, h)
+        utt.assert_allclose(last_while, h)
+        results.append((last.copy(), last))
+    # The outputs of a call are not overwritten by the next ones.
+    for expected, last in results:
+        utt.assert_allclose(last, expected)
+
+
+def test_batch_shards():
+    x = tensor.tensor3('x')
+    w = tensor.matrix('w')
+    h0 = tensor.matrix('h0')
+
+    def step(x_t, h, w):
+        h_t = tensor.tanh(x_t + tensor.dot(h, w))
+        return h_t, h_t.sum(axis=1)
+
+    outputs = []
+    for batch_shards in [1, 3]:
+        (hs, sums), _ = theano.scan(step, sequences=x, outputs_info=[h0, None],
+                                    non_sequences=w,
+                                    batch_shards=batch_shards)
+        outputs += [hs, sums]
+    f = theano.function([x, w, h0], outputs)
+    scan_nodes = [n for n in f.maker.fgraph.toposort()
+                  if isinstance(n.op, Scan)]
+    assert sorted(n.op.batch_shards for n in scan_nodes) == [1, 3]
+    assert all(n.op.can_split_batch(n) for n in scan_nodes)
+
+    rng = numpy.random.RandomState(utt.fetch_seed())
+    vw = rng.uniform(size=(4, 4)).astype(theano.config.floatX)
+    # The second call writes into the outputs of the first one. With 2
+    # rows, there are fewer rows than shards.
+    for batch_size in [7, 7, 2]:
+        vx = rng.uniform(size=(5, batch_size, 4)).astype(theano.config.floatX)
+        vh0 = rng.uniform(size=(batch_size, 4)).astype(theano.config.floatX)
+        hs, sums, hs_sharded, sums_sharded = f(vx, vw, vh0)
+        assert hs_sharded.shape == (5, batch_size, 4)
+        utt.assert_allclose(hs_sharded, hs)
+        utt.assert_allclose(sums_sharded, sums)
+
+
+def test_batch_shards_mixed_rows():
+    # Steps combining the rows of the batch are not split.
+    x = tensor.tensor3('x')
+    h0 = tensor.matrix('h0')
+
+    def reduce_step(x_t, h):
+        return h + x_t.sum()
+
+    def transpose_step(x_t, h):
+        return h + tensor.dot(x_t.T, h).T
+
+    def index_step(x_t, h):
+        return h + x_t[0]
+
+    for step in [reduce_step, transpose_step, index_step]:
+        hs, _ = theano.scan(step, sequences=x, outputs_info=h0,
+                            batch_shards=3)
+        hs_ref, _ = theano.scan(step, sequences=x, outputs_info=h0)
+        f = theano.function([x, h0], [hs, hs_ref])
+        scan_nodes = [n for n in f.maker.fgraph.toposort()
+                      if isinstance(n.op, Scan) and n.op.batch_shards == 3]
+        assert len(scan_nodes) == 1
+        assert not scan_nodes[0].op.can_split_batch(scan_nodes[0])
+
+        rng = numpy.random.RandomState(utt.fetch_seed())
+        vx = rng.uniform(size=(5, 6, 6)).astype(theano.config.floatX)
+        vh0 = rng.uniform(size=(6, 6)).astype(theano.config.floatX)
+        out, ref = f(vx, vh0)
+        utt.assert_allclose(out, ref)
+
+
+def test_scan_checkpoints():
+    x = tensor.matrix('x')
+    w = tensor.matrix('w')
+    h0 = tensor.vector('h0')
+
+    def step(x_t, h, w):
+        h_t = tensor.tanh(x_t + tensor.dot(h, w))
+        return h_t, h_t.sum()
+
+    (hs, sums), _ = theano.scan(step, sequences=x,
+                                outputs_info=[h0, None], non_sequences=w)
+    expected = theano.function(
+        [x, w, h0], [hs[-1], sums] + tensor.grad(hs[-1].sum(), [x, w, h0]))
+
+    rng = numpy.random.RandomState(utt.fetch_seed())
+    vx = rng.uniform(size=(10, 3)).astype(theano.config.floatX)
+    vw = rng.uniform(size=(3, 3)).astype(theano.config.floatX)
+    vh0 = rng.uniform(size=(3,)).astype(theano.config.floatX)
+    values = expected(vx, vw, vh0)
+
+    for save_every_N in [None, 3, 5, 20]:
+        (ckpts, ck_sums), _ = theano.scan_checkpoints(
+            step, sequences=x, outputs_info=[h0, None], non_sequences=w,
+            save_every_N=save_every_N)
+        f = theano.function(
+            [x, w, h0],
+            [ckpts[-1], ck_sums] + tensor.grad(ckpts[-1].sum(), [x, w, h0]))
+        for v, e in zip(f(vx, vw, vh0), values):
+            utt.assert_allclose(v, e)
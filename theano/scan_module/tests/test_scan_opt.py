@@ -201,7 +201,8 @@ class TestPushOutScanOutputDot(object):
 
         # Compile the function twice, once with the optimization and once
         # without
-        opt_mode = mode.including("scan")
+        opt_mode = mode.including("scan").excluding(
+            "scanOp_vectorize_independent")
         f_opt = theano.function([a, b], outputs, mode=opt_mode)
 
         no_opt_mode = mode.excluding("scanOp_pushout_output")
@@ -418,3 +419,46 @@ class TestPushOutSumOfDot():
         output_no_opt = f_no_opt(input1_value, input2_value, input3_value)
 
         utt.assert_allclose(output_opt, output_no_opt)
+
+
+class TestVectorizeIndependentScan(object):
+    """
+    Test the vectorize_independent_scan optimization, which removes the
+    scans whose steps do not depend on each other.
+    """
+
+    def test_vectorize(self):
+        x = T.matrix()
+        W = T.matrix()
+        b = T.vector()
+
+        def inner_fct(x_t, W, b):
+            h_t = T.tanh(T.dot(x_t, W) + b)
+            return h_t, (h_t ** 2).sum(), T.dot(W, x_t)
+
+        outputs, _ = theano.scan(inner_fct, sequences=x,
+                                 non_sequences=[W, b])
+        f_opt = theano.function([x, W, b], outputs,
+                                mode=mode.including("scan"))
+        f_no_opt = theano.function(
+            [x, W, b], outputs,
+            mode=mode.excluding("scanOp_vectorize_independent"))
+
+        assert not any(isinstance(node.op, Scan)
+                       for node in f_opt.maker.fgraph.toposort())
+
+        x_value = numpy.random.random((4, 3)).astype(config.floatX)
+        W_value = numpy.random.random((3, 3)).astype(config.floatX)
+        b_value = numpy.random.random((3,)).astype(config.floatX)
+        for o_opt, o_no_opt in zip(f_opt(x_value, W_value, b_value),
+                                   f_no_opt(x_value, W_value, b_value)):
+            utt.assert_allclose(o_opt, o_no_opt)
+
+    def test_recurrent_not_vectorized(self):
+        x = T.matrix()
+        h0 = T.vector()
+        outputs, _ = theano.scan(lambda x_t, h: x_t + h, sequences=x,
+                                 outputs_info=h0)
+        f = theano.function([x, h0], outputs, mode=mode.including("scan"))
+        assert any(isinstance(node.op, Scan)
+                   for node in f.maker.fgraph.toposort())